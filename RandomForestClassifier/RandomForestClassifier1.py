@@ -6,7 +6,7 @@
 - 切分：严格按日期先后切分，防止未来泄露
 - 预测：对最新交易日的所有股票给出上涨概率
 """
-import sqlite3
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -16,6 +16,13 @@ from sklearn.model_selection import train_test_split
 from sklearn.utils import shuffle
 import joblib
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.partition import routed
+from database.columnar import read_frame, LABEL_DTYPES
+from database import signal_freq
+from feature.pivot import join_rows, filter_min_df
+from feature import store
+
 # ===================== 配置 =====================
 DB_PATH = r"../stock.db"   # ←← 修改为你的 SQLite 文件路径
 MODEL_PATH = r"../train/rf_model_stock.pkl"
@@ -26,96 +33,66 @@ random_state = 42
 # ============== 工具函数：加载并构造特征/标签 ==============
 def load_feature_label(conn, use_min_df=True):
     """
-    从 SQLite 读取 t_stock_signal + t_stock_label_1，构造训练用宽表
+    从 SQLite 读取 t_stock_signal + t_stock_label_1，构造训练用稀疏特征矩阵
     返回：
-        X_df: 特征 DataFrame（含 trade_date, stock_code 作为索引列）
-        y_df: 标签 DataFrame（trade_date, stock_code, label）
+        X: 特征 CSR 矩阵（行按 trade_date, stock_code 升序）
+        keys: 行键 DataFrame（trade_date, stock_code）
+        y: 标签数组
+        feature_cols: 特征列名
     """
     # 1) 读取标签（视图已定义）
-    y_df = pd.read_sql_query(
+    y_df = read_frame(
+        conn,
         """
         SELECT trade_date, stock_code, label
         FROM t_stock_label_1
         """,
-        conn
+        dtypes=LABEL_DTYPES
     )
 
-    # 2) 读取信号明细
-    sig_df = pd.read_sql_query(
-        """
-        SELECT trade_date, stock_code, signal_name, signal_value
-        FROM t_stock_signal
-        """,
-        conn
-    )
+    # 2) 信号矩阵：每个 (trade_date, stock_code) 一行，每种 signal_name 一列（CSR）
+    #    值为 signal_value（默认=1），缺失即 0；同一键下同名 signal 多条取 max
+    #    按交易日分区缓存在特征仓库，只有新增 / 变化的交易日需要重新透视
+    #    列选择优先查频次统计表 t_signal_freq（min_df 过滤 + 保底前 100 列），只读选中的列
+    sel = signal_freq.select_cols(conn, "signal", min_df if use_min_df else 1, fallback_top=100)
+    X, dates, codes, feature_cols = store.load(conn, "signal", cols=sel)
 
-    if sig_df.empty or y_df.empty:
+    if X.shape[0] == 0 or y_df.empty:
         raise RuntimeError("信号表或标签视图为空，请检查数据准备。")
 
-    # 3) 透视：每个 (trade_date, stock_code) 一行，每种 signal_name 一列
-    #    值为 signal_value（默认=1），缺失补 0
-    #    若同一键下同名 signal 多条，求和或取最大都可；这里用 max 防重复
-    wide = (
-        sig_df.pivot_table(
-            index=["trade_date", "stock_code"],
-            columns="signal_name",
-            values="signal_value",
-            aggfunc="max",
-            fill_value=0.0,
-        )
-        .reset_index()
-    )
+    # 3) 没有可用统计时：按列非零数过滤低频信号列以降维；若全部被过滤，保底保留最多的前 100 列
+    if sel is None:
+        X, feature_cols = filter_min_df(X, feature_cols, min_df if use_min_df else 1, fallback_top=100)
 
-    # 4) 可选：按列统计出现次数（>0 视为出现），过滤低频信号列以降维
-    if use_min_df:
-        # 出现过（>0）的样本计数
-        appear_counts = (wide.drop(columns=["trade_date", "stock_code"]) > 0).sum(axis=0)
-        keep_cols = appear_counts[appear_counts >= min_df].index.tolist()
-        # 如果全部被过滤，为防止空特征，这里保底保留最多的前 100 列
-        if len(keep_cols) == 0:
-            keep_cols = appear_counts.sort_values(ascending=False).head(100).index.tolist()
-        wide = pd.concat(
-            [wide[["trade_date", "stock_code"]], wide[keep_cols]],
-            axis=1
-        )
-
-    # 5) 关联标签
-    df = pd.merge(
-        wide,
-        y_df,
-        on=["trade_date", "stock_code"],
-        how="inner",
-        validate="one_to_one",
-    )
+    # 4) 关联标签（inner，按行键一对一）
+    lab = join_rows(dates, codes, y_df)
+    X = X[lab["_row"].values]
 
-    # 6) 输出特征与标签
-    feature_cols = [c for c in df.columns if c not in ("trade_date", "stock_code", "label")]
-    X_df = df[["trade_date", "stock_code"] + feature_cols].copy()
-    y = df["label"].astype(int).copy()
+    # 5) 输出特征与标签
+    keys = lab[["trade_date", "stock_code"]].reset_index(drop=True)
+    y = lab["label"].astype(int).values
 
-    return X_df, y, feature_cols
+    return X, keys, y, feature_cols
 
 
-def temporal_train_test_split(X_df, y, test_ratio=0.3):
+def temporal_train_test_split(X, keys, y, test_ratio=0.3):
     """
     按日期划分训练/测试集（时间先后），避免未来信息泄露
+    X 的行已按 trade_date 升序，两段都是原矩阵的行切片
     """
-    # 按日期排序
-    X_df = X_df.sort_values("trade_date").reset_index(drop=True)
-    y = y.loc[X_df.index]  # 对齐
-
     # 找到分割点
-    dates = X_df["trade_date"].unique()
+    row_dates = keys["trade_date"].values
+    dates = np.unique(row_dates)
     split_idx = int(len(dates) * (1 - test_ratio))
     split_date = dates[split_idx] if split_idx < len(dates) else dates[-1]
 
-    train_mask = X_df["trade_date"] < split_date
-    test_mask = X_df["trade_date"] >= split_date
+    train_mask = row_dates < split_date
+    test_mask = row_dates >= split_date
 
-    X_train = X_df.loc[train_mask].drop(columns=["trade_date", "stock_code"]).values
-    X_test  = X_df.loc[test_mask ].drop(columns=["trade_date", "stock_code"]).values
-    y_train = y.loc[train_mask].values
-    y_test  = y.loc[test_mask ].values
+    X_train = X[train_mask]
+    X_test  = X[test_mask]
+    y_train = y[train_mask]
+    y_test  = y[test_mask]
 
     return X_train, X_test, y_train, y_test, split_date
 
@@ -123,10 +100,10 @@ def temporal_train_test_split(X_df, y, test_ratio=0.3):
 # ============== 训练、评估与保存模型 ==============
 def train_and_eval(conn):
     # 1) 加载数据
-    X_df, y, feature_cols = load_feature_label(conn, use_min_df=True)
+    X, keys, y, feature_cols = load_feature_label(conn, use_min_df=True)
 
     # 2) 时间切分
-    X_train, X_test, y_train, y_test, split_date = temporal_train_test_split(X_df, y, test_ratio=0.30)
+    X_train, X_test, y_train, y_test, split_date = temporal_train_test_split(X, keys, y, test_ratio=0.30)
 
     # 3) 训练模型（类别不平衡时可 balanced）
     clf = RandomForestClassifier(
@@ -173,39 +150,14 @@ def predict_latest_day(conn, clf, feature_cols):
     )
     latest_dt = int(latest_row.iloc[0, 0])
 
-    # 取该日全部信号
-    sig_df = pd.read_sql_query(
-        """
-        SELECT trade_date, stock_code, signal_name, signal_value
-        FROM t_stock_signal
-        WHERE trade_date = ?
-        """,
-        conn,
-        params=(latest_dt,)
-    )
-    if sig_df.empty:
+    # 取该日信号矩阵，按训练列空间输出（缺失的为 0；多余的忽略；列顺序与训练一致）
+    X_new, dates, codes, _ = store.load(conn, "signal", start=latest_dt, end=latest_dt, cols=feature_cols)
+    if X_new.shape[0] == 0:
         print("最新交易日无信号，无法预测。")
         return None
-
-    # 透视为宽表
-    wide = sig_df.pivot_table(
-        index=["trade_date", "stock_code"],
-        columns="signal_name",
-        values="signal_value",
-        aggfunc="max",
-        fill_value=0.0,
-    ).reset_index()
-
-    # 只保留训练中用到的列（缺失的补 0；多余的忽略）
-    # 确保列顺序与训练一致
-    for col in feature_cols:
-        if col not in wide.columns:
-            wide[col] = 0.0
-
-    X_new = wide[feature_cols].values
     proba = clf.predict_proba(X_new)[:, 1]
 
-    out = wide[["trade_date", "stock_code"]].copy()
+    out = pd.DataFrame({"trade_date": dates, "stock_code": codes})
     out["pred_up_prob"] = proba
     out = out.sort_values("pred_up_prob", ascending=False).reset_index(drop=True)
 
@@ -217,17 +169,10 @@ def predict_latest_day(conn, clf, feature_cols):
 
 # ===================== 主流程 =====================
 if __name__ == "__main__":
-    # 建议 SQLite 打开 WAL，且 synchronous=NORMAL 已在你的 schema 中设置
     if not Path(DB_PATH).exists():
         raise FileNotFoundError(f"未找到数据库文件：{DB_PATH}")
 
-    with sqlite3.connect(DB_PATH) as conn:
-        # 提升读取性能
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
-        conn.execute("PRAGMA temp_store=MEMORY;")
-        conn.execute("PRAGMA mmap_size=30000000000;")  # 可按机器内存调整（30GB 示例）
-        conn.execute("PRAGMA cache_size=-500000;")      # 负数=KB，约 500MB 缓存
-
+    # 只读连接已带 mmap / 大缓存 / query_only，并按年份挂载 history/ 冷库（见 database/db.py、database/partition.py）
+    with routed(db_path=DB_PATH) as conn:
         clf, feature_cols = train_and_eval(conn)
         _ = predict_latest_day(conn, clf, feature_cols)
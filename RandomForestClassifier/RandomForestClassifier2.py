@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import sqlite3
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -10,11 +10,21 @@ from sklearn.metrics import roc_auc_score, average_precision_score  # === NEW
 import joblib
 import datetime
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.partition import routed
+from database.columnar import read_frame, LABEL_DTYPES, SIGNAL_DTYPES
+from database import signal_freq
+from feature.pivot import pivot_frame, join_rows, filter_min_df
+from feature import store
+from feature import design
+
 DB_PATH = r"../stock.db"   # ←← 修改为你的 SQLite 文件路径
 MODEL_PATH = r"../train/rf_model_stock.pkl"
 TOPN_PREDICT = 50
 min_df = 10
 random_state = 42
+# 设计矩阵落盘目录（是否落盘 / 格式见 feature.design 的 USE_MMAP / MMAP_FORMAT）
+MMAP_PATH = design.path_for("rf2")
 
 def log(msg: str):
     """统一日志输出，带时间戳"""
@@ -22,52 +32,40 @@ def log(msg: str):
 
 def load_feature_label(conn, use_min_df=True):
     log("开始加载标签数据 t_stock_label_1 ...")
-    y_df = pd.read_sql_query("SELECT trade_date, stock_code, label FROM t_stock_label_1", conn)
+    y_df = read_frame(conn, "SELECT trade_date, stock_code, label FROM t_stock_label_1", dtypes=LABEL_DTYPES)
     log(f"标签数据加载完成，共 {len(y_df)} 条，交易日数={y_df['trade_date'].nunique()}")
 
-    log("开始加载信号数据 t_stock_signal ...")
-    sig_df = pd.read_sql_query(
-        "SELECT trade_date, stock_code, signal_name, signal_value FROM t_stock_signal", conn
-    )
-    log(f"信号数据加载完成，共 {len(sig_df)} 条，信号种类={sig_df['signal_name'].nunique()}")
+    log("开始加载信号矩阵（特征仓库，按交易日分区缓存） ...")
+    # 列选择与 TOP 日志优先查频次统计表 t_signal_freq，只读选中的列
+    sel = signal_freq.select_cols(conn, "signal", min_df if use_min_df else 1, fallback_top=50)
+    if design.USE_MMAP:
+        return stream_feature_label(conn, y_df, sel, use_min_df)
+    X, dates, codes, feature_cols = store.load(conn, "signal", cols=sel)
+    log(f"信号矩阵加载完成，共 {X.nnz} 个非零，信号种类={len(feature_cols)}")
 
     # === NEW: 训练期最常见信号TOP（排查命名是否一致）
-    if not sig_df.empty:  # === NEW
-        top_sig_train = (sig_df.groupby("signal_name")["signal_value"]
-                               .size().sort_values(ascending=False).head(20))  # === NEW
+    top_sig_train = signal_freq.top(conn, "signal", 20)
+    if top_sig_train is None and X.nnz:  # === NEW
+        top_sig_train = (pd.Series(X.getnnz(axis=0), index=feature_cols, name="signal_value")
+                           .sort_values(ascending=False).head(20))  # === NEW
+    if top_sig_train is not None:
         log("训练期最常见信号TOP-20：")  # === NEW
         print(top_sig_train)  # === NEW
 
-    log("开始透视信号表构造特征矩阵 ...")
-    wide = (
-        sig_df.pivot_table(
-            index=["trade_date", "stock_code"],
-            columns="signal_name",
-            values="signal_value",
-            aggfunc="max",
-            fill_value=0.0,
-        )
-        .reset_index()
-    )
-    log(f"透视完成，特征列数={wide.shape[1]-2}")
-
-    if use_min_df:
-        appear_counts = (wide.drop(columns=["trade_date", "stock_code"]) > 0).sum(axis=0)
-        keep_cols = appear_counts[appear_counts >= min_df].index.tolist()
-        if len(keep_cols) == 0:
-            keep_cols = appear_counts.sort_values(ascending=False).head(50).index.tolist()
-        wide = pd.concat([wide[["trade_date", "stock_code"]], wide[keep_cols]], axis=1)
-        log(f"低频信号过滤完成，保留特征数={len(keep_cols)}")
+    # 没有可用统计时：低频信号按列非零数过滤；全部被过滤时保底保留最多的前 50 列
+    if sel is None:
+        X, feature_cols = filter_min_df(X, feature_cols, min_df if use_min_df else 1, fallback_top=50)
+    log(f"低频信号过滤完成，特征列数={len(feature_cols)}，非零元素={X.nnz}")
 
     log("开始合并标签 ...")
-    df = pd.merge(wide, y_df, on=["trade_date", "stock_code"], how="inner")
+    df = join_rows(dates, codes, y_df)
+    X = X[df["_row"].values]
+    df = df.drop(columns="_row")
     log(f"合并完成，总样本={len(df)}")
 
     # === NEW: 打印“非零特征覆盖率”（训练数据整体）
-    feature_cols = [c for c in df.columns if c not in ("trade_date", "stock_code", "label")]
     if len(feature_cols) > 0:  # === NEW
-        feat_only = df[feature_cols].values  # === NEW
-        nz = (feat_only != 0).sum(axis=1)  # === NEW
+        nz = X.getnnz(axis=1)  # === NEW
         log("[训练集] 非零特征数分布：")  # === NEW
         log(f"  P50={np.percentile(nz,50)}, P90={np.percentile(nz,90)}, max={nz.max()}")  # === NEW
         log(f"  全零样本比例={(nz==0).mean():.2%}")  # === NEW
@@ -78,26 +76,42 @@ def load_feature_label(conn, use_min_df=True):
     pos_rate = float(df["label"].mean()) if len(df) else 0.0  # === NEW
     log(f"标签正例占比={pos_rate:.4f}（全预测为1的基线acc≈{pos_rate:.4f}）")  # === NEW
 
-    return df, feature_cols
-
-def temporal_split(df, test_ratio=0.3):
-    dates = sorted(df["trade_date"].unique())
+    return X, df, feature_cols
+
+def stream_feature_label(conn, y_df, sel, use_min_df=True):
+    """design.USE_MMAP：特征仓库逐日分区关联标签后直接写入磁盘设计矩阵，不在内存中拼出整段 X"""
+    if sel is None:
+        sel = store.select_min_df(conn, "signal", min_df if use_min_df else 1, fallback_top=50)
+    feature_cols, days = store.iter_days(conn, "signal", cols=sel)
+    dm, df = design.write_days(MMAP_PATH, days, len(feature_cols), labels=y_df)
+    log(f"信号矩阵逐日写入 {MMAP_PATH}：样本={len(df)}，特征列数={len(feature_cols)}，"
+        f"正例占比={float(df['label'].mean()) if len(df) else 0.0:.4f}")
+    return dm, df, feature_cols
+
+def temporal_split(X, df, test_ratio=0.3):
+    """df 为与 X 行对齐的 (trade_date, stock_code, label)，按日期切分稀疏矩阵的行"""
+    row_dates = df["trade_date"].values
+    dates = np.unique(row_dates)
     split_idx = int(len(dates) * (1 - test_ratio))
     split_date = dates[split_idx]
-
-    train = df[df["trade_date"] < split_date]
-    test  = df[df["trade_date"] >= split_date]
-    log(f"时间切分完成：训练集={len(train)}，测试集={len(test)}，切分点={split_date}")
-
-    X_train = train.drop(columns=["trade_date", "stock_code", "label"]).values
-    y_train = train["label"].values
-    X_test = test.drop(columns=["trade_date", "stock_code", "label"]).values
-    y_test = test["label"].values
+    y = df["label"].values
+
+    if isinstance(X, design.DesignMatrix):
+        # 行已按日期升序写盘：训练 / 测试是连续行区间上的视图
+        X_train, X_test = X.split(split_date)
+        k = X_train.shape[0]
+        y_train, y_test = y[:k], y[k:]
+    else:
+        train_mask = row_dates < split_date
+        X_train, y_train = X[train_mask], y[train_mask]
+        X_test, y_test = X[~train_mask], y[~train_mask]
+    log(f"时间切分完成：训练集={X_train.shape[0]}，测试集={X_test.shape[0]}，切分点={split_date}")
     return X_train, y_train, X_test, y_test, split_date
 
 def train_and_eval(conn):
-    df, feature_cols = load_feature_label(conn)
-    X_train, y_train, X_test, y_test, split_date = temporal_split(df)
+    X, df, feature_cols = load_feature_label(conn)
+    X_train, y_train, X_test, y_test, split_date = temporal_split(X, df)
+    del X  # 之后只用切分结果（design.USE_MMAP 时为磁盘视图）
 
     log("开始训练随机森林模型 ...")
     clf = RandomForestClassifier(
@@ -136,9 +150,9 @@ def predict_latest_day(conn, clf, feature_cols):
     latest_dt = conn.execute("SELECT MAX(trade_date) FROM t_stock_signal").fetchone()[0]
     log(f"最新交易日={latest_dt}")
 
-    sig_df = pd.read_sql_query(
-        "SELECT trade_date, stock_code, signal_name, signal_value FROM t_stock_signal WHERE trade_date=?",
-        conn, params=(latest_dt,)
+    sig_df = read_frame(
+        conn, "SELECT trade_date, stock_code, signal_name, signal_value FROM t_stock_signal WHERE trade_date=?",
+        params=(latest_dt,), dtypes=SIGNAL_DTYPES
     )
     log(f"当天信号数={len(sig_df)}")
 
@@ -149,27 +163,17 @@ def predict_latest_day(conn, clf, feature_cols):
         log("当日最常见信号TOP-20：")  # === NEW
         print(top_sig_pred)  # === NEW
 
-    wide = sig_df.pivot_table(
-        index=["trade_date", "stock_code"],
-        columns="signal_name",
-        values="signal_value",
-        aggfunc="max",
-        fill_value=0.0,
-    ).reset_index()
+    # 直接按训练列空间透视（缺失列为 0，训练中没有的信号丢弃）
+    X_new, dates, codes, _ = pivot_frame(sig_df, "signal_name", "signal_value", cols=feature_cols)
 
     # === NEW: （可选）过滤指数/板块代码，避免干扰；按需开启
-    # idx_mask = ~wide["stock_code"].astype(str).str.startswith(("88", "89"))  # === NEW（可选）
-    # wide = wide.loc[idx_mask].copy()  # === NEW（可选）
-    # log(f"过滤指数后，当日标的数={len(wide)}")  # === NEW（可选）
-
-    for col in feature_cols:
-        if col not in wide.columns:
-            wide[col] = 0.0
-    X_new = wide[feature_cols].values
+    # idx_mask = ~pd.Series(codes).astype(str).str.startswith(("88", "89")).values  # === NEW（可选）
+    # X_new, dates, codes = X_new[idx_mask], dates[idx_mask], codes[idx_mask]  # === NEW（可选）
+    # log(f"过滤指数后，当日标的数={len(codes)}")  # === NEW（可选）
 
     # === NEW: 打印“非零特征覆盖率”（预测当日）
-    nz_day = (X_new != 0).sum(axis=1)  # === NEW
-    log(f"[预测集] 当日标的数={len(wide)}")  # === NEW
+    nz_day = X_new.getnnz(axis=1)  # === NEW
+    log(f"[预测集] 当日标的数={len(codes)}")  # === NEW
     if len(nz_day) > 0:  # === NEW
         log(f"  P50={np.percentile(nz_day,50)}, P90={np.percentile(nz_day,90)}, max={nz_day.max()}")  # === NEW
         log(f"  全零样本比例={(nz_day==0).mean():.2%}")  # === NEW
@@ -179,7 +183,7 @@ def predict_latest_day(conn, clf, feature_cols):
 
     log("开始预测最新交易日 ...")
     proba = clf.predict_proba(X_new)[:, 1]
-    out = wide[["trade_date", "stock_code"]].copy()
+    out = pd.DataFrame({"trade_date": dates, "stock_code": codes})
     out["pred_up_prob"] = proba
     out = out.sort_values("pred_up_prob", ascending=False).reset_index(drop=True)
     print(out.head(TOPN_PREDICT))
@@ -188,6 +192,6 @@ if __name__ == "__main__":
     if not Path(DB_PATH).exists():
         raise FileNotFoundError(f"数据库文件不存在：{DB_PATH}")
 
-    with sqlite3.connect(DB_PATH) as conn:
+    with routed(db_path=DB_PATH) as conn:
         clf, feature_cols = train_and_eval(conn)
         predict_latest_day(conn, clf, feature_cols)
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
-import sqlite3
+import sys
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from pathlib import Path
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, accuracy_score, roc_auc_score, \
@@ -13,14 +14,49 @@ from sklearn.metrics import precision_recall_curve
 # === NEW:
 import json, hashlib
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import writer
+from database.partition import routed
+from database.columnar import read_frame, LABEL_DTYPES
+from database import signal_freq
+from feature.pivot import pivot_frame, join_rows, align_rows, filter_min_df
+from feature import store
+from feature import design
+from feature.pit import PointInTime
+from feature.space import FeatureSpace
+from model.forest_pool import ForestPool, split_windows
+from model import sampling
+from model import compact
+
 DB_PATH = r"../stock.db"  # ←← 修改为你的 SQLite 文件路径
 MODEL_PATH = r"../train/rf_model_stock.pkl"
 TOPN_PREDICT = 50
 min_df = 10
 random_state = 42
+# 设计矩阵落盘目录（是否落盘 / 格式见 feature.design 的 USE_MMAP / MMAP_FORMAT）
+MMAP_PATH = design.path_for("rf3")
+RF_PARAMS = dict(n_estimators=500, max_depth=None, min_samples_split=4,
+                 n_jobs=-1, random_state=random_state, class_weight="balanced_subsample")
+# 滚动增量重训（model.forest_pool）：树池按月分批，列空间固定为树池的列空间（不再每次按 min_df 重选）；
+# 每次只重训训练集末月（及之后）的批次，滑出 ROLLING_LOOKBACK_M 个月的批次淘汰。需要更新列空间时删除 POOL_PATH 重建
+ROLLING = False
+POOL_PATH = r"../train/rf3_pool.joblib"
+TREES_PER_WINDOW = 25
+ROLLING_LOOKBACK_M = 24
+# 负例按日降采样（model.sampling）：每个交易日保留全部正例、NEG_RATE 比例的负例，只作用于训练集（测试集全量评估）
+# NEG_WEIGHTING="weight"：负例权重 1/NEG_RATE，概率直接可用；"none"：不加权，评估 / 预测时按 t_model_meta 中的采样方案还原概率
+NEG_RATE = 1.0          # 1.0 = 不采样
+NEG_WEIGHTING = "weight"
+# 森林压缩（model.compact）："prune" / "subset" / "distill"，None 不压缩；训练窗口末尾 compact.HOLDOUT_FRAC 的交易日
+# 不参与森林训练，用来选择压缩参数，压缩前后的指标差值在测试窗口上度量；
+# 压缩模型存为 rf_model_stock.compact.pkl（报告另存 .compact.json），当日预测使用压缩模型
+COMPACT = None
 
 # === NEW: 使用 t_stock_feat 对应的基础列（不再用 t_stock_daily 那些绝对量价）
 FEAT_BASE_COLS = ["turnover", "amplitude", "pct_chg"]  # === NEW
+# t_stock_feat 量价特征集（feature.store，feature.panel 向量化生成）："lag1" 只含上一行；"price_roll" 另加滚动 / EMA
+# 预测时需与训练时一致
+PRICE_SET = "lag1"
 
 
 # === NEW: 序列化成稳定 JSON
@@ -115,190 +151,241 @@ def daily_precision_at_k(test_df, k=20):
     # 所有测试日的平均命中率
     return float(by_day.mean())
 
-# === NEW: 通用透视函数，把长表(信号)变宽表，并可加前缀
+# === NEW: 通用透视函数，把长表(信号)变稀疏矩阵，并可加前缀
 def pivot_signals(df_long: pd.DataFrame,
                   name_col: str = "signal_name",
                   value_col: str = "signal_value",
                   prefix: str = "s_",
                   use_min_df: bool = False,
-                  min_df: int = 10) -> pd.DataFrame:
+                  min_df: int = 10,
+                  cols=None):
     """
     输入形如: [trade_date, stock_code, signal_name, signal_value]
-    输出形如: [trade_date, stock_code, s_信号A, s_信号B, ...]
+    输出: (X, row_dates, row_codes, col_names)，X 为 CSR，列名形如 s_信号A, s_信号B, ...
+    cols 给定时（带前缀的列名）按该列空间输出，缺失列为 0，多余信号丢弃
     """
-    if df_long is None or df_long.empty:
-        return pd.DataFrame(columns=["trade_date", "stock_code"])
-
-    wide = (df_long.pivot_table(
-                index=["trade_date", "stock_code"],
-                columns=name_col,
-                values=value_col,
-                aggfunc="max",
-                fill_value=0.0)
-            .reset_index())
-
-    cols = [c for c in wide.columns if c not in ("trade_date", "stock_code")]
-
-    if use_min_df and cols:
-        appear_counts = (wide[cols] > 0).sum(axis=0)
-        keep = appear_counts[appear_counts >= min_df].index.tolist()
-        if not keep:
-            keep = appear_counts.sort_values(ascending=False).head(min(50, len(appear_counts))).index.tolist()
-        wide = pd.concat([wide[["trade_date", "stock_code"]], wide[keep]], axis=1)
-        cols = keep
-
-    if prefix:
-        wide = wide.rename(columns={c: f"{prefix}{c}" for c in cols})
-
-    return wide
+    raw_cols = None
+    if cols is not None:
+        raw_cols = [c[len(prefix):] if prefix and c.startswith(prefix) else c for c in cols]
+    X, dates, codes, names = pivot_frame(
+        df_long, name_col, value_col, cols=raw_cols,
+        min_df=min_df if use_min_df else 1, fallback_top=50
+    )
+    return X, dates, codes, [f"{prefix}{c}" for c in names]
 
 def log(msg: str):
     print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
 
 
 # === NEW: 基于 t_stock_feat 生成 lag1_* 特征（替代原 load_lag_daily）
-def load_lag_feat(conn):
+def is_price_col(col: str) -> bool:
+    return col in store.columns(PRICE_SET)
+
+
+def load_lag_feat(conn, start=None, end=None, cols=None):
     """
-    从 t_stock_feat 读取 (stock_code, trade_date, turnover, amplitude, pct_chg)
-    生成上一交易日可用的 lag1_turnover / lag1_amplitude / lag1_pct_chg
+    t_stock_feat 逐股上一行的 turnover / amplitude / pct_chg → lag1_turnover / lag1_amplitude / lag1_pct_chg
+    （PRICE_SET="price_roll" 时另含滚动均值 / 标准差 / 极值 / EMA）
+    按交易日分区缓存在特征仓库（feature.store 的 PRICE_SET），返回 (X, row_dates, row_codes, cols)，无数据时返回 None
     """
-    log("开始加载 t_stock_feat（用于 lag1 特征） ...")  # === NEW
-    df = pd.read_sql_query(
-        """
-        SELECT stock_code, trade_date, turnover, amplitude, pct_chg
-        FROM t_stock_feat
-        """, conn
-    )
-    if df.empty:
+    log(f"开始加载 t_stock_feat {PRICE_SET} 特征（特征仓库） ...")  # === NEW
+    L, dates, codes, lag_cols = store.load(conn, PRICE_SET, start=start, end=end, cols=cols)
+    if L.shape[0] == 0:
         log("⚠️ t_stock_feat 为空，无法生成 lag1 特征")  # === NEW
         return None
-
-    # 统一类型
-    df["trade_date"] = df["trade_date"].astype(int)
-    df["stock_code"] = df["stock_code"].astype(str)
-
-    # 排序 & 逐股 shift(1)
-    df = df.sort_values(["stock_code", "trade_date"])
-    df[FEAT_BASE_COLS] = df.groupby("stock_code")[FEAT_BASE_COLS].shift(1)
-
-    # 去掉全空 lag 行
-    df = df.dropna(subset=FEAT_BASE_COLS, how="all").reset_index(drop=True)
-
-    # 重命名为 lag1_*
-    df = df.rename(columns={c: f"lag1_{c}" for c in FEAT_BASE_COLS})
-    return df  # 含 stock_code, trade_date, lag1_turnover, lag1_amplitude, lag1_pct_chg
+    return L, dates, codes, lag_cols
 
 
-def load_feature_label(conn, use_min_df=True):
+def load_feature_label(conn, use_min_df=True, cols=None):
+    """cols 给定时（树池的列空间）按该列空间输出，不做 min_df 列选择"""
     log("开始加载标签数据 t_stock_label_1 ...")
-    y_df = pd.read_sql_query("SELECT trade_date, stock_code, label FROM t_stock_label_1", conn)
-    y_df["trade_date"] = y_df["trade_date"].astype(int)
-    y_df["stock_code"] = y_df["stock_code"].astype(str)
+    y_df = read_frame(conn, "SELECT trade_date, stock_code, label FROM t_stock_label_1", dtypes=LABEL_DTYPES)
     log(f"标签数据加载完成，共 {len(y_df)} 条，交易日数={y_df['trade_date'].nunique()}")
 
-    log("开始加载信号数据 t_stock_signal ...")
-    sig_df = pd.read_sql_query(
-        "SELECT trade_date, stock_code, signal_name, signal_value FROM t_stock_signal", conn
-    )
-    sig_df["trade_date"] = sig_df["trade_date"].astype(int)
-    sig_df["stock_code"] = sig_df["stock_code"].astype(str)
-    log(f"信号数据加载完成，共 {len(sig_df)} 条，信号种类={sig_df['signal_name'].nunique()}")
-
-    if not sig_df.empty:
-        top_sig_train = (sig_df.groupby("signal_name")["signal_value"]
-                         .size().sort_values(ascending=False).head(20))
+    log("开始加载信号矩阵（特征仓库，按交易日分区缓存） ...")
+    # 列选择与 TOP 日志优先查频次统计表 t_signal_freq，只读选中的列
+    if cols is not None:
+        sel = [c for c in cols if not is_price_col(c)]
+    else:
+        sel = signal_freq.select_cols(conn, "signal", min_df if use_min_df else 1, fallback_top=50)
+    if design.USE_MMAP:
+        return stream_feature_label(conn, y_df, sel, use_min_df, cols)
+    X, dates, codes, sig_cols = store.load(conn, "signal", cols=sel)
+    log(f"信号矩阵加载完成，共 {X.nnz} 个非零，信号种类={len(sig_cols)}")
+
+    top_sig_train = signal_freq.top(conn, "signal", 20)
+    if top_sig_train is None and X.nnz:
+        top_sig_train = (pd.Series(X.getnnz(axis=0), index=sig_cols, name="signal_value")
+                         .sort_values(ascending=False).head(20))
+    if top_sig_train is not None:
         log("训练期最常见信号TOP-20：")
         print(top_sig_train)
 
-    log("开始透视信号表构造特征矩阵 ...")
-    wide = (
-        sig_df.pivot_table(
-            index=["trade_date", "stock_code"],
-            columns="signal_name",
-            values="signal_value",
-            aggfunc="max",
-            fill_value=0.0,
-        )
-        .reset_index()
-    )
-    log(f"透视完成，信号特征列数={wide.shape[1] - 2}")
-
-    if use_min_df:
-        appear_counts = (wide.drop(columns=["trade_date", "stock_code"]) > 0).sum(axis=0)
-        keep_cols = appear_counts[appear_counts >= min_df].index.tolist()
-        if len(keep_cols) == 0:
-            keep_cols = appear_counts.sort_values(ascending=False).head(50).index.tolist()
-        wide = pd.concat([wide[["trade_date", "stock_code"]], wide[keep_cols]], axis=1)
-        log(f"低频信号过滤完成，保留信号特征数={len(keep_cols)}")
-
-    # === CHANGED: 合并 lag1 特征，来源改为 t_stock_feat
-    st_lag = load_lag_feat(conn)  # === NEW
-    if st_lag is not None and not st_lag.empty:
-        wide = pd.merge(wide, st_lag, on=["trade_date", "stock_code"], how="left")
-        lag_cols = [col for col in wide.columns if col.startswith("lag1_")]
-        for c in lag_cols:
-            wide[c] = wide[c].fillna(0.0)
-        log(f"lag1(t_stock_feat) 特征并入完成，新增数值列={len(lag_cols)}")
+    if use_min_df and cols is None and sel is None:
+        X, sig_cols = filter_min_df(X, sig_cols, min_df, fallback_top=50)
+    log(f"低频信号过滤完成，信号特征列数={len(sig_cols)}，非零元素={X.nnz}")
+
+    # === CHANGED: 合并 lag1 特征，来源改为 t_stock_feat（按行键左连接后拼到 CSR 右侧）
+    num_cols = []
+    st_lag = load_lag_feat(conn, cols=None if cols is None else [c for c in cols if is_price_col(c)])  # === NEW
+    if st_lag is not None:
+        L, lag_dates, lag_codes, num_cols = st_lag
+        X = sparse.hstack([X, align_rows(L, lag_dates, lag_codes, dates, codes)], format="csr")
+        log(f"{PRICE_SET}(t_stock_feat) 特征并入完成，新增数值列={len(num_cols)}")
     else:
         log("⚠️ 未并入 lag1 特征（t_stock_feat 为空）")
 
+    if cols is not None:
+        # 按固定列空间重排（lag1 缺失时对应列为 0）
+        X = FeatureSpace(cols).remap(X, sig_cols + num_cols)
+        sig_cols, num_cols = sel, [c for c in cols if is_price_col(c)]
+
     log("开始合并标签 ...")
-    df = pd.merge(wide, y_df, on=["trade_date", "stock_code"], how="inner")
+    df = join_rows(dates, codes, y_df)
+    X = X[df["_row"].values]
+    df = df.drop(columns="_row")
     log(f"合并完成，总样本={len(df)}")
 
     # === NEW: 覆盖率统计（信号 → 数值 → 总体）
-    sig_cols = [c for c in df.columns if c not in ("trade_date", "stock_code", "label") and not c.startswith("lag1_")]
-    num_cols = [c for c in df.columns if c.startswith("lag1_")]
     if sig_cols:
-        nz_sig = (df[sig_cols].values != 0).sum(axis=1)
+        nz_sig = X[:, :len(sig_cols)].getnnz(axis=1)
         log(f"[训练集] 信号特征非零数：P50={np.percentile(nz_sig, 50)}, P90={np.percentile(nz_sig, 90)}, max={nz_sig.max()}  全零比={(nz_sig == 0).mean():.2%}")
     if num_cols:
-        nz_num = (df[num_cols].values != 0).sum(axis=1)
+        nz_num = X[:, len(sig_cols):].getnnz(axis=1)
         log(f"[训练集] 量价特征（feat）非零数：P50={np.percentile(nz_num, 50)}, P90={np.percentile(nz_num, 90)}, max={nz_num.max()}  全零比={(nz_num == 0).mean():.2%}")
-    feat_cols_all = [c for c in df.columns if c not in ("trade_date", "stock_code", "label")]
-    nz_all = (df[feat_cols_all].values != 0).sum(axis=1)
+    feat_cols_all = sig_cols + num_cols
+    nz_all = X.getnnz(axis=1)
     log(f"[训练集] 合并后特征非零数：P50={np.percentile(nz_all, 50)}, P90={np.percentile(nz_all, 90)}, max={nz_all.max()}  全零比={(nz_all == 0).mean():.2%}")
 
     pos_rate = float(df["label"].mean()) if len(df) else 0.0
     log(f"标签正例占比={pos_rate:.4f}（全预测为1基线acc≈{pos_rate:.4f}）")
 
     feature_cols = feat_cols_all
-    return df, feature_cols
+    return X, df, feature_cols
 
 
-def temporal_split(df, test_ratio=0.3):
-    dates = sorted(df["trade_date"].unique())
+def stream_feature_label(conn, y_df, sel, use_min_df=True, cols=None):
+    """
+    design.USE_MMAP：信号与 PRICE_SET 量价特征逐日左连接、关联标签后直接写入磁盘设计矩阵，不在内存中拼出整段 X
+    列选择 / 列顺序同 load_feature_label（cols 给定时按树池列空间输出）
+    """
+    if sel is None and use_min_df and cols is None:
+        sel = store.select_min_df(conn, "signal", min_df, fallback_top=50)
+    sig_cols, days = store.iter_days(conn, "signal", cols=sel)
+    num_cols, lag_days = store.iter_days(conn, PRICE_SET, cols=None if cols is None else
+                                         [c for c in cols if is_price_col(c)])
+    days = store.join_days(days, lag_days, len(num_cols))
+    feature_cols = sig_cols + num_cols
+    if cols is not None:
+        # 按固定列空间重排（不在当前特征集中的列为 0）
+        space = FeatureSpace(cols)
+        days = ((d, space.remap(X, feature_cols), c) for d, X, c in days)
+        feature_cols = list(cols)
+    dm, df = design.write_days(MMAP_PATH, days, len(feature_cols), labels=y_df)
+    nz_all = np.diff(dm.indptr) if dm.fmt == "csr" else None
+    if nz_all is not None and len(nz_all):
+        log(f"[训练集] 合并后特征非零数：P50={np.percentile(nz_all, 50)}, P90={np.percentile(nz_all, 90)}, "
+            f"max={nz_all.max()}  全零比={(nz_all == 0).mean():.2%}")
+    pos_rate = float(df["label"].mean()) if len(df) else 0.0
+    log(f"特征逐日写入 {MMAP_PATH}：样本={len(df)}，特征列数={len(feature_cols)}，标签正例占比={pos_rate:.4f}")
+    return dm, df, feature_cols
+
+
+def temporal_split(X, df, test_ratio=0.3):
+    """df 为与 X 行对齐的 (trade_date, stock_code, label)，按日期切分稀疏矩阵的行"""
+    row_dates = df["trade_date"].values
+    dates = np.unique(row_dates)
     split_idx = int(len(dates) * (1 - test_ratio))
     split_date = dates[split_idx]
-    train = df[df["trade_date"] < split_date]
-    test = df[df["trade_date"] >= split_date]
-    log(f"时间切分完成：训练集={len(train)}，测试集={len(test)}，切分点={split_date}")
-    X_train = train.drop(columns=["trade_date", "stock_code", "label"]).values
-    y_train = train["label"].values
-    X_test = test.drop(columns=["trade_date", "stock_code", "label"]).values
-    y_test = test["label"].values
+    y = df["label"].values
+
+    if isinstance(X, design.DesignMatrix):
+        # 行已按日期升序写盘：训练 / 测试是连续行区间上的视图
+        X_train, X_test = X.split(split_date)
+        k = X_train.shape[0]
+        y_train, y_test = y[:k], y[k:]
+    else:
+        train_mask = row_dates < split_date
+        X_train, y_train = X[train_mask], y[train_mask]
+        X_test, y_test = X[~train_mask], y[~train_mask]
+    log(f"时间切分完成：训练集={X_train.shape[0]}，测试集={X_test.shape[0]}，切分点={split_date}")
     return X_train, y_train, X_test, y_test, split_date
 
 
+def _month_add(yyyymm: int, n: int) -> int:
+    m = (yyyymm // 100) * 12 + yyyymm % 100 - 1 + n
+    return (m // 12) * 100 + m % 12 + 1
+
+
+def fit_forest(X_train, y_train, train_dates, feature_cols, pool=None, sample_weight=None):
+    """
+    ROLLING=False：整片森林从头训练
+    ROLLING=True ：树池按月分批；已有树池时只重训其末批所在月份及之后的数据（每月一批 TREES_PER_WINDOW 棵），
+                   末月之前的批次原样保留，ROLLING_LOOKBACK_M 个月之前的批次淘汰
+    train_dates / sample_weight 与 X_train 行对齐且升序
+    """
+    if not ROLLING:
+        clf = RandomForestClassifier(**RF_PARAMS)
+        clf.fit(X_train, y_train, sample_weight=sample_weight)
+        return clf, None
+
+    if pool is None or pool.space.names != list(feature_cols):
+        pool = ForestPool(FeatureSpace(feature_cols), RF_PARAMS, TREES_PER_WINDOW)
+        fit_from = int(train_dates[0])
+    else:
+        fit_from = int(pool.last_end) // 100 * 100 + 1
+        n_drop = pool.drop_since(fit_from)
+        log(f"[pool] 沿用树池 {len(pool.batches)} 批 / {pool.n_trees} 棵树，{fit_from} 起的 {n_drop} 批重训")
+    k = int(np.searchsorted(train_dates, fit_from))
+    X_new, y_new, d_new = X_train[k:], y_train[k:], train_dates[k:]
+    w_new = None if sample_weight is None else sample_weight[k:]
+    for lo, hi, m in split_windows(d_new, key=lambda d: int(d) // 100):
+        lo_i, hi_i = np.flatnonzero(m)[[0, -1]]
+        pool.fit_batch(X_new[lo_i:hi_i + 1], y_new[lo_i:hi_i + 1], int(lo), int(hi),
+                       sample_weight=None if w_new is None else w_new[lo_i:hi_i + 1])
+    pool.retire(before=_month_add(int(train_dates[-1]) // 100, -ROLLING_LOOKBACK_M) * 100 + 1)
+    pool.save(POOL_PATH)
+    log(f"[pool] 树池已保存：{len(pool.batches)} 批 / {pool.n_trees} 棵树 → {POOL_PATH}")
+    return pool.forest(), pool
+
+
 def train_and_eval(conn):
-    df, feature_cols = load_feature_label(conn)
-    X_train, y_train, X_test, y_test, split_date = temporal_split(df)
+    pool = ForestPool.load(POOL_PATH) if ROLLING else None
+    X, df, feature_cols = load_feature_label(conn, cols=pool.space.names if pool else None)
+    X_train, y_train, X_test, y_test, split_date = temporal_split(X, df)
+    del X  # 之后只用切分结果（design.USE_MMAP 时为磁盘视图）
+
+    train_row_dates = df["trade_date"].values[:len(y_train)]
+    # 压缩选择集：训练窗口末尾一段交易日（全量分布、不参与训练）
+    X_hold = y_hold = None
+    if COMPACT:
+        k = compact.holdout_start(train_row_dates)
+        X_hold, y_hold = X_train[k:], y_train[k:]
+        X_train, y_train, train_row_dates = X_train[:k], y_train[:k], train_row_dates[:k]
+        log(f"压缩选择集：训练窗口末尾 {len(y_hold):,} 行不参与训练")
+
+    # 训练集负例按日降采样（按 (种子, 交易日) 抽样，滚动树池各月批次看到的行与整片训练时一致）
+    keep, w_train, scheme = sampling.downsample(train_row_dates, y_train, NEG_RATE, seed=random_state,
+                                                weighting=NEG_WEIGHTING)
+    if scheme is None:
+        w_train = None
+    else:
+        X_train, y_train, train_row_dates = X_train[keep], y_train[keep], train_row_dates[keep]
 
-    log("开始训练随机森林模型 ...")
-    clf = RandomForestClassifier(
-        n_estimators=500, max_depth=None, min_samples_split=4,
-        n_jobs=-1, random_state=random_state, class_weight="balanced_subsample"
-    )
-    clf.fit(X_train, y_train)
+    log("开始训练随机森林模型 ..." + ("（滚动树池）" if ROLLING else ""))
+    clf, pool = fit_forest(X_train, y_train, train_row_dates, feature_cols, pool, sample_weight=w_train)
     log("训练完成")
 
     log("开始评估模型 ...")
     y_pred = clf.predict(X_test)
+    if scheme is not None:
+        # 0.5 阈值作用在还原到全量分布的概率上
+        y_pred = (sampling.invert(clf.predict_proba(X_test)[:, 1], scheme) >= 0.5).astype(int)
     acc = accuracy_score(y_test, y_pred)
     log(f"测试集准确率={acc:.4f}")
     print(classification_report(y_test, y_pred, digits=4))
     try:
-        y_prob = clf.predict_proba(X_test)[:, 1]
+        y_prob = sampling.invert(clf.predict_proba(X_test)[:, 1], scheme)
 
         # === NEW: 阈值扫描（可选）
         scan = scan_thresholds(y_test, y_prob, target_precision=0.80, target_recall=0.80)
@@ -329,13 +416,18 @@ def train_and_eval(conn):
 
         # 特征与参数
         features = {
-            "signals": [c for c in feature_cols if not c.startswith("lag1_")],
-            "price_lag": [c for c in feature_cols if c.startswith("lag1_")]
+            "signals": [c for c in feature_cols if not is_price_col(c)],
+            "price_lag": [c for c in feature_cols if is_price_col(c)]
         }
         params = {
             "n_estimators": 500, "max_depth": None, "min_samples_split": 4,
             "class_weight": "balanced_subsample", "random_state": random_state
         }
+        if pool is not None:
+            params.update({"rolling": True, "n_estimators": pool.n_trees,
+                           "trees_per_window": TREES_PER_WINDOW, "windows": pool.summary()})
+        if scheme is not None:
+            params["sampling"] = scheme     # 预测时按它还原概率
 
         # 评测指标（把上面已算好的数塞进来）
         metrics = {
@@ -349,26 +441,27 @@ def train_and_eval(conn):
 
         # 版本号/备注
         model_version = f"combo_rf-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}"
-        note = "t_stock_feat(lag1_turnover, lag1_amplitude, lag1_pct_chg) + signals; TopK评估启用"
+        note = f"t_stock_feat({PRICE_SET}: {', '.join(store.columns(PRICE_SET))}) + signals; TopK评估启用"
 
         # 可选：做一个数据指纹（用特征名 + 时间窗口简易hash）
         data_hash_text = "|".join(feature_cols) + f"|{train_start}-{train_end}|{valid_start}-{valid_end}"
 
-        model_id = save_model_meta(
-            conn=conn,
-            model_version=model_version,
-            model_type="RandomForest",
-            train_start=train_start, train_end=train_end,
-            valid_start=valid_start, valid_end=valid_end,
-            label_rule="label = (v1>=1% or v2>=1% or v3>=1%) from t_stock_label_1",
-            features=features,
-            params=params,
-            metrics=metrics,
-            artifact_path=MODEL_PATH,
-            tag="baseline_topk",
-            note=note,
-            data_hash_text=data_hash_text
-        )
+        with writer(DB_PATH) as wconn:
+            model_id = save_model_meta(
+                conn=wconn,
+                model_version=model_version,
+                model_type="RandomForest",
+                train_start=train_start, train_end=train_end,
+                valid_start=valid_start, valid_end=valid_end,
+                label_rule="label = (v1>=1% or v2>=1% or v3>=1%) from t_stock_label_1",
+                features=features,
+                params=params,
+                metrics=metrics,
+                artifact_path=MODEL_PATH,
+                tag="rolling_topk" if pool is not None else "baseline_topk",
+                note=note,
+                data_hash_text=data_hash_text
+            )
         log(f"[Model Registry] 已登记模型: model_id={model_id}, version={model_version}")
 
     except Exception as e:
@@ -379,12 +472,23 @@ def train_and_eval(conn):
     log("Top-30 特征重要性：")
     print(fi.head(30))
 
-    joblib.dump({"model": clf, "feature_cols": feature_cols}, MODEL_PATH)
+    # 列空间（列名 → 列号）随模型保存；预测日矩阵按它直接构造
+    space = FeatureSpace(feature_cols)
+    joblib.dump({"model": clf, "feature_cols": feature_cols, "space": space.to_dict(), "sampling": scheme}, MODEL_PATH)
+    space.save_for(MODEL_PATH)
     log(f"模型已保存到 {MODEL_PATH}")
+
+    if COMPACT:
+        small, report = compact.compact(clf, X_hold, y_hold, method=COMPACT, X_fit=X_train,
+                                        X_test=X_test, y_test=y_test)
+        compact.save(MODEL_PATH, {"feature_cols": feature_cols, "space": space.to_dict(), "sampling": scheme},
+                     small, report)
+        clf = small
     return clf, feature_cols
 
 
-def predict_latest_day(conn, clf, feature_cols, model_version: str = "adhoc", topk: int = 20):
+def predict_latest_day(conn, clf, feature_cols, model_version: str = "adhoc", topk: int = 20, scheme: dict = None):
+    """scheme：训练时的负例采样方案（t_model_meta.params_json 的 sampling），用于还原概率"""
     log("开始获取最新交易日 ...")
     latest_dt = conn.execute("SELECT MAX(trade_date) FROM t_stock_signal").fetchone()[0]
     # 若 t_stock_signal 当天没有数据，则用 t_stock_feat 的最大交易日兜底
@@ -396,92 +500,43 @@ def predict_latest_day(conn, clf, feature_cols, model_version: str = "adhoc", to
         log(f"最新交易日={latest_dt}")
 
     # ==============================
-    # 1) 原始信号（当日）
+    # 1) 当日信号概况（只做日志，GROUP BY 在库内完成）
     # ==============================
-    sig_df = pd.read_sql_query(
-        "SELECT trade_date, stock_code, signal_name, signal_value "
-        "FROM t_stock_signal WHERE trade_date=?",
-        conn, params=(latest_dt,)
-    )
-    log(f"当天原始信号数={len(sig_df)}")
-    if not sig_df.empty:
-        top_sig_pred = (sig_df.groupby("signal_name")["signal_value"]
-                        .size().sort_values(ascending=False).head(20))
+    top_sig_pred = read_frame(conn, """
+        SELECT signal_name, COUNT(*) AS n FROM t_stock_signal WHERE trade_date=?
+        GROUP BY signal_name ORDER BY n DESC, signal_name LIMIT 20
+    """, params=(latest_dt,))
+    if not top_sig_pred.empty:
         log("当日最常见原始信号TOP-20：")
-        print(top_sig_pred)
-
-    # 统一 join 键的类型
-    if not sig_df.empty:
-        sig_df["trade_date"] = sig_df["trade_date"].astype(int)
-        sig_df["stock_code"] = sig_df["stock_code"].astype(str)
-
-    # 透视为宽表（若 sig_df 为空，得到的是只有键列的空框）
-    wide = pivot_signals(sig_df, "signal_name", "signal_value", prefix="s_", use_min_df=False)
+        print(top_sig_pred.set_index("signal_name")["n"])
 
     # ==============================
-    # 2) 并入 lag1(t_stock_feat)
+    # 2) 按时点取特征（feature.pit）：信号只读预测日，量价特征集只读定义所需的回看窗口，直接按训练列顺序输出
     # ==============================
-    log("开始加载 t_stock_feat（用于 lag1 特征） ...")
-    feat_df = pd.read_sql_query(
-        "SELECT stock_code, trade_date, turnover, amplitude, pct_chg FROM t_stock_feat",
-        conn
-    )
-    if not feat_df.empty:
-        feat_df["trade_date"] = feat_df["trade_date"].astype(int)
-        feat_df["stock_code"] = feat_df["stock_code"].astype(str)
-
-        feat_df = feat_df.sort_values(["stock_code", "trade_date"])
-        for c in ["turnover", "amplitude", "pct_chg"]:
-            feat_df[f"lag1_{c}"] = feat_df.groupby("stock_code")[c].shift(1)
-
-        feat_df = feat_df[["stock_code", "trade_date",
-                           "lag1_turnover", "lag1_amplitude", "lag1_pct_chg"]]
-
-        # 合并 lag1 特征
-        wide = pd.merge(wide, feat_df, on=["trade_date", "stock_code"], how="left")
-
-        for c in ["lag1_turnover", "lag1_amplitude", "lag1_pct_chg"]:
-            if c in wide.columns:
-                wide[c] = wide[c].fillna(0.0)
-        log("预测日 lag1(t_stock_feat) 特征并入完成")
-    else:
-        log("⚠️ t_stock_feat 为空，未并入 lag1 特征")
-
-    # 兜底：若当日无任何信号导致 wide 为空，仍然用 lag1_* 做预测底座
-    if wide.empty and not feat_df.empty:
-        log("当日无信号，使用 lag1 特征作为预测底座")
-        base = (feat_df[feat_df["trade_date"] == int(latest_dt)]
-                [["trade_date", "stock_code", "lag1_turnover", "lag1_amplitude", "lag1_pct_chg"]]
-                .drop_duplicates())
-        if not base.empty:
-            wide = base.copy()
-        else:
-            log("⚠️ 当日也缺少 lag1 特征可用样本，预测集为空")
-            return pd.DataFrame(columns=["trade_date", "stock_code", "pred_up_prob",
-                                         "rank_in_day", "is_topk", "hit_pairs", "hit_triples"])
-
-    # ==============================
-    # 3) 对齐训练列（缺失补0）
-    # ==============================
-    for col in feature_cols:
-        if col not in wide.columns:
-            wide[col] = 0.0
-
-    X_new = wide[feature_cols].values
+    pit = PointInTime(feature_cols, [("signal", ""), (PRICE_SET, "")], conn=conn)
+    X_new, codes = pit.get_features(latest_dt)
+    dates = np.repeat(latest_dt, len(codes))
+    if len(codes) == 0:
+        log(f"⚠️ 当日既无信号也无 {PRICE_SET} 特征可用样本，预测集为空")
+        return pd.DataFrame(columns=["trade_date", "stock_code", "pred_up_prob",
+                                     "rank_in_day", "is_topk", "hit_pairs", "hit_triples"])
+    if pit.base != "signal":
+        # 兜底：当日无任何信号时，用量价特征的股票作为预测底座
+        log(f"当日无信号，使用 {PRICE_SET} 特征作为预测底座")
 
     # 覆盖率统计
-    nz_day = (X_new != 0).sum(axis=1)
-    log(f"[预测集] 当日标的数={len(wide)}")
+    nz_day = X_new.getnnz(axis=1)
+    log(f"[预测集] 当日标的数={len(dates)}")
     if len(nz_day) > 0:
         log(f"  P50={np.percentile(nz_day, 50)}, P90={np.percentile(nz_day, 90)}, max={nz_day.max()}")
         log(f"  全零样本比例={(nz_day == 0).mean():.2%}")
 
     # ==============================
-    # 4) 预测 + 排序 + TopK
+    # 3) 预测 + 排序 + TopK
     # ==============================
     log("开始预测最新交易日 ...")
-    proba = clf.predict_proba(X_new)[:, 1]
-    out = wide[["trade_date", "stock_code"]].copy()
+    proba = sampling.invert(clf.predict_proba(X_new)[:, 1], scheme)
+    out = pd.DataFrame({"trade_date": dates, "stock_code": codes})
     out["pred_up_prob"] = proba
 
     # 占位（暂不启用组合）
@@ -499,7 +554,7 @@ def predict_latest_day(conn, clf, feature_cols, model_version: str = "adhoc", to
                           "rank_in_day", "hit_pairs", "hit_triples"]])
 
     # ==============================
-    # 5) 批量落库 t_model_pred
+    # 4) 批量落库 t_model_pred
     # ==============================
     rows = [
         (
@@ -514,15 +569,15 @@ def predict_latest_day(conn, clf, feature_cols, model_version: str = "adhoc", to
         )
         for r in out.itertuples(index=False)
     ]
-    conn.executemany(
-        """
-        INSERT OR REPLACE INTO t_model_pred
-        (model_version, trade_date, stock_code, pred_up_prob, rank_in_day, is_topk, hit_pairs, hit_triples)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        rows
-    )
-    conn.commit()
+    with writer(DB_PATH) as wconn:
+        wconn.executemany(
+            """
+            INSERT OR REPLACE INTO t_model_pred
+            (model_version, trade_date, stock_code, pred_up_prob, rank_in_day, is_topk, hit_pairs, hit_triples)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
     log(f"[DB] 已写入 t_model_pred：{len(rows)} 行（model_version={model_version}, trade_date={latest_dt}）")
 
     # 返回 TopK DataFrame，方便外部使用
@@ -534,11 +589,12 @@ if __name__ == "__main__":
     if not Path(DB_PATH).exists():
         raise FileNotFoundError(f"数据库文件不存在：{DB_PATH}")
 
-    with sqlite3.connect(DB_PATH) as conn:
+    with routed(db_path=DB_PATH) as conn:
         clf, feature_cols = train_and_eval(conn)
         # 这里如果你在 train_and_eval 里创建了 model_version，可 return 回来；
         # 假设我们在那里保存为了全局变量或直接再查最近一条：
-        model_version = conn.execute(
-            "SELECT model_version FROM t_model_meta ORDER BY created_at DESC LIMIT 1"
-        ).fetchone()[0]
-        predict_latest_day(conn, clf, feature_cols, model_version=model_version, topk=20)
+        model_version, params_json = conn.execute(
+            "SELECT model_version, params_json FROM t_model_meta ORDER BY created_at DESC LIMIT 1"
+        ).fetchone()
+        scheme = json.loads(params_json or "{}").get("sampling")
+        predict_latest_day(conn, clf, feature_cols, model_version=model_version, topk=20, scheme=scheme)
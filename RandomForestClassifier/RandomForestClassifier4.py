@@ -1,18 +1,51 @@
 # -*- coding: utf-8 -*-
-import sqlite3
+import sys
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from pathlib import Path
-from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, accuracy_score, roc_auc_score, average_precision_score
 import joblib
 import datetime
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.partition import routed
+from database.columnar import read_frame, LABEL_DTYPES
+from database import signal_freq
+from feature.pivot import join_rows, align_rows, filter_min_df
+from feature import store
+from feature import design
+from feature import combo
+from model import backends
+from model import sampling
+from model import compact
+
 DB_PATH = r"../stock.db"   # ← 修改为你的 SQLite 文件路径
 MODEL_PATH = r"../train/rf_model_stock.pkl"
 TOPN_PREDICT = 50
 min_df = 10
 random_state = 42
+# 设计矩阵落盘目录（是否落盘 / 格式见 feature.design 的 USE_MMAP / MMAP_FORMAT）
+MMAP_PATH = design.path_for("rf4")
+
+# 模型后端（model.backends）：换成 "hist_gbdt" / "lgbm" 等只需改这里，评估与保存流程不变
+MODEL_BACKEND = "rf"
+BACKEND_PARAMS = {
+    "rf": dict(n_estimators=500, max_depth=None, min_samples_split=4,
+               n_jobs=-1, random_state=random_state, class_weight="balanced_subsample"),
+    "hist_gbdt": dict(learning_rate=0.05, max_iter=400, max_leaf_nodes=63, class_weight="balanced",
+                      random_state=random_state),
+    "lgbm": dict(n_estimators=400, num_leaves=63, learning_rate=0.05, class_weight="balanced",
+                 random_state=random_state),
+}
+
+# 负例按日降采样（model.sampling）：只作用于训练集；"weight" 负例加权 1/NEG_RATE，"none" 不加权、评估 / 预测时还原概率
+NEG_RATE = 1.0          # 1.0 = 不采样
+NEG_WEIGHTING = "weight"
+# 森林压缩（model.compact，仅 MODEL_BACKEND="rf"）："prune" / "subset" / "distill"，None 不压缩；
+# 训练窗口末尾 compact.HOLDOUT_FRAC 的交易日不参与训练、用来选择压缩参数，指标差值在测试集上度量；
+# 压缩模型存为 rf_model_stock.compact.pkl，当日预测使用压缩模型
+COMPACT = None
 
 USE_PAIR = True      # 两两组合
 USE_TRIPLE = False   # 三三组合关闭
@@ -21,239 +54,223 @@ def log(msg: str):
     print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
 
 
-# === 新增：22组合评估函数 ===
-def eval_combos(conn, acc_thresh=0.55, auc_thresh=0.60):
+# === 新增：22组合评估函数（一次性向量化：组合矩阵与标签行对齐后，命中数 / 正例数一次 Xᵀy 得到）===
+def eval_combos(conn, acc_thresh=0.55, auc_thresh=0.60, min_hit=20):
     """
     评估每个22组合在预测中的表现，结果存入 t_combo_eval
+    指标以“是否命中”为打分闭式计算（feature.combo.binary_metrics）：accuracy / pos_rate 为命中行中的正例比例，
+    auc / pr_auc 以全部有标签行为样本
     """
-    from sklearn.metrics import accuracy_score, roc_auc_score, average_precision_score
-
     log("开始评估两两组合表现 ...")
-    y_df = pd.read_sql_query("SELECT trade_date, stock_code, label FROM t_stock_label_1", conn)
-    pair_df = pd.read_sql_query("SELECT trade_date, stock_code, combo_name, combo_value FROM t_stock_signal_2", conn)
+    y_df = read_frame(conn, "SELECT trade_date, stock_code, label FROM t_stock_label_1", dtypes=LABEL_DTYPES)
+    X, dates, codes, names = load_signals(conn, "pair", prefix="", use_min_df=False)
 
-    if pair_df.empty:
+    if X.shape[1] == 0:
         log("⚠️ t_stock_signal_2 为空，跳过评估")
         return
 
-    results = []
-    for cname, sub in pair_df.groupby("combo_name"):
-        df = pd.merge(sub, y_df, on=["trade_date", "stock_code"], how="inner")
-        if df.empty or df["combo_value"].sum() < 20:  # 出现次数太少跳过
-            continue
-
-        y_true = df["label"].values
-        y_pred = (df["combo_value"] > 0).astype(int).values
-
-        acc = accuracy_score(y_true, y_pred)
-        try:
-            auc = roc_auc_score(y_true, df["combo_value"].values)
-        except:
-            auc = None
-        try:
-            pr_auc = average_precision_score(y_true, df["combo_value"].values)
-        except:
-            pr_auc = None
-
-        if (acc >= acc_thresh) or (auc is not None and auc >= auc_thresh):
-            results.append(("p2", cname, len(df), acc, auc, pr_auc, y_true.mean()))
-
-    if results:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS t_combo_eval (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                combo_type TEXT,
-                combo_name TEXT,
-                n_samples INT,
-                accuracy REAL,
-                auc REAL,
-                pr_auc REAL,
-                pos_rate REAL,
-                create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.executemany("""
-            INSERT INTO t_combo_eval(combo_type, combo_name, n_samples, accuracy, auc, pr_auc, pos_rate)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, results)
-        conn.commit()
-        log(f"组合评估完成，写入 {len(results)} 条记录")
+    lab = join_rows(dates, codes, y_df)
+    H = X[lab["_row"].values]
+    H.data = (H.data != 0).astype(np.float64)               # 命中指示矩阵
+    y = lab["label"].values.astype(np.float64)
+    n_hit, n_pos = (H.T @ np.column_stack([np.ones_like(y), y])).T   # 每列命中数、命中中的正例数
+    P = int(y_df["label"].sum())
+    N = len(y_df) - P
+
+    res = combo.binary_metrics(n_hit, n_pos, P, N)
+    res["combo_type"] = "p2"
+    res["combo_name"] = names
+    res["n_samples"] = n_hit.astype(np.int64)
+    ok = (n_hit >= min_hit) & ((res["accuracy"] >= acc_thresh) | (res["auc"] >= auc_thresh)).values
+    res = res[ok]
+    log(f"组合数={len(names)}，命中数 >= {min_hit} 的={int((n_hit >= min_hit).sum())}，满足阈值={len(res)}")
+
+    if len(res):
+        n = combo.save_eval(res, db_path=DB_PATH)
+        log(f"组合评估完成，写入 {n} 条记录")
     else:
         log("⚠️ 没有组合满足阈值条件")
 
 
-# === 信号透视函数 ===
-def pivot_signals(df_long: pd.DataFrame, name_col: str, value_col: str, prefix: str, use_min_df=True):
-    if df_long.empty:
-        return pd.DataFrame(columns=["trade_date", "stock_code"])
-    wide = pd.crosstab(
-        [df_long["trade_date"], df_long["stock_code"]],
-        df_long[name_col],
-        values=df_long[value_col],
-        aggfunc="max"
-    ).reset_index()
-    cols = [c for c in wide.columns if c not in ("trade_date", "stock_code")]
-    if use_min_df and cols:
-        appear_counts = (wide[cols] > 0).sum(axis=0)
-        keep = appear_counts[appear_counts >= min_df].index.tolist()
-        if not keep:
-            keep = appear_counts.sort_values(ascending=False).head(min(50, len(appear_counts))).index.tolist()
-        wide = pd.concat([wide[["trade_date", "stock_code"]], wide[keep]], axis=1)
-        cols = keep
-    rename_map = {c: f"{prefix}{c}" for c in cols}
-    wide = wide.rename(columns=rename_map)
-    return wide
+# === 信号矩阵加载（特征仓库按交易日分区缓存；返回 CSR + 行键数组 + 带前缀列名）===
+def load_signals(conn, name: str, prefix: str, use_min_df=True, trade_date=None, cols=None):
+    """
+    name 为 feature.store 中的特征集（"signal" / "pair"，与 t_signal_freq 的 kind 同名）
+    cols 给定时（带前缀的列名）按训练列空间输出，缺失列为 0，多余信号丢弃
+    训练时 min_df 列选择优先查频次统计表 t_signal_freq，没有可用统计时读全部列后按列非零数过滤
+    """
+    raw_cols = None if cols is None else [c[len(prefix):] for c in cols if c.startswith(prefix)]
+    if cols is None and use_min_df:
+        raw_cols = signal_freq.select_cols(conn, name, min_df, fallback_top=50)
+    X, dates, codes, names = store.load(conn, name, start=trade_date, end=trade_date, cols=raw_cols)
+    if cols is None and use_min_df and raw_cols is None:
+        X, names = filter_min_df(X, names, min_df, fallback_top=50)
+    return X, dates, codes, [f"{prefix}{c}" for c in names]
 
 
 # === 特征加载 ===
 def load_feature_label(conn, use_min_df=True):
     # 标签
     log("开始加载标签数据 t_stock_label_1 ...")
-    y_df = pd.read_sql_query("SELECT trade_date, stock_code, label FROM t_stock_label_1", conn)
-    y_df["trade_date"] = y_df["trade_date"].astype(int)
-    y_df["stock_code"] = y_df["stock_code"].astype(str)
+    y_df = read_frame(conn, "SELECT trade_date, stock_code, label FROM t_stock_label_1", dtypes=LABEL_DTYPES)
     log(f"标签数据加载完成，共 {len(y_df)} 条，交易日数={y_df['trade_date'].nunique()}")
+    if design.USE_MMAP:
+        return stream_feature_label(conn, y_df, use_min_df)
 
     # 原始信号
-    log("开始加载信号数据 t_stock_signal ...")
-    sig_df = pd.read_sql_query("SELECT trade_date, stock_code, signal_name, signal_value FROM t_stock_signal", conn)
-    sig_df["trade_date"] = sig_df["trade_date"].astype(int)
-    sig_df["stock_code"] = sig_df["stock_code"].astype(str)
-    log(f"信号数据加载完成，共 {len(sig_df)} 条，信号种类={sig_df['signal_name'].nunique()}")
-    if not sig_df.empty:
-        top_sig_train = (sig_df.groupby("signal_name")["signal_value"].size().sort_values(ascending=False).head(20))
+    log("开始加载原始信号矩阵（特征仓库） ...")
+    X, dates, codes, feature_cols = load_signals(conn, "signal", prefix="s_", use_min_df=use_min_df)
+    log(f"原始信号加载完成，非零元素={X.nnz}，保留列数={len(feature_cols)}")
+    top_sig_train = signal_freq.top(conn, "signal", 20)
+    if top_sig_train is not None:
+        top_sig_train.index = "s_" + top_sig_train.index
+    elif X.nnz:
+        top_sig_train = (pd.Series(X.getnnz(axis=0), index=feature_cols, name="signal_value")
+                         .sort_values(ascending=False).head(20))
+    if top_sig_train is not None:
         log("训练期最常见信号TOP-20：")
         print(top_sig_train)
 
-    log("开始透视原始信号为宽表 ...")
-    wide_s = pivot_signals(sig_df, "signal_name", "signal_value", prefix="s_", use_min_df=use_min_df)
-    log(f"原始信号透视完成，保留列数={len([c for c in wide_s.columns if c not in ('trade_date','stock_code')])}")
-
     # 两两组合
     if USE_PAIR:
-        log("开始加载两两组合视图 t_stock_signal_2 ...")
-        pair_df = pd.read_sql_query("SELECT trade_date, stock_code, combo_name, combo_value FROM t_stock_signal_2", conn)
-        if not pair_df.empty:
-            pair_df["trade_date"] = pair_df["trade_date"].astype(int)
-            pair_df["stock_code"] = pair_df["stock_code"].astype(str)
-        log(f"两两组合记录数={len(pair_df)}，组合种类={pair_df['combo_name'].nunique() if not pair_df.empty else 0}")
-        log("透视两两组合 ...")
-        wide_p2 = pivot_signals(pair_df, "combo_name", "combo_value", prefix="p2_", use_min_df=use_min_df)
-    else:
-        wide_p2 = pd.DataFrame(columns=["trade_date", "stock_code"])
-
-    # 合并信号
-    log("合并信号（原始 + 两两） ...")
-    wide = wide_s.set_index(["trade_date", "stock_code"])
-    if not wide_p2.empty:
-        wide = wide.join(wide_p2.set_index(["trade_date", "stock_code"]), how="left")
-    wide = wide.reset_index()
-    wide.fillna(0.0, inplace=True)
+        log("开始加载两两组合矩阵 t_stock_signal_2（特征仓库） ...")
+        X_p2, dates_p2, codes_p2, cols_p2 = load_signals(conn, "pair", prefix="p2_", use_min_df=use_min_df)
+        log(f"两两组合非零元素={X_p2.nnz}，保留组合数={len(cols_p2)}")
+        # 合并信号（原始 + 两两）：组合按原始信号的行键左连接，缺失为 0
+        log("合并信号（原始 + 两两） ...")
+        X = sparse.hstack([X, align_rows(X_p2, dates_p2, codes_p2, dates, codes)], format="csr")
+        feature_cols = feature_cols + cols_p2
 
     # 合并标签
     log("开始合并标签 ...")
-    df = pd.merge(wide, y_df, on=["trade_date", "stock_code"], how="inner")
+    df = join_rows(dates, codes, y_df)
+    X = X[df["_row"].values]
+    df = df.drop(columns="_row")
     log(f"合并完成，总样本={len(df)}")
+    log(f"最终使用特征数={len(feature_cols)}")
+
+    return X, df, feature_cols
 
-    # 最终只保留信号特征
-    feat_cols_all = [c for c in df.columns if c not in ("trade_date","stock_code","label")]
-    feature_cols = [c for c in feat_cols_all if not c.startswith("lag1_")]
-    log(f"最终使用特征数={len(feature_cols)}（已剔除 lag1_*）")
 
-    return df, feature_cols
+def stream_signals(conn, name: str, prefix: str, use_min_df=True):
+    """load_signals 的逐日版本：返回 (带前缀列名, 逐日迭代器)，min_df 列选择同 load_signals"""
+    raw_cols = signal_freq.select_cols(conn, name, min_df, fallback_top=50) if use_min_df else None
+    if use_min_df and raw_cols is None:
+        raw_cols = store.select_min_df(conn, name, min_df, fallback_top=50)
+    names, days = store.iter_days(conn, name, cols=raw_cols)
+    return [f"{prefix}{c}" for c in names], days
 
 
-# === 时间切分 ===
-def temporal_split(df, test_ratio=0.3):
-    dates = sorted(df["trade_date"].unique())
+def stream_feature_label(conn, y_df, use_min_df=True):
+    """design.USE_MMAP：原始信号（+ 两两组合）逐日关联标签后直接写入磁盘设计矩阵，不在内存中拼出整段 X"""
+    feature_cols, days = stream_signals(conn, "signal", "s_", use_min_df)
+    if USE_PAIR:
+        cols_p2, days_p2 = stream_signals(conn, "pair", "p2_", use_min_df)
+        days = store.join_days(days, days_p2, len(cols_p2))     # 组合按原始信号的行键左连接，缺失为 0
+        feature_cols = feature_cols + cols_p2
+    dm, df = design.write_days(MMAP_PATH, days, len(feature_cols), labels=y_df)
+    log(f"特征逐日写入 {MMAP_PATH}：样本={len(df)}，最终使用特征数={len(feature_cols)}")
+    return dm, df, feature_cols
+
+
+# === 时间切分（df 与 X 行对齐，按日期切分稀疏矩阵的行）===
+def temporal_split(X, df, test_ratio=0.3):
+    row_dates = df["trade_date"].values
+    dates = np.unique(row_dates)
     split_idx = int(len(dates) * (1 - test_ratio))
     split_date = dates[split_idx]
-    train = df[df["trade_date"] < split_date]
-    test  = df[df["trade_date"] >= split_date]
-    log(f"时间切分完成：训练集={len(train)}，测试集={len(test)}，切分点={split_date}")
-    X_train = train.drop(columns=["trade_date", "stock_code", "label"]).values
-    y_train = train["label"].values
-    X_test = test.drop(columns=["trade_date", "stock_code", "label"]).values
-    y_test = test["label"].values
+    y = df["label"].values
+
+    if isinstance(X, design.DesignMatrix):
+        # 行已按日期升序写盘：训练 / 测试是连续行区间上的视图
+        X_train, X_test = X.split(split_date)
+        k = X_train.shape[0]
+        y_train, y_test = y[:k], y[k:]
+    else:
+        train_mask = row_dates < split_date
+        X_train, y_train = X[train_mask], y[train_mask]
+        X_test, y_test = X[~train_mask], y[~train_mask]
+    log(f"时间切分完成：训练集={X_train.shape[0]}，测试集={X_test.shape[0]}，切分点={split_date}")
     return X_train, y_train, X_test, y_test, split_date
 
 
 # === 训练与评估 ===
 def train_and_eval(conn):
-    df, feature_cols = load_feature_label(conn)
-    X_train, y_train, X_test, y_test, split_date = temporal_split(df)
-
-    log("开始训练随机森林模型 ...")
-    clf = RandomForestClassifier(
-        n_estimators=500, max_depth=None, min_samples_split=4,
-        n_jobs=-1, random_state=random_state, class_weight="balanced_subsample"
-    )
-    clf.fit(X_train, y_train)
+    X, df, feature_cols = load_feature_label(conn)
+    X_train, y_train, X_test, y_test, split_date = temporal_split(X, df)
+    train_row_dates = df["trade_date"].values[:len(y_train)]
+    # 压缩选择集：训练窗口末尾一段交易日（全量分布、不参与训练）
+    X_hold = y_hold = None
+    if COMPACT and MODEL_BACKEND == "rf":
+        k = compact.holdout_start(train_row_dates)
+        X_hold, y_hold = X_train[k:], y_train[k:]
+        X_train, y_train, train_row_dates = X_train[:k], y_train[:k], train_row_dates[:k]
+        log(f"压缩选择集：训练窗口末尾 {len(y_hold):,} 行不参与训练")
+    keep, w_train, scheme = sampling.downsample(train_row_dates, y_train, NEG_RATE,
+                                                seed=random_state, weighting=NEG_WEIGHTING)
+    del X  # 之后只用切分结果（design.USE_MMAP 时为磁盘视图）
+    if scheme is None:
+        w_train = None
+    else:
+        X_train, y_train = X_train[keep], y_train[keep]
+
+    log(f"开始训练模型（后端 {MODEL_BACKEND}）...")
+    clf = backends.make(MODEL_BACKEND, **BACKEND_PARAMS.get(MODEL_BACKEND, {}))
+    clf.fit(X_train, y_train, sample_weight=w_train)
     log("训练完成")
 
     log("开始评估模型 ...")
     y_pred = clf.predict(X_test)
+    if scheme is not None:
+        y_pred = (sampling.invert(clf.predict_proba(X_test)[:, 1], scheme) >= 0.5).astype(int)
     acc = accuracy_score(y_test, y_pred)
     log(f"测试集准确率={acc:.4f}")
     print(classification_report(y_test, y_pred, digits=4))
     try:
-        y_prob = clf.predict_proba(X_test)[:, 1]
+        y_prob = sampling.invert(clf.predict_proba(X_test)[:, 1], scheme)
         auc = roc_auc_score(y_test, y_prob)
         ap = average_precision_score(y_test, y_prob)
         log(f"ROC-AUC={auc:.4f}  PR-AUC={ap:.4f}")
     except Exception as e:
         log(f"计算AUC/PR-AUC失败：{e}")
 
-    fi = pd.DataFrame({"feature": feature_cols, "importance": clf.feature_importances_}).sort_values("importance", ascending=False)
+    fi = clf.importance_frame(feature_cols)
     log("Top-30 特征重要性：")
     print(fi.head(30))
 
-    joblib.dump({"model": clf, "feature_cols": feature_cols}, MODEL_PATH)
+    joblib.dump({"model": clf.model, "feature_cols": feature_cols, "backend": clf.info(), "sampling": scheme},
+                MODEL_PATH)
     log(f"模型已保存到 {MODEL_PATH}")
 
+    if COMPACT and MODEL_BACKEND == "rf":
+        small, report = compact.compact(clf.model, X_hold, y_hold, method=COMPACT, X_fit=X_train,
+                                        X_test=X_test, y_test=y_test)
+        compact.save(MODEL_PATH, {"feature_cols": feature_cols, "backend": clf.info(), "sampling": scheme},
+                     small, report)
+        clf = small
+
     # === 训练完成后评估22组合 ===
     eval_combos(conn)
 
-    return clf, feature_cols
+    return clf, feature_cols, scheme
 
 
 # === 最新交易日预测 ===
-def predict_latest_day(conn, clf, feature_cols):
+def predict_latest_day(conn, clf, feature_cols, scheme: dict = None):
     log("开始获取最新交易日 ...")
     latest_dt = conn.execute("SELECT MAX(trade_date) FROM t_stock_signal").fetchone()[0]
     log(f"最新交易日={latest_dt}")
 
-    sig_df = pd.read_sql_query(
-        "SELECT trade_date, stock_code, signal_name, signal_value FROM t_stock_signal WHERE trade_date=?",
-        conn, params=(latest_dt,)
-    )
-    sig_df["trade_date"] = sig_df["trade_date"].astype(int)
-    sig_df["stock_code"] = sig_df["stock_code"].astype(str)
+    # 按训练列空间取当日矩阵（缺失列为 0），列顺序 = 原始信号列 + 两两组合列，与训练一致
+    s_cols = [c for c in feature_cols if c.startswith("s_")]
+    p2_cols = [c for c in feature_cols if c.startswith("p2_")]
+    X_new, dates, codes, _ = load_signals(conn, "signal", prefix="s_", trade_date=latest_dt, cols=s_cols)
+    if p2_cols:
+        X_p2, dates_p2, codes_p2, _ = load_signals(conn, "pair", prefix="p2_", trade_date=latest_dt, cols=p2_cols)
+        X_new = sparse.hstack([X_new, align_rows(X_p2, dates_p2, codes_p2, dates, codes)], format="csr")
 
-    wide = pivot_signals(sig_df, "signal_name", "signal_value", prefix="s_", use_min_df=False)
-
-    if USE_PAIR:
-        pair_df = pd.read_sql_query(
-            "SELECT trade_date, stock_code, combo_name, combo_value FROM t_stock_signal_2 WHERE trade_date=?",
-            conn, params=(latest_dt,)
-        )
-        if not pair_df.empty:
-            pair_df["trade_date"] = pair_df["trade_date"].astype(int)
-            pair_df["stock_code"] = pair_df["stock_code"].astype(str)
-            wide_p2 = pivot_signals(pair_df, "combo_name", "combo_value", prefix="p2_", use_min_df=False)
-            wide = pd.merge(wide, wide_p2, on=["trade_date", "stock_code"], how="left")
-
-    # 缺失列一次性补全
-    missing_cols = [c for c in feature_cols if c not in wide.columns]
-    if missing_cols:
-        add_df = pd.DataFrame(0.0, index=wide.index, columns=missing_cols)
-        wide = pd.concat([wide, add_df], axis=1)
-
-    wide = wide[["trade_date", "stock_code"] + feature_cols]
-    X_new = wide[feature_cols].values
-
-    proba = clf.predict_proba(X_new)[:, 1]
-    out = wide[["trade_date", "stock_code"]].copy()
+    proba = sampling.invert(clf.predict_proba(X_new)[:, 1], scheme)
+    out = pd.DataFrame({"trade_date": dates, "stock_code": codes})
     out["pred_up_prob"] = proba
     out = out.sort_values("pred_up_prob", ascending=False).reset_index(drop=True)
     print(out.head(TOPN_PREDICT))
@@ -263,6 +280,6 @@ def predict_latest_day(conn, clf, feature_cols):
 if __name__ == "__main__":
     if not Path(DB_PATH).exists():
         raise FileNotFoundError(f"数据库文件不存在：{DB_PATH}")
-    with sqlite3.connect(DB_PATH) as conn:
-        clf, feature_cols = train_and_eval(conn)
-        predict_latest_day(conn, clf, feature_cols)
+    with routed(db_path=DB_PATH) as conn:
+        clf, feature_cols, scheme = train_and_eval(conn)
+        predict_latest_day(conn, clf, feature_cols, scheme)
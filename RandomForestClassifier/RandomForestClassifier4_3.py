@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import sqlite3
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -9,6 +9,14 @@ import joblib
 import datetime
 import pickle
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import writer
+from database.partition import routed
+from database.columnar import read_frame, LABEL_DTYPES, COMBO_DTYPES
+from database import duck_engine
+from feature.pivot import pivot_frame, join_rows
+from feature import bitpack
+
 DB_PATH = r"../stock.db"   # ← 修改为你的 SQLite 文件路径
 MODEL_PATH = r"../train/rf_model_stock.pkl"
 TOPN_PREDICT = 50
@@ -24,44 +32,48 @@ def log(msg):
 
 def load_labels(conn):
     log("开始加载标签数据 t_stock_label_1 ...")
-    label_df = pd.read_sql("SELECT stock_code, trade_date, label FROM t_stock_label_1", conn)
+    label_df = read_frame(conn, "SELECT stock_code, trade_date, label FROM t_stock_label_1", dtypes=LABEL_DTYPES)
     log(f"标签数据加载完成，共 {len(label_df)} 条")
     return label_df
 
 def load_signals(conn, table_name):
     log(f"开始加载信号数据 {table_name} ...")
-    sig_df = pd.read_sql(f"""
-        SELECT stock_code, trade_date, combo_name, combo_value 
-        FROM {table_name}
-    """, conn)
+    if duck_engine.enabled():
+        # 自连接组合在 DuckDB 中多线程计算，结果与视图同结构
+        sig_df = duck_engine.signal_combos(int(table_name[-1]))
+    else:
+        sig_df = read_frame(conn, f"""
+            SELECT stock_code, trade_date, combo_name, combo_value 
+            FROM {table_name}
+        """, dtypes=COMBO_DTYPES)
     log(f"信号数据加载完成，共 {len(sig_df)} 条，组合种类={sig_df['combo_name'].nunique()}")
     # 为了统一，重命名一下列
     sig_df = sig_df.rename(columns={"combo_value": "signal_value"})
     return sig_df
 
 def pivot_signals(sig_df, prefix="s3_"):
-    log("透视组合信号为宽表 ...")
-    wide_df = sig_df.pivot_table(index=["trade_date", "stock_code"],
-                                 columns="combo_name",
-                                 values="signal_value",
-                                 fill_value=0).reset_index()
-    wide_df.columns = ["trade_date", "stock_code"] + [f"{prefix}{c}" for c in wide_df.columns[2:]]
-    log(f"透视完成，保留列数={len(wide_df.columns)-2}")
-    return wide_df
-
-def merge_data(label_df, sig_df):
-    df = pd.merge(label_df, sig_df, on=["trade_date", "stock_code"], how="inner")
+    """返回 (X, row_dates, row_codes, cols)：X 为 CSR，行按 (trade_date, stock_code) 升序"""
+    log("透视组合信号为稀疏矩阵 ...")
+    X, dates, codes, names = pivot_frame(sig_df, "combo_name", "signal_value")
+    cols = [f"{prefix}{c}" for c in names]
+    log(f"透视完成，保留列数={len(cols)}，非零元素={X.nnz}")
+    return X, dates, codes, cols
+
+def merge_data(label_df, pivoted):
+    X, dates, codes, cols = pivoted
+    df = join_rows(dates, codes, label_df)
+    X = X[df["_row"].values]
+    df = df.drop(columns="_row")
     log(f"合并完成，总样本={len(df)}")
-    return df
+    return X, df, cols
 
-def train_model(df):
-    X = df.drop(columns=["label", "trade_date", "stock_code"])
-    y = df["label"]
+def train_model(X, df):
+    y = df["label"].values
 
-    # 时间切分
+    # 时间切分（行已按日期升序）
     split_point = int(len(df) * 0.7)
-    X_train, X_test = X.iloc[:split_point], X.iloc[split_point:]
-    y_train, y_test = y.iloc[:split_point], y.iloc[split_point:]
+    X_train, X_test = X[:split_point], X[split_point:]
+    y_train, y_test = y[:split_point], y[split_point:]
 
     log("开始训练随机森林模型 ...")
     clf = RandomForestClassifier(n_estimators=100, max_depth=6, n_jobs=-1, random_state=42)
@@ -80,56 +92,57 @@ def train_model(df):
 
     return clf, X_test, y_test
 
-def evaluate_combos(clf, X_test, y_test, conn, combo_type="p3"):
-    cur = conn.cursor()
+def evaluate_combos(clf, X_test, y_test, cols, conn, combo_type="p3"):
     saved_count = 0
+    # 各列命中数与命中中的正例数：位压缩后 popcount 一次算完
+    B = bitpack.from_csr(X_test)
+    support, pos, _ = B.hit_rate(y_test)
+    with writer(DB_PATH) as wconn:
+        cur = wconn.cursor()
+        for j, col in enumerate(cols):
+            if not (col.startswith("s3_") or col.startswith("p3_")):
+                continue
+
+            # 自动去掉前缀
+            combo = col.split("_", 1)[1]
+            if support[j] < 100:
+                continue
+            active_idx = B.nonzero_rows(j)
 
-    for col in X_test.columns:
-        if not (col.startswith("s3_") or col.startswith("p3_")):
-            continue
-
-        # 自动去掉前缀
-        combo = col.split("_", 1)[1]
-        active_idx = X_test.index[X_test[col] > 0]
-
-        if len(active_idx) < 100:
-            continue
-
-        try:
-            preds = clf.predict(X_test.loc[active_idx])
-            probs = clf.predict_proba(X_test.loc[active_idx])[:, 1]
-
-            acc = accuracy_score(y_test.loc[active_idx], preds)
-            try:
-                auc = roc_auc_score(y_test.loc[active_idx], probs)
-            except ValueError:
-                auc = 0.5
             try:
-                pr_auc = average_precision_score(y_test.loc[active_idx], probs)
-            except ValueError:
-                pr_auc = 0.0
-
-            pos_rate = float(np.mean(y_test.loc[active_idx]))
-
-            cur.execute("""
-                INSERT INTO t_combo_eval (combo_type, combo_name, n_samples, accuracy, auc, pr_auc, pos_rate)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                combo_type,
-                combo,
-                int(len(active_idx)),
-                float(acc),
-                float(auc),
-                float(pr_auc),
-                float(pos_rate)
-            ))
-
-            saved_count += 1
-
-        except Exception as e:
-            print(f"[WARN] 评估组合 {combo} 失败: {e}")
-
-    conn.commit()
+                preds = clf.predict(X_test[active_idx])
+                probs = clf.predict_proba(X_test[active_idx])[:, 1]
+
+                acc = accuracy_score(y_test[active_idx], preds)
+                try:
+                    auc = roc_auc_score(y_test[active_idx], probs)
+                except ValueError:
+                    auc = 0.5
+                try:
+                    pr_auc = average_precision_score(y_test[active_idx], probs)
+                except ValueError:
+                    pr_auc = 0.0
+
+                pos_rate = float(pos[j] / support[j])
+
+                cur.execute("""
+                    INSERT INTO t_combo_eval (combo_type, combo_name, n_samples, accuracy, auc, pr_auc, pos_rate)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    combo_type,
+                    combo,
+                    int(len(active_idx)),
+                    float(acc),
+                    float(auc),
+                    float(pr_auc),
+                    float(pos_rate)
+                ))
+
+                saved_count += 1
+
+            except Exception as e:
+                print(f"[WARN] 评估组合 {combo} 失败: {e}")
+
     print(f"[INFO] 评估完成，共保存 {saved_count} 条记录")
     df_eval = pd.read_sql("""
         SELECT combo_name, n_samples, accuracy, auc, pr_auc, pos_rate
@@ -143,8 +156,11 @@ def evaluate_combos(clf, X_test, y_test, conn, combo_type="p3"):
     print(df_eval.to_string(index=False))
 
 def main():
-    conn = sqlite3.connect(DB_PATH)
+    with routed(db_path=DB_PATH) as conn:
+        _main(conn)
 
+
+def _main(conn):
     # 1) 筛选符合条件的 p2 组合
     log("筛选符合条件的 22 组合 ...")
     combo22_df = pd.read_sql("""
@@ -162,20 +178,18 @@ def main():
     sig3_df = sig3_df[sig3_df["combo_name"].apply(lambda x: any(c in x for c in valid_combos))]
     log(f"过滤后的三三组合记录数={len(sig3_df)}")
 
-    # 3) 转宽表
-    sig3_wide = pivot_signals(sig3_df, prefix="s3_")
+    # 3) 转稀疏矩阵
+    sig3 = pivot_signals(sig3_df, prefix="s3_")
 
     # 4) 合并标签
     label_df = load_labels(conn)
-    df = merge_data(label_df, sig3_wide)
+    X, df, cols = merge_data(label_df, sig3)
 
     # 5) 训练模型
-    clf, X_test, y_test = train_model(df)
+    clf, X_test, y_test = train_model(X, df)
 
     # 6) 评估 p3 组合
-    evaluate_combos(clf, X_test, y_test, conn)
-
-    conn.close()
+    evaluate_combos(clf, X_test, y_test, cols, conn)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite → NumPy 列式加载器（替代热点路径上的 pd.read_sql_query）
+- 按 chunk_size 分块 fetchmany，每块直接转成定型的 NumPy 列，不再先建逐格 Python 对象的 DataFrame
+- 文本列边读边做字典编码：列值为 int32 编码，另返回一份去重后的字典（编码 → 字符串）
+- dtypes 预先声明，读完即是目标类型，无需事后 astype(int) / astype(str)
+
+用法：
+    from database.columnar import fetch_columns, read_frame, SIGNAL_DTYPES
+    cols, dicts = fetch_columns(conn, "SELECT ... FROM t_stock_signal", dtypes=SIGNAL_DTYPES)
+    cols["stock_code"]           # int32 编码
+    dicts["stock_code"]          # 编码 → 股票代码
+    sig_df = read_frame(conn, "SELECT ... FROM t_stock_signal", dtypes=SIGNAL_DTYPES)
+"""
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 500000     # 每次 fetchmany 的行数
+TEXT = "str"            # dtypes 中声明为文本（字典编码）的写法
+NULL_INT = -1           # 整数列遇到 NULL 时的填充值
+
+# ===== 常用表的列类型 =====
+SIGNAL_DTYPES = {"trade_date": "int64", "stock_code": TEXT, "signal_name": TEXT, "signal_value": "float64"}
+COMBO_DTYPES = {"trade_date": "int64", "stock_code": TEXT, "combo_name": TEXT, "combo_value": "float64"}
+LABEL_DTYPES = {"trade_date": "int64", "stock_code": TEXT, "label": "int8"}
+FEAT_DTYPES = {"trade_date": "int64", "stock_code": TEXT,
+               "turnover": "float64", "amplitude": "float64", "pct_chg": "float64"}
+
+
+def _infer(value):
+    """未声明类型的列，按首个非空值推断"""
+    if isinstance(value, str):
+        return TEXT
+    if isinstance(value, int):
+        return "int64"
+    return "float64"
+
+
+def _is_text(dtype) -> bool:
+    return dtype in (TEXT, str, object, "object", "category")
+
+
+def _to_numeric(values: np.ndarray, dtype):
+    try:
+        return values.astype(dtype)
+    except TypeError:
+        # 含 NULL：浮点列填 NaN，整数列填 NULL_INT
+        fill = np.nan if np.dtype(dtype).kind == "f" else NULL_INT
+        return np.where(values == None, fill, values).astype(dtype)  # noqa: E711
+
+
+def _encode(values: np.ndarray, lut: dict) -> np.ndarray:
+    """块内先 factorize（C 实现的哈希），再把块内字典映射到全局编码，Python 层只遍历去重值"""
+    local, uniques = pd.factorize(values, use_na_sentinel=True)
+    remap = np.fromiter((lut.setdefault(u, len(lut)) for u in uniques), dtype=np.int32, count=len(uniques))
+    codes = remap.take(local) if len(remap) else np.full(len(local), NULL_INT, dtype=np.int32)
+    codes[local < 0] = NULL_INT
+    return codes
+
+
+def fetch_columns(conn, sql: str, params=(), dtypes=None, chunk_size: int = CHUNK_SIZE):
+    """
+    分块读取查询结果为列式数组
+    返回：
+        cols : {列名: ndarray}，文本列为 int32 编码（NULL 编为 -1）
+        dicts: {文本列名: ndarray[object]}，编码对应的原始字符串
+    """
+    cur = conn.execute(sql, params)
+    names = [d[0] for d in cur.description]
+    dtypes = dict(dtypes or {})
+
+    lookups = {}                            # 文本列：字符串 → 编码
+    parts = {n: [] for n in names}
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        for j, name in enumerate(names):
+            # 按列取出本块的值（zip(*rows) 转置在大块上明显更慢）
+            values = np.fromiter(map(itemgetter(j), rows), dtype=object, count=len(rows))
+            if name not in dtypes:
+                # 首块全为 NULL 的未声明列按 float64 处理，要读文本请在 dtypes 中声明
+                first = next((v for v in values if v is not None), 0.0)
+                dtypes[name] = _infer(first)
+            if _is_text(dtypes[name]):
+                parts[name].append(_encode(values, lookups.setdefault(name, {})))
+            else:
+                parts[name].append(_to_numeric(values, dtypes[name]))
+
+    cols, dicts = {}, {}
+    for name in names:
+        dtype = dtypes.get(name, "float64")
+        if _is_text(dtype):
+            cols[name] = np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=np.int32)
+            dicts[name] = np.array(list(lookups.get(name, {})), dtype=object)
+        else:
+            cols[name] = np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)
+    return cols, dicts
+
+
+def decode(codes: np.ndarray, dictionary: np.ndarray) -> np.ndarray:
+    """编码还原为字符串数组（NULL 编码还原为 None）"""
+    out = dictionary.take(np.where(codes < 0, 0, codes)) if len(dictionary) else np.full(len(codes), None)
+    if (codes < 0).any():
+        out = out.astype(object)
+        out[codes < 0] = None
+    return out
+
+
+def read_frame(conn, sql: str, params=(), dtypes=None, chunk_size: int = CHUNK_SIZE,
+               categorical: bool = False) -> pd.DataFrame:
+    """
+    pd.read_sql_query 的替代：列类型读完即定型
+    categorical=True 时文本列保留为 pd.Categorical（编码 + 字典，不展开成字符串）
+    """
+    cols, dicts = fetch_columns(conn, sql, params=params, dtypes=dtypes, chunk_size=chunk_size)
+    data = {}
+    for name, arr in cols.items():
+        if name not in dicts:
+            data[name] = arr
+        elif categorical:
+            data[name] = pd.Categorical.from_codes(arr, categories=dicts[name])
+        else:
+            data[name] = decode(arr, dicts[name])
+    return pd.DataFrame(data, columns=list(cols))
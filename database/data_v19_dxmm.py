@@ -3,17 +3,16 @@
 从 SQLite 读取 v1..v19（二元特征）和未来收益，构造标签 y（任一 >1.5% 即正例），
 进行时序切分训练并评估多种 ML 模型（L1-Logistic / RandomForest / GradientBoosting），
 输出特征重要性、树规则（人类可读）、并把预测概率写回 SQLite。
+各模型族由 model.scheduler 并发训练（共享内存上的训练 / 测试矩阵，按成本估计分配核数），预测表与融合分数一次写回。
 """
 import os
-import sqlite3
+import sys
+import json
+from pathlib import Path
 import numpy as np
 import pandas as pd
 
-from sklearn.model_selection import TimeSeriesSplit, train_test_split, GridSearchCV
-from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LogisticRegression
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.pipeline import Pipeline
+from sklearn.model_selection import TimeSeriesSplit, train_test_split, GridSearchCV, ParameterGrid
 from sklearn.metrics import (
     classification_report, confusion_matrix, roc_auc_score,
     average_precision_score, precision_recall_curve
@@ -21,6 +20,16 @@ from sklearn.metrics import (
 from sklearn.tree import _tree, DecisionTreeClassifier
 import joblib
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import reader, writer
+from database.columnar import read_frame, TEXT
+from feature.pivot import join_rows
+from feature import store, bitpack
+from model.halving import FoldCache, HalvingSearch
+from model import backends
+from model import sampling
+from model import scheduler
+
 # ========= 可配置 =========
 DB_PATH = r"../stock.db"  # SQLite 数据库文件
 TABLE = "t_signal"                    # 数据表
@@ -33,22 +42,81 @@ RET_COLS = ["v_1_percent", "v_2_percent", "v_3_percent"]
 TRAIN_END = 20231231                  # 根据你的数据范围调整
 VAL_RATIO = 0.2                       # 如果不指定 TRAIN_END，可用随机划分验证集
 
+# 超参搜索："halving" = 有预算的逐次减半（model.halving，结果按数据版本缓存在 t_search_trial，重跑跳过已完成的折）；
+# "grid" = 原来的穷举 GridSearchCV
+SEARCH = "halving"
+N_SPLITS = 5
+SEARCH_BUDGET_S = {"L1-Logistic": 10 * 60, "RandomForest": 40 * 60, "GBDT": 40 * 60}   # 各模型搜索墙钟预算
+
+# 模型后端（model.backends）：三个模型族各用哪个后端；换成更快的实现只需改这里，
+# 如 "GBDT": "hist_gbdt"（直方图 + 多线程）或 "lgbm"
+MODEL_BACKENDS = {"L1-Logistic": "l1_logistic", "RandomForest": "rf", "GBDT": "gbdt"}
+BACKEND_PARAMS = {
+    "l1_logistic": dict(C=0.1, max_iter=2000, class_weight="balanced"),
+    "rf": dict(n_estimators=500, max_depth=None, min_samples_leaf=5, n_jobs=-1,
+               class_weight="balanced_subsample", random_state=42),
+    "gbdt": dict(learning_rate=0.05, n_estimators=400, max_depth=3, subsample=0.9),
+    "hist_gbdt": dict(learning_rate=0.05, max_iter=400, max_depth=3, random_state=42),
+    "lgbm": dict(learning_rate=0.05, n_estimators=400, num_leaves=8, subsample=0.9, subsample_freq=1),
+}
+PARAM_GRIDS = {
+    "l1_logistic": {"clf__C": [0.02, 0.05, 0.1, 0.2, 0.5, 1.0]},
+    "rf": {"n_estimators": [300, 500], "min_samples_leaf": [3, 5, 10], "max_depth": [None, 6, 10]},
+    "gbdt": {"learning_rate": [0.03, 0.05, 0.08], "n_estimators": [300, 400, 600], "max_depth": [2, 3]},
+    "hist_gbdt": {"learning_rate": [0.03, 0.05, 0.08], "max_iter": [300, 400, 600], "max_depth": [2, 3]},
+    "lgbm": {"learning_rate": [0.03, 0.05, 0.08], "n_estimators": [300, 400, 600], "num_leaves": [4, 8]},
+}
+
+# 训练集负例按日降采样（model.sampling）：每日保留全部正例与 NEG_RATE 比例的负例，测试集全量评估；
+# "weight" 负例权重 1/NEG_RATE（拟合、搜索各折、重训都带权重），概率直接可用；
+# "none" 不加权，测试概率按采样方案还原后再评估、写库。
+# 逐次减半搜索的验证折取全量训练行（只对各折的拟合区间采样）；SEARCH="grid" 时 GridSearchCV 的折在采样后的行上切分
+NEG_RATE = 1.0                        # 1.0 = 不采样
+NEG_WEIGHTING = "none"
+
+# 模型族并发训练（model.scheduler）：各模型族在独立进程中同时训练，训练 / 测试矩阵放共享内存（只读，不复制）；
+# 核数按成本估计（单次拟合相对耗时 × 候选数 × 折数）分配，单线程后端（gbdt / l1_logistic）只占 1 核
+CPU_BUDGET = os.cpu_count() or 1
+N_WORKERS = None                      # 进程数；None 时为 min(CPU_BUDGET, 模型族数)，1 = 当前进程内依次训练
+FIT_COST = {"l1_logistic": 1, "rf": 20, "gbdt": 12, "hist_gbdt": 3, "lgbm": 2, "tree": 0.2}  # 单次拟合相对耗时
+FAMILIES = {                          # 模型族 → (预测表 pred_<缩写>_test, 模型文件)
+    "L1-Logistic": ("logi", "logi_l1.joblib"),
+    "RandomForest": ("rf", "rf.joblib"),
+    "GBDT": ("gbdt", "gbdt.joblib"),
+    "Tree": ("tree", "tree_depth3.joblib"),   # 小深度决策树：可解释规则
+}
+BLEND = ["L1-Logistic", "RandomForest", "GBDT"]   # 融合分数（简单平均）的成员
+
 # 结果输出
 MODEL_DIR = "models"
 os.makedirs(MODEL_DIR, exist_ok=True)
 
 # ========= 1) 读取 & 生成标签 =========
-def load_from_sqlite(db_path: str, table: str) -> pd.DataFrame:
-    conn = sqlite3.connect(db_path)
-    try:
-        df = pd.read_sql_query(f"SELECT {','.join(ID_COLS + V_COLS + RET_COLS)} FROM {table}", conn)
-    finally:
-        conn.close()
+def load_from_sqlite(db_path: str, table: str):
+    """
+    返回 (X, df)：X 为 v1..v19 的位压缩矩阵 bitpack.BitMatrix（来源为特征仓库 feature.store 的 "v19"，
+    按交易日分区缓存），df 为与 X 行对齐的 code, trade_date, 收益列, y，按 (trade_date, code) 升序
+    """
+    with reader(db_path) as conn:
+        X, dates, codes, _ = store.load(conn, "v19", cols=V_COLS)
+        ret = read_frame(conn, f"SELECT code AS stock_code, {DATE_COL}, {','.join(RET_COLS)} FROM {table}",
+                         dtypes={"stock_code": TEXT, DATE_COL: "int64"})
+    # 两侧代码统一成字符串（code 列存成整数时，字典编码保留原类型，与特征仓库的字符串代码对不上会得到空表）
+    ret["stock_code"] = ret["stock_code"].astype(str)
+    codes = np.asarray(codes).astype(str)
+    # 源表同一 (code, trade_date) 有重复行时保留最后一条（特征仓库每个 (日, 股) 只有一行）
+    dup = ret.duplicated(["stock_code", DATE_COL], keep="last")
+    if dup.any():
+        print(f"[load] {table} 中 {int(dup.sum()):,} 行 (code, {DATE_COL}) 重复，已去重（保留最后一条）")
+        ret = ret[~dup]
+    df = join_rows(dates, codes, ret)
+    if df.empty and len(ret):
+        raise RuntimeError(f"{table} 与特征仓库 v19 的 (code, {DATE_COL}) 无一匹配，请检查代码格式（如前导 0）")
+    X = bitpack.from_csr(X[df["_row"].values], V_COLS)
+    df = df.drop(columns="_row").rename(columns={"stock_code": "code"})
     # 标签：任一 > 1.5
     df["y"] = (df["v_1_percent"] > 1.5) | (df["v_2_percent"] > 1.5) | (df["v_3_percent"] > 1.5)
-    # 排序（时序）
-    df = df.sort_values(DATE_COL).reset_index(drop=True)
-    return df
+    return X, df
 
 # ========= 2) 时序切分 =========
 def time_split(df: pd.DataFrame, train_end: int = None, val_ratio: float = 0.2):
@@ -60,53 +128,25 @@ def time_split(df: pd.DataFrame, train_end: int = None, val_ratio: float = 0.2):
     return train, test
 
 # ========= 3) 模型们 =========
-def build_l1_logistic():
-    # 二元特征也建议标准化（让 C 的尺度更合理）
-    pipe = Pipeline([
-        ("scaler", StandardScaler(with_mean=False)),  # v 是 0/1，with_mean=False 保持稀疏友好
-        ("clf", LogisticRegression(
-            penalty="l1", solver="liblinear", max_iter=2000, class_weight="balanced"
-        ))
-    ])
-    params = {
-        "clf__C": [0.02, 0.05, 0.1, 0.2, 0.5, 1.0]
-    }
-    return pipe, params
-
-def build_random_forest():
-    clf = RandomForestClassifier(
-        n_estimators=500,
-        max_depth=None,
-        min_samples_leaf=5,
-        n_jobs=-1,
-        class_weight="balanced_subsample",
-        random_state=42
-    )
-    params = {
-        "n_estimators": [300, 500],
-        "min_samples_leaf": [3, 5, 10],
-        "max_depth": [None, 6, 10]
-    }
-    return clf, params
-
-def build_gbdt():
-    clf = GradientBoostingClassifier(
-        learning_rate=0.05,
-        n_estimators=400,
-        max_depth=3,
-        subsample=0.9
-    )
-    params = {
-        "learning_rate": [0.03, 0.05, 0.08],
-        "n_estimators": [300, 400, 600],
-        "max_depth": [2, 3]
-    }
-    return clf, params
+def build_model(family: str):
+    """返回 (未拟合估计器, 参数网格)；估计器由 MODEL_BACKENDS[family] 指定的后端构造"""
+    name = MODEL_BACKENDS[family]
+    return backends.make(name, **BACKEND_PARAMS.get(name, {})).model, PARAM_GRIDS[name]
+
+def make_search(model, params, name: str, folds: FoldCache, n_jobs: int = -1, weight_key: str = "sample_weight"):
+    if SEARCH == "grid":
+        return GridSearchCV(model, params, scoring="average_precision",
+                            cv=TimeSeriesSplit(n_splits=N_SPLITS), n_jobs=n_jobs, verbose=0)
+    return HalvingSearch(model, params, folds=folds, scoring="average_precision", name=name,
+                         budget_s=SEARCH_BUDGET_S.get(name), db_path=DB_PATH, weight_key=weight_key)
 
 # ========= 4) 评估 =========
-def evaluate(model, X_tr, y_tr, X_te, y_te, name: str):
-    model.fit(X_tr, y_tr)
-    proba_te = model.predict_proba(X_te)[:, 1] if hasattr(model, "predict_proba") else model.decision_function(X_te)
+def evaluate(model, X_tr, y_tr, X_te, y_te, name: str, scheme: dict = None, fit_kw: dict = None):
+    model.fit(X_tr, y_tr, **(fit_kw or {}))
+    if hasattr(model, "predict_proba"):
+        proba_te = sampling.invert(model.predict_proba(X_te)[:, 1], scheme)     # 还原到全量分布的概率
+    else:
+        proba_te = model.decision_function(X_te)
     pred_te = (proba_te >= 0.5).astype(int)
 
     print(f"\n=== {name} / Test Metrics ===")
@@ -155,102 +195,129 @@ def extract_rules_from_tree(tree_clf: DecisionTreeClassifier, feature_names, top
     paths.sort(key=lambda x: (x[0], x[1]), reverse=True)
     return paths[:top_k]
 
-# ========= 6) 写回 SQLite =========
-def write_predictions_to_sqlite(db_path, table_out, df_keys, proba, pred):
-    out = df_keys.copy()
-    out["proba"] = proba
-    out["pred"] = pred
-    conn = sqlite3.connect(db_path)
-    try:
-        out.to_sql(table_out, conn, if_exists="replace", index=False)
-    finally:
-        conn.close()
-    print(f"[OK] 预测结果写入 SQLite 表：{table_out}（{len(out)} 行）")
+# ========= 6) 模型族任务（model.scheduler 子进程中执行）=========
+def family_cost(family: str) -> float:
+    """成本估计：单次拟合相对耗时 × 搜索候选数 × 折数（浅树只拟合一次）"""
+    if family == "Tree":
+        return FIT_COST["tree"]
+    name = MODEL_BACKENDS[family]
+    return FIT_COST.get(name, 1) * len(ParameterGrid(PARAM_GRIDS[name])) * N_SPLITS
+
+def family_threaded(family: str) -> bool:
+    """网格搜索按候选并行；逐次减半按候选串行，能否多线程取决于后端"""
+    if family == "Tree":
+        return False
+    return SEARCH == "grid" or backends.BACKENDS[MODEL_BACKENDS[family]].threaded
+
+def _set_threads(model, n: int):
+    """估计器（含 Pipeline 内步骤）的 n_jobs 设为 n"""
+    keys = [k for k in model.get_params(deep=True) if k == "n_jobs" or k.endswith("__n_jobs")]
+    if keys:
+        model.set_params(**{k: n for k in keys})
+
+def fit_family(arrays: dict, threads: int, family: str, scheme: dict = None):
+    """
+    单个模型族：搜索 + 测试集评估 + 保存模型，返回测试集 (proba, pred)；arrays 为共享内存上的只读视图
+    X_tr / y_tr 为全量训练行，keep / w_tr 为负例降采样保留的行号与权重（weighting="none" 时权重全为 1，不传给模型）
+    """
+    X_tr, y_tr, X_te, y_te = arrays["X_tr"], arrays["y_tr"], arrays["X_te"], arrays["y_te"]
+    keep = None if scheme is None else arrays["keep"]
+    w = arrays["w_tr"] if scheme and scheme.get("weighting") == "weight" else None
+    X_fit, y_fit = (X_tr, y_tr) if keep is None else (X_tr[keep], y_tr[keep])      # 不采样时不复制
+    path = os.path.join(MODEL_DIR, FAMILIES[family][1])
+
+    if family == "Tree":
+        # 小深度决策树，用于“可解释规则提取”
+        dt = DecisionTreeClassifier(
+            max_depth=3, min_samples_leaf=30, class_weight="balanced", random_state=42
+        )
+        dt.fit(X_fit, y_fit, sample_weight=w)
+        rules = extract_rules_from_tree(dt, V_COLS, top_k=15)
+        print("\n=== Top Rules from shallow DecisionTree (depth<=3) ===")
+        for i, (prec, total, rule) in enumerate(rules, 1):
+            print(f"{i:02d}. precision={prec:.3f} support={total}  |  {rule}")
+        joblib.dump(dt, path)
+        proba = sampling.invert(dt.predict_proba(X_te)[:, 1], scheme)
+        return proba, (proba >= 0.5).astype(int)
+
+    # 折缓存建在共享内存视图上（全量训练行，验证折不采样；各折拟合区间按 keep 取行），该模型族的所有候选共用
+    model, params = build_model(family)
+    weight_key = backends.BACKENDS[MODEL_BACKENDS[family]].weight_key
+    _set_threads(model, 1 if SEARCH == "grid" else threads)     # 网格搜索时并行放在候选层
+    folds = FoldCache(X_tr, y_tr, n_splits=N_SPLITS, keep=keep, sample_weight=w)
+    gs = make_search(model, params, family, folds, n_jobs=threads, weight_key=weight_key)
+    if SEARCH == "grid":
+        # GridSearchCV 直接在采样后的行上切折（验证折也是采样后的分布）
+        fit_kw = {} if w is None else {weight_key: w}
+        fitted, proba, pred = evaluate(gs, X_fit, y_fit, X_te, y_te, family, scheme, fit_kw)
+    else:
+        fitted, proba, pred = evaluate(gs, X_tr, y_tr, X_te, y_te, family, scheme)
+    print(f"Best {family} params:", fitted.best_params_)
+    if family == "L1-Logistic":
+        # 提取稀疏系数
+        coef = backends.wrap(MODEL_BACKENDS[family], fitted.best_estimator_).importances()
+        sel = np.where(coef > 1e-8)[0]
+        print("Selected features by L1:", [V_COLS[i] for i in sel])
+    elif family == "RandomForest":
+        imp_df = backends.wrap(MODEL_BACKENDS[family], fitted.best_estimator_).importance_frame(V_COLS)
+        print("\nTop Feature Importances (RF):\n", imp_df.head(10).to_string(index=False))
+    joblib.dump(fitted, path)
+    return proba, pred
+
+# ========= 7) 写回 SQLite =========
+def write_predictions_to_sqlite(db_path, df_keys, outputs: dict):
+    """{表名: (proba, pred)} 在一个写事务中全部写回（各表整表替换）"""
+    keys = list(zip(df_keys["code"].astype(str), df_keys[DATE_COL].astype("int64").tolist()))
+    with writer(db_path) as conn:
+        for table_out, (proba, pred) in outputs.items():
+            conn.execute(f'DROP TABLE IF EXISTS "{table_out}"')
+            conn.execute(f'CREATE TABLE "{table_out}" (code TEXT, {DATE_COL} INTEGER, proba REAL, pred INTEGER)')
+            conn.executemany(f'INSERT INTO "{table_out}" VALUES (?,?,?,?)',
+                             [(c, d, float(p), int(q)) for (c, d), p, q in zip(keys, proba, pred)])
+    for table_out in outputs:
+        print(f"[OK] 预测结果写入 SQLite 表：{table_out}（{len(keys)} 行）")
 
 # ========= main =========
 def main():
-    df = load_from_sqlite(DB_PATH, TABLE)
-    X = df[V_COLS].astype(float).values
+    X, df = load_from_sqlite(DB_PATH, TABLE)
     y = df["y"].astype(int).values
 
-    # 时序切分
+    # 时序切分（df 的索引即 X 的行号）
     train_df, test_df = time_split(df, TRAIN_END, VAL_RATIO)
-    X_tr = train_df[V_COLS].astype(float).values
     y_tr = train_df["y"].astype(int).values
-    X_te = test_df[V_COLS].astype(float).values
     y_te = test_df["y"].astype(int).values
 
-    print(f"Train size: {len(train_df)}, Test size: {len(test_df)}")
+    # 训练集各特征命中统计：直接在压缩位上 popcount（df 按日期升序，训练集是前缀行）
+    support, pos, rate = X.rows(0, len(train_df)).hit_rate(y_tr)
+    stat_df = pd.DataFrame({"feature": V_COLS, "support": support, "pos": pos, "hit_rate": rate})
+    print("\nFeature hit stats (train):\n", stat_df.to_string(index=False))
+
+    # 训练集负例按日降采样（命中统计仍按全量训练集）：拟合只用保留的行（带校正权重），
+    # 逐次减半搜索的验证折仍取全量训练行，所以训练矩阵整段展开，保留行号与权重随矩阵一起进共享内存
+    keep, w_tr, scheme = sampling.downsample(train_df[DATE_COL].values, y_tr, NEG_RATE, weighting=NEG_WEIGHTING)
+    if scheme is not None:
+        with open(os.path.join(MODEL_DIR, "sampling.json"), "w", encoding="utf-8") as f:
+            json.dump(scheme, f, ensure_ascii=False, indent=2)
+
+    # 模型边界才展开成 float32
+    X_tr = X.take(train_df.index.values, np.float32)
+    X_te = X.take(test_df.index.values, np.float32)
+
+    print(f"Train size: {len(train_df)}（采样后 {len(keep)}）, Test size: {len(test_df)}")
     print("Base rate (train):", train_df["y"].mean(), " | (test):", test_df["y"].mean())
 
-    # ===== 模型1：L1 Logistic（做特征选择 + 概率）=====
-    logi_pipe, logi_params = build_l1_logistic()
-    gs_logi = GridSearchCV(
-        logi_pipe, logi_params,
-        scoring="average_precision",
-        cv=TimeSeriesSplit(n_splits=5),
-        n_jobs=-1, verbose=0
-    )
-    model_logi, proba_logi, pred_logi = evaluate(gs_logi, X_tr, y_tr, X_te, y_te, "L1-Logistic")
-    print("Best C:", model_logi.best_params_)
-    # 提取稀疏系数
-    best_logi = model_logi.best_estimator_.named_steps["clf"]
-    coef = best_logi.coef_.ravel()
-    sel = np.where(np.abs(coef) > 1e-8)[0]
-    print("Selected features by L1:", [V_COLS[i] for i in sel])
-
-    joblib.dump(model_logi, os.path.join(MODEL_DIR, "logi_l1.joblib"))
-
-    # ===== 模型2：RandomForest（非线性、鲁棒，提供重要性）=====
-    rf, rf_params = build_random_forest()
-    gs_rf = GridSearchCV(
-        rf, rf_params,
-        scoring="average_precision",
-        cv=TimeSeriesSplit(n_splits=5),
-        n_jobs=-1, verbose=0
-    )
-    model_rf, proba_rf, pred_rf = evaluate(gs_rf, X_tr, y_tr, X_te, y_te, "RandomForest")
-    print("Best RF params:", model_rf.best_params_)
-    best_rf = model_rf.best_estimator_
-    importances = best_rf.feature_importances_
-    imp_df = pd.DataFrame({"feature": V_COLS, "importance": importances}).sort_values("importance", ascending=False)
-    print("\nTop Feature Importances (RF):\n", imp_df.head(10).to_string(index=False))
-    joblib.dump(model_rf, os.path.join(MODEL_DIR, "rf.joblib"))
-
-    # ===== 模型3：GradientBoosting（精细拟合）=====
-    gbdt, gbdt_params = build_gbdt()
-    gs_gbdt = GridSearchCV(
-        gbdt, gbdt_params,
-        scoring="average_precision",
-        cv=TimeSeriesSplit(n_splits=5),
-        n_jobs=-1, verbose=0
-    )
-    model_gbdt, proba_gbdt, pred_gbdt = evaluate(gs_gbdt, X_tr, y_tr, X_te, y_te, "GBDT")
-    print("Best GBDT params:", model_gbdt.best_params_)
-    joblib.dump(model_gbdt, os.path.join(MODEL_DIR, "gbdt.joblib"))
-
-    # ===== 额外：小深度决策树，用于“可解释规则提取”=====
-    dt = DecisionTreeClassifier(
-        max_depth=3, min_samples_leaf=30, class_weight="balanced", random_state=42
-    )
-    dt.fit(X_tr, y_tr)
-    rules = extract_rules_from_tree(dt, V_COLS, top_k=15)
-    print("\n=== Top Rules from shallow DecisionTree (depth<=3) ===")
-    for i, (prec, total, rule) in enumerate(rules, 1):
-        print(f"{i:02d}. precision={prec:.3f} support={total}  |  {rule}")
-
-    joblib.dump(dt, os.path.join(MODEL_DIR, "tree_depth3.joblib"))
-
-    # ===== 写回 SQLite：各模型在测试集上的预测 =====
-    keys_test = test_df[ID_COLS].copy()
-    write_predictions_to_sqlite(DB_PATH, "pred_logi_test", keys_test, proba_logi, pred_logi)
-    write_predictions_to_sqlite(DB_PATH, "pred_rf_test",   keys_test, proba_rf,   pred_rf)
-    write_predictions_to_sqlite(DB_PATH, "pred_gbdt_test", keys_test, proba_gbdt, pred_gbdt)
-
-    # ===== 保存一个融合分数（简单平均）=====
-    blend_proba = (proba_logi + proba_rf + proba_gbdt) / 3.0
-    blend_pred = (blend_proba >= 0.5).astype(int)
-    write_predictions_to_sqlite(DB_PATH, "pred_blend_test", keys_test, blend_proba, blend_pred)
+    # ===== 各模型族并发训练：训练 / 测试矩阵放共享内存，核数按成本估计分配，墙钟时间约为最慢的模型族 =====
+    tasks = [{"name": f, "cost": family_cost(f), "threaded": family_threaded(f),
+              "args": {"family": f, "scheme": scheme}} for f in FAMILIES]
+    res = scheduler.run(fit_family, tasks, {"X_tr": X_tr, "y_tr": y_tr, "X_te": X_te, "y_te": y_te,
+                                            "keep": keep, "w_tr": w_tr},
+                        cpu_budget=CPU_BUDGET, n_workers=N_WORKERS)
+
+    # ===== 写回 SQLite：各模型在测试集上的预测 + 融合分数（简单平均），一个写事务 =====
+    outputs = {f"pred_{FAMILIES[f][0]}_test": res[f] for f in FAMILIES}
+    blend_proba = np.mean([res[f][0] for f in BLEND], axis=0)
+    outputs["pred_blend_test"] = (blend_proba, (blend_proba >= 0.5).astype(int))
+    write_predictions_to_sqlite(DB_PATH, test_df[ID_COLS], outputs)
 
     print("\n[Done] 模型与预测结果已生成。你可以在 SQLite 中用阈值/排序做选股或回测。")
 
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite 统一访问层（database / validate / RandomForestClassifier 共用）
+- reader()   ：只读连接池（query_only + mmap + 大缓存），连接复用，不再每次 connect/close
+- writer()   ：单写连接（WAL + synchronous=NORMAL），进程内串行写入
+- bulk_load()：批量导入模式，临时放宽持久性，并把二级索引推迟到导入结束后重建
+
+用法：
+    from database.db import reader, writer, bulk_load
+    with reader(DB_PATH) as conn:
+        df = pd.read_sql_query("SELECT ...", conn)
+    with writer(DB_PATH) as conn:
+        conn.execute("INSERT ...")          # 退出时自动 commit，异常时 rollback
+    with bulk_load(DB_PATH, tables=["t_stock_signal"]) as conn:
+        conn.executemany("INSERT ...", rows)
+"""
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# 默认库文件：仓库根目录下的 stock.db（与各脚本里的 ../stock.db 指向同一个文件）
+DB_PATH = str(Path(__file__).resolve().parents[1] / "stock.db")
+
+READER_POOL_SIZE = 4            # 每个库最多缓存的只读连接数
+MMAP_SIZE = 30000000000         # 可按机器内存调整（30GB 示例，超出编译上限时 SQLite 自动截断）
+READ_CACHE_KB = 500000          # 只读连接缓存，约 500MB
+WRITE_CACHE_KB = 200000         # 写连接缓存，约 200MB
+BUSY_TIMEOUT_MS = 30000
+
+_READ_PRAGMAS = (
+    "PRAGMA query_only=ON;",
+    "PRAGMA temp_store=MEMORY;",
+    f"PRAGMA mmap_size={MMAP_SIZE};",
+    f"PRAGMA cache_size=-{READ_CACHE_KB};",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};",
+)
+
+_WRITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    f"PRAGMA mmap_size={MMAP_SIZE};",
+    f"PRAGMA cache_size=-{WRITE_CACHE_KB};",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};",
+)
+
+_BULK_PRAGMAS = (
+    "PRAGMA journal_mode=OFF;",
+    "PRAGMA synchronous=OFF;",
+)
+
+_lock = threading.Lock()
+_pools = {}         # abs_path -> queue.LifoQueue[sqlite3.Connection]
+_writers = {}       # abs_path -> sqlite3.Connection
+_write_locks = {}   # abs_path -> threading.RLock
+
+
+def _key(db_path) -> str:
+    return os.path.abspath(str(db_path))
+
+
+def _apply(conn: sqlite3.Connection, pragmas):
+    for p in pragmas:
+        conn.execute(p)
+
+
+# ========= 只读连接池 =========
+def _open_reader(path: str) -> sqlite3.Connection:
+    uri = Path(path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    _apply(conn, _READ_PRAGMAS)
+    return conn
+
+
+@contextmanager
+def reader(db_path=DB_PATH):
+    """借出一个只读连接，用完归还连接池"""
+    path = _key(db_path)
+    with _lock:
+        pool = _pools.setdefault(path, queue.LifoQueue(maxsize=READER_POOL_SIZE))
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open_reader(path)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def close_readers(db_path=None):
+    """关闭连接池中的只读连接（db_path 为空时关闭全部）"""
+    with _lock:
+        paths = [_key(db_path)] if db_path else list(_pools)
+        pools = [_pools.pop(p) for p in paths if p in _pools]
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# ========= 单写连接 =========
+def _get_writer(path: str):
+    with _lock:
+        conn = _writers.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            _apply(conn, _WRITE_PRAGMAS)
+            _writers[path] = conn
+        wlock = _write_locks.setdefault(path, threading.RLock())
+    return conn, wlock
+
+
+@contextmanager
+def writer(db_path=DB_PATH):
+    """获取进程内唯一的写连接；退出时 commit，异常时 rollback"""
+    conn, wlock = _get_writer(_key(db_path))
+    with wlock:
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+# ========= 批量导入 =========
+def _drop_secondary_indexes(conn: sqlite3.Connection, tables):
+    """删除指定表上的非唯一索引并返回其建表 SQL（唯一索引保留，INSERT OR IGNORE 依赖它）"""
+    deferred = []
+    for table in tables:
+        rows = conn.execute(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+            (table,)
+        ).fetchall()
+        for name, sql in rows:
+            if sql.lstrip().upper().startswith("CREATE UNIQUE"):
+                continue
+            conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+            deferred.append((name, sql))
+    conn.commit()
+    return deferred
+
+
+def _rebuild_indexes(conn: sqlite3.Connection, deferred):
+    for name, sql in deferred:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (name,)
+        ).fetchone()
+        if not exists:
+            conn.execute(sql)
+    conn.commit()
+
+
+@contextmanager
+def bulk_load(db_path=DB_PATH, tables=()):
+    """
+    批量导入模式（仅导入阶段使用）：
+    - journal_mode=OFF / synchronous=OFF，导入期间崩溃可能损坏库，导入脚本需可重跑
+    - tables 中各表的非唯一索引先删除，结束后按原定义重建
+    - 退出时恢复 WAL + synchronous=NORMAL
+    """
+    path = _key(db_path)
+    # 切换 journal_mode 需要独占，先关掉本进程的只读连接
+    close_readers(path)
+    conn, wlock = _get_writer(path)
+    with wlock:
+        deferred = _drop_secondary_indexes(conn, tables)
+        _apply(conn, _BULK_PRAGMAS)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            _rebuild_indexes(conn, deferred)
+            _apply(conn, _WRITE_PRAGMAS)
+
+
+def close_all():
+    close_readers()
+    with _lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for conn in writers:
+        conn.close()
+
+
+atexit.register(close_all)
+
+
+def _after_fork():
+    """
+    子进程（进程池 fork）不能沿用父进程的连接：丢弃连接池 / 写连接，需要时在子进程内重新打开。
+    继承来的连接对象只保留引用、不关闭（关闭会在子进程里做 WAL checkpoint 等操作，影响父进程）
+    """
+    global _lock
+    _inherited.extend(list(_writers.values()) + list(_pools.values()))
+    _lock = threading.Lock()
+    _pools.clear()
+    _writers.clear()
+    _write_locks.clear()
+
+
+_inherited = []
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+DuckDB 分析执行模式（可选）
+- 只读：ATTACH stock.db 及 history/ 年份文件（sqlite 扩展）或挂载 ../data 下的 Parquet 导出，写入与爬虫仍走 SQLite（database.db）
+- 承接几类重分析查询：t_stock_signal_2/3 自连接组合、t_stock_label_1/2/3 标签、宽表透视、NOT IN (substr ...) 清理统计
+- 结果列名 / 类型与 SQLite 视图一致，调用方可无感切换；未安装 duckdb 或挂载失败时 enabled() 返回 False，调用方回退 SQLite
+
+用法：
+    from database import duck_engine
+    if duck_engine.enabled():
+        pair_df = duck_engine.signal_combos(2)
+    cd database && python duck_engine.py            # 统计各表孤儿记录（股票已不在 t_stock_quote）
+    cd database && python duck_engine.py --delete   # 统计后在 SQLite 上删除
+"""
+import os
+import sys
+import sqlite3
+import datetime
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # 可选依赖
+    duckdb = None
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import DB_PATH, writer
+from database import partition
+
+# ===== 配置 =====
+USE_DUCKDB = True                   # 总开关：False 时所有调用方走 SQLite
+SOURCE = "sqlite"                   # "sqlite"：ATTACH stock.db；"parquet"：读 PARQUET_DIR 下的导出文件
+PARQUET_DIR = Path(__file__).resolve().parents[1] / "data"
+THREADS = os.cpu_count() or 1
+MEMORY_LIMIT = None                 # 如 "32GB"；None 时用 DuckDB 默认（物理内存的 80%）
+
+# Parquet 导出文件 → 表名（由 validate/extract_data.py 生成）
+PARQUET_FILES = {
+    "t_stock_signal": "signal.parquet",
+    "t_stock_stat": "stat.parquet",
+    "t_stock_quote": "quote.parquet",
+    "t_stock_daily": "daily.parquet",
+    "t_stock_signal_2": "signals2.parquet",
+    "t_stock_signal_3": "signals3.parquet",
+}
+
+# 清理语句涉及的表（按 stock_code 关联 t_stock_quote）
+CLEANUP_TABLES = ["t_stock_signal", "t_stock_stat", "t_stock_daily", "t_stock_change", "t_stock_change_detail"]
+
+LABEL_THRESHOLDS = {1: 1.0, 2: 2.0, 3: 3.0}
+
+_lock = threading.Lock()
+_con = None
+_tables = set()
+_failed = None          # 首次挂载的异常；之后本进程不再重试（扩展下载 / ATTACH 都可能很慢）
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+# ===== 连接 =====
+def _open(db_path=DB_PATH):
+    con = duckdb.connect(":memory:")
+    con.execute(f"SET threads={int(THREADS)}")
+    if MEMORY_LIMIT:
+        con.execute(f"SET memory_limit='{MEMORY_LIMIT}'")
+    tables = set()
+    if SOURCE == "sqlite":
+        # 热库 + history/ 下已迁出的年份文件（database.partition），同名表 UNION ALL 成一个视图
+        files = [("stock", Path(db_path))] + [(f"y{y0}", f) for y0, _, f in partition.history_files()]
+        sources = {}
+        for alias, f in files:
+            path = str(f.resolve()).replace("'", "''")
+            con.execute(f"ATTACH '{path}' AS {alias} (TYPE sqlite, READ_ONLY)")
+            rows = con.execute(
+                "SELECT table_name FROM information_schema.tables WHERE table_catalog=?", [alias]
+            ).fetchall()
+            for (name,) in rows:
+                sources.setdefault(name, []).append(alias)
+        for name, aliases in sources.items():
+            union = " UNION ALL ".join(f'SELECT * FROM {a}."{name}"' for a in aliases)
+            con.execute(f'CREATE VIEW "{name}" AS {union}')
+            tables.add(name)
+    else:
+        for name, fname in PARQUET_FILES.items():
+            f = PARQUET_DIR / fname
+            if f.exists():
+                con.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet('{f.as_posix()}')")
+                tables.add(name)
+    return con, tables
+
+
+def connection():
+    """返回进程内共享的 DuckDB 连接（首次调用时建立）；挂载失败过则直接抛出首次的异常"""
+    global _con, _tables, _failed
+    with _lock:
+        if _failed is not None:
+            raise _failed
+        if _con is None:
+            try:
+                _con, _tables = _open()
+            except Exception as e:
+                _failed = e
+                raise
+        return _con.cursor()
+
+
+def enabled() -> bool:
+    """duckdb 可用且数据源挂载成功；挂载失败只尝试、提示一次，本进程之后一直返回 False"""
+    if not USE_DUCKDB or duckdb is None or _failed is not None:
+        return False
+    try:
+        connection()
+        return True
+    except Exception as e:
+        log(f"⚠️ DuckDB 挂载失败，回退 SQLite：{e}")
+        return False
+
+
+def has_table(name: str) -> bool:
+    return enabled() and name in _tables
+
+
+def query(sql: str, params=None) -> pd.DataFrame:
+    return connection().execute(sql, params or []).df()
+
+
+# ===== 组合信号（与 t_stock_signal_2 / t_stock_signal_3 视图同结构）=====
+def _combo_sql(level: int, where: str) -> str:
+    # (trade_date, stock_code, signal_name) 是主键，自连接后每个组合只有一行，不需要 SQLite 视图里的 GROUP BY
+    if level == 2:
+        return f"""
+            SELECT a.trade_date, a.stock_code,
+                   a.signal_name || '&' || b.signal_name AS combo_name,
+                   LEAST(a.signal_value, b.signal_value) AS combo_value
+            FROM t_stock_signal a
+            JOIN t_stock_signal b
+              ON a.trade_date = b.trade_date AND a.stock_code = b.stock_code
+             AND a.signal_name < b.signal_name
+            {where}
+        """
+    return f"""
+        SELECT a.trade_date, a.stock_code,
+               a.signal_name || '&' || b.signal_name || '&' || c.signal_name AS combo_name,
+               LEAST(a.signal_value, b.signal_value, c.signal_value) AS combo_value
+        FROM t_stock_signal a
+        JOIN t_stock_signal b
+          ON a.trade_date = b.trade_date AND a.stock_code = b.stock_code
+         AND a.signal_name < b.signal_name
+        JOIN t_stock_signal c
+          ON a.trade_date = c.trade_date AND a.stock_code = c.stock_code
+         AND b.signal_name < c.signal_name
+        {where}
+    """
+
+
+def signal_combos(level: int, trade_date=None, combo_names=None) -> pd.DataFrame:
+    """
+    level=2/3 对应 t_stock_signal_2/3：trade_date, stock_code, combo_name, combo_value
+    trade_date 限定单日；combo_names 只保留指定组合
+    """
+    # Parquet 模式下若已有组合导出文件直接读，否则由 t_stock_signal 现算
+    exported = SOURCE == "parquet" and f"t_stock_signal_{level}" in _tables
+    alias = "" if exported else "a."
+    conds, params = [], []
+    if trade_date is not None:
+        conds.append(f"{alias}trade_date = ?")
+        params.append(int(trade_date))
+    where = ("WHERE " + " AND ".join(conds)) if conds else ""
+
+    if exported:
+        sql = f"SELECT trade_date, stock_code, combo_name, combo_value FROM t_stock_signal_{level} {where}"
+    else:
+        sql = _combo_sql(level, where)
+    if combo_names is not None:
+        sql = f"SELECT * FROM ({sql}) WHERE combo_name IN (SELECT UNNEST(?::VARCHAR[]))"
+        params.append(list(combo_names))
+    return _fix_types(query(sql, params))
+
+
+def labels(level: int = 1) -> pd.DataFrame:
+    """与 t_stock_label_{level} 视图同结构：trade_date, stock_code, label"""
+    th = LABEL_THRESHOLDS[level]
+    df = query(f"""
+        SELECT trade_date, stock_code,
+               CASE WHEN v_1_percent >= {th} OR v_2_percent >= {th} OR v_3_percent >= {th}
+                    THEN 1 ELSE 0 END AS label
+        FROM t_stock_stat
+    """)
+    return _fix_types(df)
+
+
+def _fix_types(df: pd.DataFrame) -> pd.DataFrame:
+    # 与 database.columnar 的声明类型对齐：trade_date int64，stock_code 字符串
+    if "trade_date" in df.columns:
+        df["trade_date"] = df["trade_date"].astype("int64")
+    if "stock_code" in df.columns:
+        df["stock_code"] = df["stock_code"].astype(str)
+    return df
+
+
+# ===== 透视 =====
+def pivot(df_long: pd.DataFrame, name_col: str, value_col: str, fill_value=0.0) -> pd.DataFrame:
+    """
+    等价于 pivot_table(index=[trade_date, stock_code], columns=name_col, values=value_col,
+                       aggfunc="max", fill_value=fill_value).reset_index()，在 DuckDB 中多线程执行
+    """
+    if df_long is None or df_long.empty:
+        return pd.DataFrame(columns=["trade_date", "stock_code"])
+    con = connection()
+    con.register("_pivot_src", df_long[["trade_date", "stock_code", name_col, value_col]])
+    try:
+        wide = con.execute(f"""
+            PIVOT _pivot_src ON "{name_col}" USING MAX("{value_col}")
+            GROUP BY trade_date, stock_code
+            ORDER BY trade_date, stock_code
+        """).df()
+    finally:
+        con.unregister("_pivot_src")
+    cols = [c for c in wide.columns if c not in ("trade_date", "stock_code")]
+    wide[cols] = wide[cols].fillna(fill_value)
+    # 列顺序与 pivot_table 一致（按名称排序）
+    return _fix_types(wide[["trade_date", "stock_code"] + sorted(cols)])
+
+
+# ===== 清理：股票已不在 t_stock_quote 的记录 =====
+_QUOTE_CODES = """
+    SELECT substr(stock_code, 1, length(stock_code)-3) AS code
+    FROM t_stock_quote
+    WHERE stock_code LIKE '%.SZ' OR stock_code LIKE '%.SH'
+"""
+
+
+def orphan_codes(table: str) -> pd.DataFrame:
+    """返回 table 中不在 t_stock_quote 的 stock_code 及其行数（只读，DuckDB 里做 anti join）"""
+    return query(f"""
+        SELECT t.stock_code, COUNT(*) AS n
+        FROM {table} t
+        ANTI JOIN ({_QUOTE_CODES}) q ON t.stock_code = q.code
+        GROUP BY t.stock_code
+        ORDER BY n DESC
+    """)
+
+
+def delete_orphans(table: str, codes, db_path=DB_PATH) -> int:
+    """
+    按 orphan_codes 的结果在 SQLite 上删除（写操作不经过 DuckDB），返回删除的行数
+    orphan_codes 统计的是热库 + history/ 冷库的 UNION ALL 视图，所以同样的 DELETE 也在每个含该表的冷库文件上执行
+    """
+    codes = [(c,) for c in codes]
+    if not codes:
+        return 0
+    with writer(db_path) as conn:
+        n = conn.executemany(f"DELETE FROM {table} WHERE stock_code = ?", codes).rowcount
+    for _, _, f in partition.history_files():
+        conn = sqlite3.connect(f)
+        try:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone():
+                n += conn.executemany(f"DELETE FROM {table} WHERE stock_code = ?", codes).rowcount
+                conn.commit()
+        finally:
+            conn.close()
+    return n
+
+
+def main():
+    if not enabled():
+        log("DuckDB 不可用，退出")
+        return
+    do_delete = "--delete" in sys.argv
+    for table in CLEANUP_TABLES:
+        if table not in _tables or "t_stock_quote" not in _tables:
+            continue
+        df = orphan_codes(table)
+        log(f"{table}: 孤儿股票 {len(df)} 只，共 {int(df['n'].sum()) if not df.empty else 0} 行")
+        if do_delete and not df.empty:
+            n = delete_orphans(table, df["stock_code"].tolist())
+            log(f"{table}: 已在 SQLite（热库 + 冷库文件）删除 {len(df)} 只股票的 {n:,} 行")
+
+
+if __name__ == "__main__":
+    main()
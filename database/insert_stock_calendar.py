@@ -1,20 +1,22 @@
-import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import writer
 
 # === 配置 ===
 DB_PATH = r"../stock.db"  # SQLite 数据库文件
 txt_file = "../data/date.txt"  # 存放交易日的 txt 文件
 
-# === 打开数据库 ===
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
-# cur.execute("""
-# CREATE TABLE IF NOT EXISTS t_stock_calendar (
-#   trade_date INTEGER NOT NULL PRIMARY KEY,
-#   is_open    INTEGER NOT NULL
-# );
-# """)
-# === 读取 txt 文件并插入 ===
-with open(txt_file, "r", encoding="utf-8") as f:
+# === 读取 txt 文件并插入（共享写连接，退出时统一提交） ===
+with writer(DB_PATH) as conn, open(txt_file, "r", encoding="utf-8") as f:
+    cur = conn.cursor()
+    # cur.execute("""
+    # CREATE TABLE IF NOT EXISTS t_stock_calendar (
+    #   trade_date INTEGER NOT NULL PRIMARY KEY,
+    #   is_open    INTEGER NOT NULL
+    # );
+    # """)
     for line in f:
         date_str = line.strip()
         if not date_str:
@@ -27,8 +29,4 @@ with open(txt_file, "r", encoding="utf-8") as f:
         except ValueError:
             print(f"⚠️ 跳过非法日期: {date_str}")
 
-# === 提交并关闭 ===
-conn.commit()
-conn.close()
-
 print("✅ 已将 date.txt 写入到 t_stock_calendar（重复已自动忽略）")
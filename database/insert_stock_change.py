@@ -1,27 +1,29 @@
 import requests
-import sqlite3
 import json
 import re
+import sys
 import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import writer
+from database.partition import routed
 
 DB_PATH = r"../stock.db"
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS t_stock_change (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            stock_code TEXT NOT NULL,
-            stock_name TEXT,
-            market INTEGER,
-            trade_date INTEGER,
-            change_count INTEGER,
-            UNIQUE(stock_code, trade_date)
-        )
-    """)
-    conn.commit()
-    conn.close()
+    with writer(DB_PATH) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS t_stock_change (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                stock_code TEXT NOT NULL,
+                stock_name TEXT,
+                market INTEGER,
+                trade_date INTEGER,
+                change_count INTEGER,
+                UNIQUE(stock_code, trade_date)
+            )
+        """)
 
 def fetch_stock_changes(code, market=0):
     url = (
@@ -39,24 +41,22 @@ def fetch_stock_changes(code, market=0):
     return data.get("data")
 
 def save_to_db(stock_data):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
     stock_code = stock_data.get("c")
     stock_name = stock_data.get("n")
     market = stock_data.get("m")
-    for item in stock_data.get("data", []):
-        trade_date = item.get("d")
-        change_count = item.get("ct")
-        try:
-            cur.execute("""
-                INSERT OR IGNORE INTO t_stock_change
-                (stock_code, stock_name, market, trade_date, change_count)
-                VALUES (?, ?, ?, ?, ?)
-            """, (stock_code, stock_name, market, trade_date, change_count))
-        except Exception as e:
-            print("插入失败:", e)
-    conn.commit()
-    conn.close()
+    with writer(DB_PATH) as conn:
+        cur = conn.cursor()
+        for item in stock_data.get("data", []):
+            trade_date = item.get("d")
+            change_count = item.get("ct")
+            try:
+                cur.execute("""
+                    INSERT OR IGNORE INTO t_stock_change
+                    (stock_code, stock_name, market, trade_date, change_count)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (stock_code, stock_name, market, trade_date, change_count))
+            except Exception as e:
+                print("插入失败:", e)
 
 def fetch_and_save(code, market=0):
     stock_data = fetch_stock_changes(code, market)
@@ -68,11 +68,8 @@ def fetch_and_save(code, market=0):
 
 
 def process_all_stocks():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    cur.execute("SELECT stock_code FROM t_stock_quote")
-    rows = cur.fetchall()
+    with routed(db_path=DB_PATH) as conn:
+        rows = conn.execute("SELECT stock_code FROM t_stock_quote").fetchall()
 
     for (full_code,) in rows:
         # 市场判断
@@ -87,8 +84,10 @@ def process_all_stocks():
             continue
 
         # 判断是否已爬取过
-        cur.execute("SELECT COUNT(*) FROM t_stock_change WHERE stock_code = ?", (stock_id,))
-        count = cur.fetchone()[0]
+        with routed(db_path=DB_PATH) as conn:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM t_stock_change WHERE stock_code = ?", (stock_id,)
+            ).fetchone()[0]
         if count > 1:
             print(f"⏩ 跳过 {stock_id} (已存在 {count} 条记录)")
             continue
@@ -99,8 +98,6 @@ def process_all_stocks():
         # 执行抓取
         fetch_and_save(stock_id, market_code)
 
-    conn.close()
-
 if __name__ == "__main__":
     # init_db()
     process_all_stocks()
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 import requests
-import sqlite3
 import json
 import re
+import sys
 import time
+from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import writer
+from database.partition import routed
 
 DB_PATH = r"../stock.db"  # SQLite 数据库文件
 
@@ -14,28 +18,25 @@ with open("../data/postition.json", "r", encoding="utf-8") as f:
 
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS t_stock_change_detail (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            stock_code TEXT NOT NULL,
-            stock_name TEXT,
-            market INTEGER,
-            trade_date INTEGER,
-            trade_time TEXT,
-            signal_code INTEGER,
-            signal_name TEXT,
-            price REAL,
-            change_percent REAL,
-            extra_info TEXT,
-            volume INTEGER,
-            amount REAL,
-            UNIQUE(stock_code, trade_date, trade_time, signal_code)
-        )
-    """)
-    conn.commit()
-    conn.close()
+    with writer(DB_PATH) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS t_stock_change_detail (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                stock_code TEXT NOT NULL,
+                stock_name TEXT,
+                market INTEGER,
+                trade_date INTEGER,
+                trade_time TEXT,
+                signal_code INTEGER,
+                signal_name TEXT,
+                price REAL,
+                change_percent REAL,
+                extra_info TEXT,
+                volume INTEGER,
+                amount REAL,
+                UNIQUE(stock_code, trade_date, trade_time, signal_code)
+            )
+        """)
 
 
 def fetch_stock_change_detail(code, date, market=0):
@@ -55,87 +56,80 @@ def fetch_stock_change_detail(code, date, market=0):
 
 
 def save_detail(stock_data):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
     stock_code = stock_data.get("c")
     stock_name = stock_data.get("n")
     market = stock_data.get("m")
     trade_date = stock_data.get("d")
 
-    for item in stock_data.get("data", []):
-        # 1) 交易时间
-        tm_raw = item.get("tm")
-        tm = str(tm_raw).zfill(6) if tm_raw is not None else "000000"
-        trade_time = f"{tm[0:2]}:{tm[2:4]}:{tm[4:6]}"
-
-        # 2) 信号
-        signal_code = item.get("t")
-        signal_info = POSITION_MAP.get(str(signal_code), {})
-        signal_name = signal_info.get("name", "")
-
-        # 3) 解析 i 字段
-        extra_info = item.get("i")
-        vol = amt = price2 = percent2 = None
-        if isinstance(extra_info, str) and extra_info:
-            parts = [p.strip() for p in extra_info.split(",")]
-            try:
-                if len(parts) >= 1 and parts[0] != "":
-                    vol = int(float(parts[0]))
-                if len(parts) >= 2 and parts[1] != "":
-                    price2 = float(parts[1])
-                if len(parts) >= 3 and parts[2] != "":
-                    percent2 = float(parts[2]) * 100.0
-                if len(parts) >= 4 and parts[3] != "":
-                    amt = float(parts[3])
-            except Exception:
-                pass
-
-        # 4) 价格
-        p_raw = item.get("p")
-        if price2 is not None:
-            price = price2
-        else:
-            price = float(p_raw) / 1000.0 if p_raw is not None else None
-
-        # 5) 涨跌幅
-        u_raw = item.get("u")
-        if percent2 is not None:
-            change_percent = percent2
-        else:
-            change_percent = float(u_raw) if (u_raw is not None and str(u_raw).strip() != "") else None
-
-        try:
-            cur.execute("""
-                INSERT OR IGNORE INTO t_stock_change_detail
-                  (stock_code, stock_name, market, trade_date, trade_time,
-                   signal_code, signal_name, price, change_percent,
-                   extra_info, volume, amount)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                stock_code, stock_name, market, trade_date, trade_time,
-                signal_code, signal_name, price, change_percent,
-                extra_info, vol, amt
-            ))
-
-            if cur.rowcount == 0:
-                print(f"⚠️ 已存在，忽略 {stock_code}-{trade_date}-{trade_time}-{signal_code}")
+    with writer(DB_PATH) as conn:
+        cur = conn.cursor()
+        for item in stock_data.get("data", []):
+            # 1) 交易时间
+            tm_raw = item.get("tm")
+            tm = str(tm_raw).zfill(6) if tm_raw is not None else "000000"
+            trade_time = f"{tm[0:2]}:{tm[2:4]}:{tm[4:6]}"
+
+            # 2) 信号
+            signal_code = item.get("t")
+            signal_info = POSITION_MAP.get(str(signal_code), {})
+            signal_name = signal_info.get("name", "")
+
+            # 3) 解析 i 字段
+            extra_info = item.get("i")
+            vol = amt = price2 = percent2 = None
+            if isinstance(extra_info, str) and extra_info:
+                parts = [p.strip() for p in extra_info.split(",")]
+                try:
+                    if len(parts) >= 1 and parts[0] != "":
+                        vol = int(float(parts[0]))
+                    if len(parts) >= 2 and parts[1] != "":
+                        price2 = float(parts[1])
+                    if len(parts) >= 3 and parts[2] != "":
+                        percent2 = float(parts[2]) * 100.0
+                    if len(parts) >= 4 and parts[3] != "":
+                        amt = float(parts[3])
+                except Exception:
+                    pass
+
+            # 4) 价格
+            p_raw = item.get("p")
+            if price2 is not None:
+                price = price2
             else:
-                print(f"✅ 插入成功 {stock_code}-{trade_date}-{trade_time}-{signal_code}")
+                price = float(p_raw) / 1000.0 if p_raw is not None else None
 
-        except Exception as e:
-            print("插入失败:", e, "原始条目:", item)
+            # 5) 涨跌幅
+            u_raw = item.get("u")
+            if percent2 is not None:
+                change_percent = percent2
+            else:
+                change_percent = float(u_raw) if (u_raw is not None and str(u_raw).strip() != "") else None
 
-    conn.commit()
-    conn.close()
+            try:
+                cur.execute("""
+                    INSERT OR IGNORE INTO t_stock_change_detail
+                      (stock_code, stock_name, market, trade_date, trade_time,
+                       signal_code, signal_name, price, change_percent,
+                       extra_info, volume, amount)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    stock_code, stock_name, market, trade_date, trade_time,
+                    signal_code, signal_name, price, change_percent,
+                    extra_info, vol, amt
+                ))
+
+                if cur.rowcount == 0:
+                    print(f"⚠️ 已存在，忽略 {stock_code}-{trade_date}-{trade_time}-{signal_code}")
+                else:
+                    print(f"✅ 插入成功 {stock_code}-{trade_date}-{trade_time}-{signal_code}")
+
+            except Exception as e:
+                print("插入失败:", e, "原始条目:", item)
 
 
 def process_all_stocks():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    cur.execute("SELECT stock_code FROM t_stock_quote")
-    rows = cur.fetchall()
+    with routed(db_path=DB_PATH) as conn:
+        rows = conn.execute("SELECT stock_code FROM t_stock_quote").fetchall()
 
     for (full_code,) in rows:
         # 市场判断
@@ -150,16 +144,18 @@ def process_all_stocks():
             continue
 
         # 从 t_stock_change 取该股票的所有交易日期
-        cur.execute("SELECT DISTINCT trade_date FROM t_stock_change WHERE stock_code = ?", (stock_id,))
-        dates = [row[0] for row in cur.fetchall()]
+        with routed(db_path=DB_PATH) as conn:
+            dates = [row[0] for row in conn.execute(
+                "SELECT DISTINCT trade_date FROM t_stock_change WHERE stock_code = ?", (stock_id,)
+            )]
 
         for trade_date in dates:
             # 判断是否已经抓取过明细
-            cur.execute(
-                "SELECT COUNT(*) FROM t_stock_change_detail WHERE stock_code = ? AND trade_date = ?",
-                (stock_id, trade_date)
-            )
-            count = cur.fetchone()[0]
+            with routed(db_path=DB_PATH) as conn:
+                count = conn.execute(
+                    "SELECT COUNT(*) FROM t_stock_change_detail WHERE stock_code = ? AND trade_date = ?",
+                    (stock_id, trade_date)
+                ).fetchone()[0]
             if count > 0:   # ✅ 修复：已有数据就跳过
                 print(f"⏩ 跳过 {stock_id}-{trade_date} (已有 {count} 条记录)")
                 continue
@@ -174,8 +170,6 @@ def process_all_stocks():
             else:
                 print(f"⚠️ {stock_id}-{trade_date} 无数据")
 
-    conn.close()
-
 
 if __name__ == "__main__":
     init_db()
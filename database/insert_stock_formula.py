@@ -16,17 +16,20 @@ def get_token(script_path=r"./wencai.js"):
     ctx = execjs.compile(js_code)
     return ctx.call("fn")
 
-import sqlite3
+import sys
 import json
+from pathlib import Path
 from typing import Dict, Any
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import writer
+
 DB_PATH = "formula.db"
 
 def init_db(db_path: str = DB_PATH):
     """初始化 SQLite 表"""
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("""
+    with writer(db_path) as conn:
+        conn.execute("""
     CREATE TABLE IF NOT EXISTS t_formula (
         id INTEGER PRIMARY KEY,
         name TEXT,
@@ -43,8 +46,6 @@ def init_db(db_path: str = DB_PATH):
         extra_json TEXT
     )
     """)
-    conn.commit()
-    conn.close()
 
 
 def save_formulas(response: Dict[str, Any], db_path: str = DB_PATH):
@@ -56,36 +57,33 @@ def save_formulas(response: Dict[str, Any], db_path: str = DB_PATH):
     if not response or "data" not in response:
         return 0
 
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-
     count = 0
-    for item in response.get("data", []):
-        cur.execute("""
-        INSERT OR REPLACE INTO t_formula
-        (id, name, source_code, label_name, uploader_name, upload_time,
-         instruction, hot_val, click_times, discuss_number, avg_star,
-         market_list, extra_json)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            item.get("id"),
-            item.get("name"),
-            item.get("sourceCode"),
-            item.get("labelName"),
-            item.get("uploaderName"),
-            item.get("uploadTime"),
-            item.get("instruction"),
-            item.get("hotVal"),
-            item.get("clickTimes"),
-            item.get("discussNumber"),
-            item.get("avgStar"),
-            json.dumps(item.get("marketList"), ensure_ascii=False),
-            json.dumps(item, ensure_ascii=False)
-        ))
-        count += 1
-
-    conn.commit()
-    conn.close()
+    with writer(db_path) as conn:
+        cur = conn.cursor()
+        for item in response.get("data", []):
+            cur.execute("""
+            INSERT OR REPLACE INTO t_formula
+            (id, name, source_code, label_name, uploader_name, upload_time,
+             instruction, hot_val, click_times, discuss_number, avg_star,
+             market_list, extra_json)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                item.get("id"),
+                item.get("name"),
+                item.get("sourceCode"),
+                item.get("labelName"),
+                item.get("uploaderName"),
+                item.get("uploadTime"),
+                item.get("instruction"),
+                item.get("hotVal"),
+                item.get("clickTimes"),
+                item.get("discussNumber"),
+                item.get("avgStar"),
+                json.dumps(item.get("marketList"), ensure_ascii=False),
+                json.dumps(item, ensure_ascii=False)
+            ))
+            count += 1
+
     return count
 
 def get_info_20240427140():
@@ -1,14 +1,17 @@
+import sys
 import time
 import requests
-import sqlite3
 import math
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import writer
 
 DB_PATH = r"../stock.db"
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
+    with writer(DB_PATH) as conn:
+        conn.execute("""
     CREATE TABLE IF NOT EXISTS t_stock_quote (
         stock_code TEXT PRIMARY KEY,          -- 股票代码，例如 300004.SZ
         addi_tradetime_bits REAL,
@@ -90,8 +93,6 @@ def init_db():
         year_pxchange_rate REAL
     )
     """)
-    conn.commit()
-    conn.close()
 
 def get_stock_total_count():
     """获取股票总数"""
@@ -133,23 +134,17 @@ def fetch_and_store(start_pos=0, page_size=20):
     fields = js["data"]["sort"]["fields"]
     data = js["data"]["sort"]
 
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    for stock_code, values in data.items():
-        if stock_code == "fields":
-            continue
-        placeholders = ",".join(["?"] * (len(fields) + 1))
-        sql = f"""
-        INSERT INTO t_stock_quote (stock_code, {",".join(fields)})
-        VALUES ({placeholders})
-        ON CONFLICT(stock_code) DO UPDATE SET 
-        {",".join([f"{f}=excluded.{f}" for f in fields])}
-        """
-        cur.execute(sql, [stock_code] + values)
+    placeholders = ",".join(["?"] * (len(fields) + 1))
+    sql = f"""
+    INSERT INTO t_stock_quote (stock_code, {",".join(fields)})
+    VALUES ({placeholders})
+    ON CONFLICT(stock_code) DO UPDATE SET 
+    {",".join([f"{f}=excluded.{f}" for f in fields])}
+    """
+    rows = [[stock_code] + values for stock_code, values in data.items() if stock_code != "fields"]
 
-    conn.commit()
-    conn.close()
+    with writer(DB_PATH) as conn:
+        conn.executemany(sql, rows)
     print(f"✅ 已处理 start_pos={start_pos}")
 
 def fetch_all(page_size=100):
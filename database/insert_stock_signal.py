@@ -1,40 +1,44 @@
-import sqlite3
+import sys
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import bulk_load
+from database import signal_freq
+
 # === 配置 ===
 DB_PATH = r"../stock.db"  # SQLite 数据库文件
 root_dir = Path(r"../data/999")  # 根目录
 
-# === 打开数据库（开启 WAL 并发模式） ===
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cur = conn.cursor()
-cur.execute("PRAGMA journal_mode=WAL;")
-cur.execute("PRAGMA synchronous=NORMAL;")
-
-# === 遍历 txt 文件 ===
-for txt_file in root_dir.glob("*.txt"):
-    signal_name = txt_file.stem  # 文件名（去掉扩展名）
-    print(f"📂 处理信号文件: {signal_name}")
-
-    with open(txt_file, "r", encoding="utf-8") as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) < 2:
-                continue  # 跳过无效行
-
-            stock_code, trade_date = parts[0], parts[1]
-
-            try:
-                cur.execute("""
-                    INSERT OR IGNORE INTO t_stock_signal
-                    (trade_date, stock_code, signal_name, signal_value)
-                    VALUES (?, ?, ?, ?)
-                """, (int(trade_date), stock_code, signal_name, 1.0))
-            except Exception as e:
-                print(f"⚠️ 插入失败 {line}: {e}")
-
-# === 提交并关闭 ===
-conn.commit()
-conn.close()
+loaded_dates = set()  # 本次导入涉及的交易日，导入后按月重算 t_signal_freq
+
+# === 批量导入模式：idx_dt / idx_dt_code / idx_xg 推迟到导入结束后重建 ===
+with bulk_load(DB_PATH, tables=["t_stock_signal"]) as conn:
+    cur = conn.cursor()
+
+    # === 遍历 txt 文件 ===
+    for txt_file in root_dir.glob("*.txt"):
+        signal_name = txt_file.stem  # 文件名（去掉扩展名）
+        print(f"📂 处理信号文件: {signal_name}")
+
+        with open(txt_file, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip().split()
+                if len(parts) < 2:
+                    continue  # 跳过无效行
+
+                stock_code, trade_date = parts[0], parts[1]
+
+                try:
+                    cur.execute("""
+                        INSERT OR IGNORE INTO t_stock_signal
+                        (trade_date, stock_code, signal_name, signal_value)
+                        VALUES (?, ?, ?, ?)
+                    """, (int(trade_date), stock_code, signal_name, 1.0))
+                    loaded_dates.add(int(trade_date))
+                except Exception as e:
+                    print(f"⚠️ 插入失败 {line}: {e}")
 
 print("✅ 已将 txt 文件内容写入 t_stock_signal（重复已忽略）")
+
+# === 增量更新信号 / 组合频次统计（只重算涉及的月份）===
+signal_freq.refresh(signal_freq.months_of(loaded_dates))
@@ -1,7 +1,13 @@
+import sys
+from pathlib import Path
+
 import pymysql
-import sqlite3
 import pandas as pd
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import bulk_load
+from database import signal_freq
+
 DB_PATH = r"../stock.db"  # SQLite 数据库文件
 
 # MySQL 连接
@@ -13,17 +19,17 @@ mysql_conn = pymysql.connect(
     charset="utf8mb4"
 )
 
-# SQLite3 连接
-sqlite_conn = sqlite3.connect(DB_PATH)
-
 # 读取 MySQL 数据
 df = pd.read_sql("SELECT * FROM t_stock_stat", mysql_conn)
 
-# 写入 SQLite3
-df.to_sql("t_stock_stat", sqlite_conn, if_exists="append", index=False)
+# 写入 SQLite3（批量导入模式，idx_stock_stat_code_date 导入后重建）
+with bulk_load(DB_PATH, tables=["t_stock_stat"]) as sqlite_conn:
+    df.to_sql("t_stock_stat", sqlite_conn, if_exists="append", index=False)
 
 # 关闭连接
 mysql_conn.close()
-sqlite_conn.close()
 
 print("✅ 迁移完成")
+
+# 标签变化影响 t_signal_freq 的 n_pos：重算涉及的月份
+signal_freq.refresh(signal_freq.months_of(df["trade_date"]))
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+冷热分库 + 查询路由
+- 热库：stock.db 本身，只保留当年数据和实时表（t_stock_quote / t_stock_calendar / 模型与评估表），爬虫照常写它
+- 冷库：history/stock_YYYY.db，每年一个文件，存放 PARTITIONED_TABLES 中往年的行（按 trade_date 划分）；
+  SQLite 一个连接最多 ATTACH 10 个库（编译期上限，运行时不能调大），年份文件超过 MAX_HIST_FILES 个时，
+  split() 把最早的两个文件合并成跨年文件 history/stock_YYYY-YYYY.db，不带日期的全历史 routed() 也不会超限
+- routed(start, end)：只读连接，只 ATTACH 日期范围涉及的年份文件，并用同名 TEMP VIEW（UNION ALL）遮住主库表，
+  SQL 不用改；WHERE 条件会被 SQLite 下推到每个分区
+- scan(sql, ...)：全历史任务按年份文件并行扫描后拼接（要求 SQL 只在同一 trade_date 内关联，分区按日期切分天然满足）
+
+用法：
+    cd database && python partition.py status
+    cd database && python partition.py split            # 把往年数据迁出到 history/，每年跨年后执行一次
+    cd database && python partition.py split --vacuum   # 迁出后 VACUUM 热库
+    cd database && python partition.py consolidate      # 冷库文件超过 MAX_HIST_FILES 时合并最早的年份（split 会自动执行）
+
+    from database.partition import routed, scan
+    with routed(start=20240101) as conn:
+        df = pd.read_sql_query("SELECT ... FROM t_stock_daily WHERE trade_date >= 20240101", conn)
+"""
+import re
+import sys
+import shutil
+import queue
+import sqlite3
+import datetime
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import DB_PATH, reader, writer, _apply, _READ_PRAGMAS, READER_POOL_SIZE
+from database.columnar import read_frame
+
+# ===== 配置 =====
+HIST_DIR = Path(__file__).resolve().parents[1] / "history"
+# 按 trade_date 分区的历史表；其余表（行情快照、日历、模型表等）只在热库
+PARTITIONED_TABLES = ["t_stock_daily", "t_stock_change", "t_stock_change_detail", "t_stock_signal", "t_stock_stat"]
+SCAN_WORKERS = 4        # scan() 并行线程数（sqlite3 执行查询时释放 GIL）
+MAX_HIST_FILES = 8      # 冷库文件数上限（小于 SQLite 的 ATTACH 上限 10，给调用方自己 ATTACH 留余量）
+
+_lock = threading.Lock()
+_pools = {}             # (热库路径, 年份元组) -> queue.LifoQueue[sqlite3.Connection]
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+# ===== 年份文件 =====
+def year_of(trade_date) -> int:
+    return int(trade_date) // 10000
+
+
+def history_files():
+    """已迁出的冷库文件 [(起始年, 结束年, 路径)]，按年份升序；单年文件起止年相同"""
+    if not HIST_DIR.exists():
+        return []
+    files = []
+    for f in HIST_DIR.glob("stock_*.db"):
+        m = re.fullmatch(r"stock_(\d{4})(?:-(\d{4}))?\.db", f.name)
+        if m:
+            files.append((int(m.group(1)), int(m.group(2) or m.group(1)), f))
+    return sorted(files)
+
+
+def history_years():
+    """已迁出的年份（升序）"""
+    return [y for y0, y1, _ in history_files() for y in range(y0, y1 + 1)]
+
+
+def year_path(year: int) -> Path:
+    """存放该年数据的文件（已并入跨年文件时返回跨年文件）"""
+    for y0, y1, f in history_files():
+        if y0 <= year <= y1:
+            return f
+    return HIST_DIR / f"stock_{year}.db"
+
+
+def files_between(start=None, end=None):
+    """与 [start, end]（trade_date，yyyymmdd）有交集的冷库文件 [(起始年, 结束年, 路径)]"""
+    lo = year_of(start) if start is not None else 0
+    hi = year_of(end) if end is not None else 9999
+    return [(y0, y1, f) for y0, y1, f in history_files() if y0 <= hi and y1 >= lo]
+
+
+def years_between(start=None, end=None):
+    """start/end 为 trade_date（yyyymmdd），返回范围内已迁出的年份"""
+    lo = year_of(start) if start is not None else 0
+    hi = year_of(end) if end is not None else 9999
+    return [y for y in history_years() if lo <= y <= hi]
+
+
+def _bounds(year: int):
+    return year * 10000 + 101, year * 10000 + 1231
+
+
+# ===== 迁出 =====
+def _table_ddl(conn, table: str):
+    """返回 (建表 SQL, [建索引 SQL])，来自主库 sqlite_master"""
+    row = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone()
+    if not row:
+        return None, []
+    idx = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (table,)
+    ).fetchall()
+    return row[0], [r[0] for r in idx]
+
+
+def _qualify(sql: str, schema: str) -> str:
+    """把主库的 CREATE TABLE / CREATE INDEX 语句改写到指定 schema 下，并加 IF NOT EXISTS"""
+    sql = re.sub(r"(?i)^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?",
+                 f"CREATE TABLE IF NOT EXISTS {schema}.", sql, count=1)
+    sql = re.sub(r"(?i)^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+(IF\s+NOT\s+EXISTS\s+)?",
+                 lambda m: f"CREATE {m.group(1) or ''}INDEX IF NOT EXISTS {schema}.", sql, count=1)
+    return sql
+
+
+def _move_year(conn, year: int, tables):
+    lo, hi = _bounds(year)
+    HIST_DIR.mkdir(parents=True, exist_ok=True)
+    conn.execute("ATTACH ? AS hist", (str(year_path(year)),))
+    try:
+        for table in tables:
+            create_sql, index_sqls = _table_ddl(conn, table)
+            if not create_sql:
+                continue
+            conn.execute(_qualify(create_sql, "hist"))
+            for s in index_sqls:
+                conn.execute(_qualify(s, "hist"))
+            # 与年份文件中已有行主键冲突时以热库为准（热库的行更新），迁出的行都进了年份文件才删除热库
+            cur = conn.execute(
+                f"INSERT OR REPLACE INTO hist.{table} SELECT * FROM main.{table} WHERE trade_date BETWEEN ? AND ?",
+                (lo, hi)
+            )
+            moved = cur.rowcount
+            conn.execute(f"DELETE FROM main.{table} WHERE trade_date BETWEEN ? AND ?", (lo, hi))
+            log(f"{year} {table}: 迁出 {moved:,} 行")
+        # 标签 / 组合视图一并建到年份文件里，scan() 可以直接按年查视图
+        for name, sql in conn.execute("SELECT name, sql FROM main.sqlite_master WHERE type='view'").fetchall():
+            conn.execute(re.sub(r"(?i)^\s*CREATE\s+VIEW\s+(IF\s+NOT\s+EXISTS\s+)?",
+                                "CREATE VIEW IF NOT EXISTS hist.", sql, count=1))
+        conn.commit()
+    finally:
+        conn.execute("DETACH hist")
+
+
+def split(db_path=DB_PATH, keep_year=None, vacuum=False):
+    """
+    把热库中早于 keep_year（默认今年）的分区表数据迁到 history/stock_YYYY.db
+    已存在的年份文件会被追加（主键冲突时以热库的行为准），可重复执行；之后按 MAX_HIST_FILES 合并最早的文件
+    """
+    keep_year = keep_year or datetime.date.today().year
+    with writer(db_path) as conn:
+        tables = [t for t in PARTITIONED_TABLES if _table_ddl(conn, t)[0]]
+        years = set()
+        for table in tables:
+            rows = conn.execute(
+                f"SELECT DISTINCT trade_date / 10000 FROM main.{table} WHERE trade_date < ?",
+                (keep_year * 10000,)
+            ).fetchall()
+            years.update(int(r[0]) for r in rows if r[0])
+        for year in sorted(years):
+            _move_year(conn, year, tables)
+    close_routed()
+    consolidate()
+    if vacuum:
+        log("VACUUM 热库 ...")
+        with writer(db_path) as conn:
+            conn.execute("VACUUM")
+
+
+def _merge_files(a, b):
+    """两个相邻冷库文件合并成跨年文件 stock_<a起>-<b止>.db：先复制 a，再把 b 的表、索引、视图和行装进去"""
+    (a0, _, fa), (_, b1, fb) = a, b
+    out = HIST_DIR / f"stock_{a0}-{b1}.db"
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.copyfile(fa, tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("ATTACH ? AS src", (str(fb),))
+        # sqlite_sequence 等内部表（AUTOINCREMENT 表会带出 sqlite_sequence）不能 CREATE，自增序号单独合并
+        for name, sql in conn.execute("SELECT name, sql FROM src.sqlite_master WHERE type='table' "
+                                      "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\'").fetchall():
+            conn.execute(re.sub(r"(?i)^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?",
+                                "CREATE TABLE IF NOT EXISTS main.", sql, count=1))
+            for (s_idx,) in conn.execute("SELECT sql FROM src.sqlite_master WHERE type='index' AND tbl_name=? "
+                                         "AND sql IS NOT NULL", (name,)).fetchall():
+                conn.execute(_qualify(s_idx, "main"))
+            # 年份不重叠，主键不会冲突；万一冲突直接报错，不丢行
+            conn.execute(f"INSERT INTO main.{name} SELECT * FROM src.{name}")
+        _merge_sequences(conn)
+        for name, sql in conn.execute("SELECT name, sql FROM src.sqlite_master WHERE type='view'").fetchall():
+            conn.execute(re.sub(r"(?i)^\s*CREATE\s+VIEW\s+(IF\s+NOT\s+EXISTS\s+)?",
+                                "CREATE VIEW IF NOT EXISTS main.", sql, count=1))
+        conn.commit()
+        conn.execute("DETACH src")
+    except Exception:
+        conn.close()
+        tmp.unlink(missing_ok=True)     # 不留半成品，原来的两个文件保持不动
+        raise
+    conn.close()
+    tmp.replace(out)
+    fa.unlink()
+    fb.unlink()
+    log(f"合并冷库 {fa.name} + {fb.name} → {out.name}")
+    return out
+
+
+def _merge_sequences(conn):
+    """src 的 AUTOINCREMENT 序号并入 main.sqlite_sequence（取两边较大值，合并后新行号不会与已有行重复）"""
+    has = conn.execute("SELECT 1 FROM src.sqlite_master WHERE type='table' AND name='sqlite_sequence'").fetchone()
+    if not has:
+        return
+    for name, seq in conn.execute("SELECT name, seq FROM src.sqlite_sequence").fetchall():
+        cur = conn.execute("UPDATE main.sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, name))
+        if cur.rowcount == 0:
+            conn.execute("INSERT INTO main.sqlite_sequence(name, seq) VALUES (?, ?)", (name, seq))
+
+
+def consolidate(max_files: int = MAX_HIST_FILES):
+    """冷库文件超过 max_files 个时，反复把最早的两个文件合并，使全历史 routed() 不超过 ATTACH 上限"""
+    files = history_files()
+    while len(files) > max(1, int(max_files)):
+        _merge_files(files[0], files[1])
+        files = history_files()
+    close_routed()
+
+
+# ===== 路由 =====
+def _open_routed(db_path: str, files):
+    limit = sqlite3.connect(":memory:").getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(files) > limit:
+        raise RuntimeError(f"需要挂载 {len(files)} 个冷库文件，超过 SQLite 上限 {limit}；"
+                           f"请执行 python partition.py consolidate（或缩小 start/end、改用 scan()）")
+
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+    # 修改 temp_store 会清掉已建的 TEMP 对象，所以先设 PRAGMA；query_only 会禁止建 TEMP VIEW，放到最后
+    _apply(conn, [p for p in _READ_PRAGMAS if "query_only" not in p])
+    parts = {t: ["main"] for t in PARTITIONED_TABLES}
+    for y0, _, f in files:
+        schema = f"y{y0}"
+        conn.execute(f"ATTACH '{Path(f).resolve().as_uri()}?mode=ro' AS {schema}")
+        for (name,) in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type='table'"):
+            if name in parts:
+                parts[name].append(schema)
+
+    # 同名 TEMP VIEW 优先于 main 表被解析，原 SQL 无需改动
+    for table, schemas in parts.items():
+        if len(schemas) > 1:
+            union = " UNION ALL ".join(f"SELECT * FROM {s}.{table}" for s in schemas)
+            conn.execute(f"CREATE TEMP VIEW {table} AS {union}")
+    # 主库视图（标签 / 组合）只认 main 中的表，这里按原定义重建为 TEMP VIEW，使其也走分区
+    for name, sql in conn.execute("SELECT name, sql FROM main.sqlite_master WHERE type='view'").fetchall():
+        conn.execute(re.sub(r"(?i)^\s*CREATE\s+VIEW", "CREATE TEMP VIEW", sql, count=1))
+
+    conn.execute("PRAGMA query_only=ON;")
+    return conn
+
+
+@contextmanager
+def routed(start=None, end=None, db_path=DB_PATH):
+    """
+    日期路由的只读连接：只挂载 [start, end] 涉及的冷库文件
+    没有迁出过任何年份（或范围全在今年）时，等价于 database.db.reader()
+    """
+    files = tuple((y0, y1, str(f)) for y0, y1, f in files_between(start, end))
+    if not files:
+        with reader(db_path) as conn:
+            yield conn
+        return
+
+    key = (str(Path(db_path).resolve()), files)
+    with _lock:
+        pool = _pools.setdefault(key, queue.LifoQueue(maxsize=READER_POOL_SIZE))
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open_routed(key[0], files)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def close_routed():
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# ===== 并行扫描 =====
+def scan(sql: str, params=(), start=None, end=None, dtypes=None, db_path=DB_PATH, workers=SCAN_WORKERS) -> pd.DataFrame:
+    """
+    对热库和 [start, end] 内每个年份文件分别执行 sql，并行读取后按年份顺序拼接
+    sql 中的表名直接写 t_stock_xxx，只能做同一 trade_date 内的关联（分区不跨日期）
+    """
+    paths = [f for _, _, f in files_between(start, end)]
+    # 热库只存最后一个迁出年份之后的数据，范围没覆盖到就不用查
+    hist = history_years()
+    if not hist or end is None or year_of(end) > hist[-1]:
+        paths.append(Path(db_path))
+
+    def _one(path):
+        with reader(path) as conn:
+            try:
+                return read_frame(conn, sql, params=params, dtypes=dtypes)
+            except sqlite3.OperationalError as e:
+                # 早年文件可能没有某张表（如 t_stock_change_detail 起始较晚）
+                if "no such table" in str(e):
+                    return None
+                raise
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        frames = [f for f in ex.map(_one, paths) if f is not None]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def status(db_path=DB_PATH):
+    with reader(db_path) as conn:
+        for table in PARTITIONED_TABLES:
+            try:
+                lo, hi, n = conn.execute(f"SELECT MIN(trade_date), MAX(trade_date), COUNT(*) FROM {table}").fetchone()
+            except sqlite3.OperationalError:
+                continue
+            log(f"热库 {table}: {n:,} 行 [{lo} ~ {hi}]")
+    for _, _, f in history_files():
+        log(f"冷库 {f.name}: {f.stat().st_size / 1024 / 1024:,.1f} MB")
+
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if cmd == "split":
+        split(vacuum="--vacuum" in sys.argv)
+    elif cmd == "consolidate":
+        consolidate()
+    status()
+
+
+if __name__ == "__main__":
+    main()
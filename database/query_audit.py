@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+查询计划审计 & 覆盖索引构建
+- QUERY_SHAPES 登记项目里实际在跑的热点查询（来源脚本 + 参数样例 + 建议索引）
+- 对每条查询执行 EXPLAIN QUERY PLAN，报告全表扫描（SCAN 且未走索引）和临时 B 树（USE TEMP B-TREE）
+- 有问题或仍需回表的查询给出建议的覆盖索引；同一张表上“列是另一索引前缀”的非唯一索引判为冗余（如 idx_dt vs idx_dt_code）
+- 默认只打印报告与 DDL；APPLY_CREATE / APPLY_DROP 打开后才真正建/删索引（也可用命令行 --create / --drop）
+
+用法：
+    cd database && python query_audit.py               # 只审计
+    cd database && python query_audit.py --create      # 补建缺失的覆盖索引
+    cd database && python query_audit.py --drop        # 删除冗余索引
+"""
+import sys
+import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import reader, writer, close_readers
+
+# ===== 配置 =====
+DB_PATH = r"../stock.db"
+APPLY_CREATE = False    # True：为有问题的查询创建建议索引
+APPLY_DROP = False      # True：删除冗余索引
+
+# ===== 热点查询登记表 =====
+# expect_scan=True 表示本来就要全表读（训练全量加载 / 清理语句），只展示计划，不算问题
+# index=(索引名, 表名, 列) 为该查询的建议覆盖索引
+QUERY_SHAPES = [
+    {
+        "name": "detail_count_by_code_date",
+        "source": "insert_stock_change_detail.py / _2.py",
+        "sql": "SELECT COUNT(*) FROM t_stock_change_detail WHERE stock_code = ? AND trade_date = ?",
+        "params": ("000001", 20250102),
+        "index": ("idx_change_detail_code_date", "t_stock_change_detail", ("stock_code", "trade_date")),
+    },
+    {
+        "name": "change_dates_by_code",
+        "source": "insert_stock_change_detail.py / _2.py",
+        "sql": "SELECT DISTINCT trade_date FROM t_stock_change WHERE stock_code = ?",
+        "params": ("000001",),
+        "index": ("idx_change_code_date", "t_stock_change", ("stock_code", "trade_date")),
+    },
+    {
+        "name": "change_count_by_code",
+        "source": "insert_stock_change.py",
+        "sql": "SELECT COUNT(*) FROM t_stock_change WHERE stock_code = ?",
+        "params": ("000001",),
+        "index": ("idx_change_code_date", "t_stock_change", ("stock_code", "trade_date")),
+    },
+    {
+        "name": "daily_forward_range",
+        "source": "validate_combo.py / _2.py / _3.py",
+        "sql": "SELECT trade_date, open, close FROM t_stock_daily "
+               "WHERE stock_code = ? AND trade_date > ? ORDER BY trade_date ASC LIMIT 10",
+        "params": ("000001", 20250102),
+        "index": ("idx_daily_code_date_oc", "t_stock_daily", ("stock_code", "trade_date", "open", "close")),
+    },
+    {
+        "name": "daily_by_code",
+        "source": "validate_combo_4.py",
+        "sql": "SELECT trade_date, open, close FROM t_stock_daily WHERE stock_code = ? ORDER BY trade_date ASC",
+        "params": ("000001",),
+        "index": ("idx_daily_code_date_oc", "t_stock_daily", ("stock_code", "trade_date", "open", "close")),
+    },
+    {
+        "name": "daily_codes",
+        "source": "validate_combo_4.py",
+        "sql": "SELECT DISTINCT stock_code FROM t_stock_daily",
+        "params": (),
+        "index": ("idx_daily_code_date_oc", "t_stock_daily", ("stock_code", "trade_date", "open", "close")),
+    },
+    {
+        "name": "signal_max_date",
+        "source": "RandomForestClassifier1~4.py",
+        "sql": "SELECT MAX(trade_date) FROM t_stock_signal",
+        "params": (),
+        "index": None,
+    },
+    {
+        "name": "signal_by_date",
+        "source": "RandomForestClassifier1~4.py（预测最新日）",
+        "sql": "SELECT trade_date, stock_code, signal_name, signal_value FROM t_stock_signal WHERE trade_date = ?",
+        "params": (20250102,),
+        "index": None,
+    },
+    {
+        "name": "feat_max_date",
+        "source": "RandomForestClassifier3.py",
+        "sql": "SELECT MAX(trade_date) FROM t_stock_feat",
+        "params": (),
+        "index": ("idx_feat_date", "t_stock_feat", ("trade_date",)),
+    },
+    {
+        "name": "model_meta_latest",
+        "source": "RandomForestClassifier3.py",
+        "sql": "SELECT model_version FROM t_model_meta ORDER BY created_at DESC LIMIT 1",
+        "params": (),
+        "index": ("idx_model_meta_created", "t_model_meta", ("created_at", "model_version")),
+    },
+    {
+        "name": "combo_eval_filter",
+        "source": "RandomForestClassifier4_3.py",
+        "sql": "SELECT combo_name FROM t_combo_eval "
+               "WHERE combo_type = 'p2' AND accuracy >= 0.65 AND n_samples >= 1000",
+        "params": (),
+        "index": ("idx_combo_eval_type_acc", "t_combo_eval", ("combo_type", "accuracy", "n_samples", "combo_name")),
+    },
+    {
+        "name": "stat_by_code_date",
+        "source": "validate_combo_7.py / 标签视图",
+        "sql": "SELECT v_1_percent, v_2_percent, v_3_percent FROM t_stock_stat WHERE stock_code = ? AND trade_date = ?",
+        "params": ("000001", 20250102),
+        "index": None,
+    },
+    {
+        "name": "signal_full_load",
+        "source": "RandomForestClassifier1~4.py（训练全量）",
+        "sql": "SELECT trade_date, stock_code, signal_name, signal_value FROM t_stock_signal",
+        "params": (),
+        "index": None,
+        "expect_scan": True,
+    },
+    {
+        "name": "stat_orphan_cleanup",
+        "source": "sql/sqlite3.sql（清理语句）",
+        "sql": "SELECT COUNT(*) FROM t_stock_stat WHERE stock_code NOT IN ("
+               "SELECT substr(stock_code, 1, length(stock_code)-3) FROM t_stock_quote "
+               "WHERE stock_code LIKE '%.SZ' OR stock_code LIKE '%.SH')",
+        "params": (),
+        "index": None,
+        "expect_scan": True,
+    },
+]
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+# ===== 计划分析 =====
+def _tables(conn):
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')").fetchall()
+    return {r[0] for r in rows}
+
+
+def explain(conn, sql: str, params=()):
+    """返回 EXPLAIN QUERY PLAN 的明细行（detail 文本列表）"""
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [r[-1] for r in rows]
+
+
+def classify(plan):
+    """从计划明细中找出全表扫描、临时 B 树、以及走了索引但需回表的步骤"""
+    full_scans, temp_btrees, lookups = [], [], []
+    for detail in plan:
+        text = detail.upper()
+        if text.startswith("SCAN") and " USING " not in text:
+            full_scans.append(detail)
+        if "USE TEMP B-TREE" in text:
+            temp_btrees.append(detail)
+        if " USING INDEX " in text:
+            lookups.append(detail)
+    return full_scans, temp_btrees, lookups
+
+
+def audit(conn):
+    """逐条审计 QUERY_SHAPES，返回结果列表"""
+    existing = _tables(conn)
+    results = []
+    for shape in QUERY_SHAPES:
+        idx = shape.get("index")
+        res = {"name": shape["name"], "source": shape["source"], "plan": [],
+               "full_scans": [], "temp_btrees": [], "lookups": [], "skipped": None,
+               "expect_scan": shape.get("expect_scan", False), "suggest": None}
+        try:
+            res["plan"] = explain(conn, shape["sql"], shape.get("params", ()))
+        except Exception as e:
+            # 表不存在（如 t_stock_feat / t_combo_eval 尚未生成）时跳过
+            res["skipped"] = str(e)
+            results.append(res)
+            continue
+        res["full_scans"], res["temp_btrees"], res["lookups"] = classify(res["plan"])
+        bad = (res["full_scans"] and not res["expect_scan"]) or res["temp_btrees"]
+        # 登记了覆盖索引的查询，若仍需回表也给出建议
+        if (bad or res["lookups"]) and idx and idx[1] in existing:
+            res["suggest"] = idx
+        results.append(res)
+    return results
+
+
+# ===== 冗余索引 =====
+def index_columns(conn, table: str):
+    """返回 {索引名: (是否唯一, 来源, 列元组)}，包含主键/UNIQUE 约束生成的自动索引"""
+    out = {}
+    for row in conn.execute(f'PRAGMA index_list("{table}")').fetchall():
+        name, unique, origin = row[1], row[2], row[3]
+        cols = tuple(r[2] for r in conn.execute(f'PRAGMA index_info("{name}")').fetchall())
+        out[name] = (bool(unique), origin, cols)
+    return out
+
+
+def find_redundant(conn):
+    """
+    非唯一的手建索引，若其列是同表另一索引列的前缀（或完全相同），判为冗余
+    返回 [(表, 冗余索引, 被哪个索引覆盖)]
+    """
+    redundant = []
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchall()]
+    for table in tables:
+        idx = index_columns(conn, table)
+        for name, (unique, origin, cols) in idx.items():
+            if unique or origin != "c" or not cols:
+                continue
+            # 优先挑最宽的索引作为覆盖者，唯一索引优先
+            candidates = sorted(idx.items(), key=lambda kv: (-len(kv[1][2]), not kv[1][0], kv[0]))
+            for other, (_, _, ocols) in candidates:
+                if other == name or len(ocols) < len(cols) or ocols[:len(cols)] != cols:
+                    continue
+                # 列完全相同的两个非唯一索引只删名字靠后的那个
+                if ocols == cols and not idx[other][0] and other > name:
+                    continue
+                redundant.append((table, name, other))
+                break
+    return redundant
+
+
+# ===== 建 / 删 =====
+def create_sql(index) -> str:
+    name, table, cols = index
+    return f'CREATE INDEX IF NOT EXISTS {name} ON {table}({", ".join(cols)});'
+
+
+def apply_create(db_path, indexes):
+    with writer(db_path) as conn:
+        for index in indexes:
+            log(f"创建索引：{create_sql(index)}")
+            conn.execute(create_sql(index))
+        conn.execute("ANALYZE;")
+
+
+def apply_drop(db_path, names):
+    with writer(db_path) as conn:
+        for name in names:
+            log(f"删除冗余索引：{name}")
+            conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+# ===== 报告 =====
+def report(results, redundant):
+    log("========== 查询计划 ==========")
+    for r in results:
+        if r["skipped"]:
+            log(f"⏭  {r['name']:<28} 跳过（{r['skipped']}）")
+            continue
+        if r["full_scans"] and not r["expect_scan"] or r["temp_btrees"]:
+            flag = "❌"
+        elif r["suggest"]:
+            flag = "⚠️"
+        elif r["full_scans"]:
+            flag = "➖"
+        else:
+            flag = "✅"
+        log(f"{flag} {r['name']:<28} [{r['source']}]")
+        for d in r["plan"]:
+            print(f"      {d}")
+        if r["suggest"]:
+            print(f"      建议：{create_sql(r['suggest'])}")
+
+    log("========== 冗余索引 ==========")
+    if not redundant:
+        log("无")
+    for table, name, covered_by in redundant:
+        log(f"{table}.{name} 被 {covered_by} 覆盖，建议：DROP INDEX {name};")
+
+
+def main():
+    apply_c = APPLY_CREATE or "--create" in sys.argv
+    apply_d = APPLY_DROP or "--drop" in sys.argv
+
+    with reader(DB_PATH) as conn:
+        results = audit(conn)
+        redundant = find_redundant(conn)
+    report(results, redundant)
+
+    # 同一索引可能被多条查询建议，去重
+    suggested = list(dict.fromkeys(r["suggest"] for r in results if r["suggest"]))
+    if suggested and apply_c:
+        apply_create(DB_PATH, suggested)
+    elif suggested:
+        log(f"共 {len(suggested)} 个建议索引，加 --create 执行")
+
+    if redundant and apply_d:
+        apply_drop(DB_PATH, [name for _, name, _ in redundant])
+    elif redundant:
+        log(f"共 {len(redundant)} 个冗余索引，加 --drop 执行")
+
+    if (suggested and apply_c) or (redundant and apply_d):
+        # EXPLAIN 语句不校验 schema cookie，连接里缓存的计划不会随建/删索引失效，换新连接复查
+        close_readers(DB_PATH)
+        with reader(DB_PATH) as conn:
+            report(audit(conn), find_redundant(conn))
+
+
+if __name__ == "__main__":
+    main()
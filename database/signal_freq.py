@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+信号频次统计表 t_signal_freq（加载时增量维护）
+- 粒度：(kind, name, month)，kind 为 signal / pair / triple（与 t_stock_signal / _2 / _3 同口径，name 即信号名 / 组合名）
+- 字段：命中行数 n_hit、命中且 t_stock_label_1=1 的行数 n_pos、当月首次 / 末次出现日期
+- 维护：insert_stock_signal.py 导入后按涉及的月份重算（信号与组合一起），insert_stock_stat.py 导入后重算标签相关的 n_pos；
+  重算是“删当月 + 重新聚合当月”，可重复执行
+- 使用：min_df 列选择、训练期最常见信号 TOP 日志直接查本表，不再扫描透视后的全量矩阵；
+  统计表缺失或落后于 t_stock_signal 时返回 None，调用方回退到原来的按列非零数过滤
+
+用法：
+    cd database && python signal_freq.py                 # 查看各 kind 覆盖情况
+    cd database && python signal_freq.py rebuild         # 全量重建（首次启用时执行一次）
+
+    from database import signal_freq
+    cols = signal_freq.select_cols(conn, "signal", min_df=10, fallback_top=50)   # None 表示没有可用统计
+"""
+import sys
+import sqlite3
+import datetime
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import DB_PATH, writer
+from database.partition import routed
+from database.columnar import read_frame, TEXT
+
+# ===== 配置 =====
+KINDS = ["signal", "pair"]      # 默认维护的统计；三三组合量大，需要时加 "triple"
+
+DDL = """
+CREATE TABLE IF NOT EXISTS t_signal_freq (
+    kind TEXT NOT NULL,             -- signal / pair / triple
+    name TEXT NOT NULL,             -- 信号名 / 组合名（a&b、a&b&c）
+    month INTEGER NOT NULL,         -- yyyymm
+    n_hit INTEGER NOT NULL,         -- 命中行数（值非 0）
+    n_pos INTEGER NOT NULL,         -- 命中且 t_stock_label_1 = 1 的行数
+    first_date INTEGER,             -- 当月首次出现
+    last_date INTEGER,              -- 当月末次出现
+    PRIMARY KEY (kind, name, month)
+) WITHOUT ROWID
+"""
+
+# 与 t_stock_signal_2 / _3 视图同口径；(trade_date, stock_code, signal_name) 唯一，不需要 GROUP BY 去重
+_HITS = {
+    "signal": """
+        SELECT a.trade_date, a.stock_code, a.signal_name AS name
+        FROM t_stock_signal a
+        WHERE a.trade_date BETWEEN ? AND ? AND a.signal_value != 0
+    """,
+    "pair": """
+        SELECT a.trade_date, a.stock_code, a.signal_name || '&' || b.signal_name AS name
+        FROM t_stock_signal a
+        JOIN t_stock_signal b
+          ON a.trade_date = b.trade_date AND a.stock_code = b.stock_code
+         AND a.signal_name < b.signal_name
+        WHERE a.trade_date BETWEEN ? AND ? AND MIN(a.signal_value, b.signal_value) != 0
+    """,
+    "triple": """
+        SELECT a.trade_date, a.stock_code, a.signal_name || '&' || b.signal_name || '&' || c.signal_name AS name
+        FROM t_stock_signal a
+        JOIN t_stock_signal b
+          ON a.trade_date = b.trade_date AND a.stock_code = b.stock_code
+         AND a.signal_name < b.signal_name
+        JOIN t_stock_signal c
+          ON a.trade_date = c.trade_date AND a.stock_code = c.stock_code
+         AND b.signal_name < c.signal_name
+        WHERE a.trade_date BETWEEN ? AND ? AND MIN(a.signal_value, b.signal_value, c.signal_value) != 0
+    """,
+}
+
+_AGG = """
+    SELECT h.name, COUNT(*) AS n_hit, COALESCE(SUM(l.label), 0) AS n_pos,
+           MIN(h.trade_date) AS first_date, MAX(h.trade_date) AS last_date
+    FROM ({hits}) h
+    LEFT JOIN t_stock_label_1 l ON l.trade_date = h.trade_date AND l.stock_code = h.stock_code
+    GROUP BY h.name
+"""
+
+FREQ_DTYPES = {"name": TEXT, "n_hit": "int64", "n_pos": "int64", "first_date": "int64", "last_date": "int64"}
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+def ensure_table(db_path=DB_PATH):
+    with writer(db_path) as conn:
+        conn.execute(DDL)
+
+
+def months_of(trade_dates):
+    """trade_date（yyyymmdd）集合 → 涉及的月份（yyyymm，升序）"""
+    return sorted({int(d) // 100 for d in trade_dates})
+
+
+# ===== 维护 =====
+def refresh(months, kinds=None, db_path=DB_PATH):
+    """重算指定月份的统计（先删后插，每个月份一个事务）"""
+    kinds = kinds or KINDS
+    ensure_table(db_path)
+    for month in months:
+        lo, hi = month * 100, month * 100 + 99
+        for kind in kinds:
+            with routed(start=lo, end=hi, db_path=db_path) as conn:
+                df = read_frame(conn, _AGG.format(hits=_HITS[kind]), params=(lo, hi), dtypes=FREQ_DTYPES)
+            rows = [(kind, n, month, int(h), int(p), int(f), int(l))
+                    for n, h, p, f, l in df[["name", "n_hit", "n_pos", "first_date", "last_date"]].itertuples(index=False)]
+            with writer(db_path) as conn:
+                conn.execute("DELETE FROM t_signal_freq WHERE kind = ? AND month = ?", (kind, month))
+                conn.executemany("INSERT INTO t_signal_freq VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            log(f"t_signal_freq {kind} {month}: {len(rows)} 项")
+
+
+def rebuild(kinds=None, db_path=DB_PATH):
+    """按 t_stock_signal 中出现过的全部月份重建"""
+    with routed(db_path=db_path) as conn:
+        months = [int(r[0]) for r in conn.execute("SELECT DISTINCT trade_date / 100 FROM t_stock_signal ORDER BY 1")]
+    refresh(months, kinds, db_path)
+
+
+# ===== 查询 =====
+def _month_range(start=None, end=None):
+    return (int(start) // 100 if start is not None else 0), (int(end) // 100 if end is not None else 999999)
+
+
+def totals(conn, kind: str, start=None, end=None):
+    """
+    [start, end] 内按 name 汇总：name, n_hit, n_pos, first_date, last_date
+    统计表不存在、为空或落后于 t_stock_signal 最新日期时返回 None
+    """
+    try:
+        last = conn.execute("SELECT MAX(last_date) FROM t_signal_freq WHERE kind = ?", (kind,)).fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+    if last is None:
+        return None
+    latest = conn.execute("SELECT MAX(trade_date) FROM t_stock_signal").fetchone()[0]
+    if latest is not None and last < latest and (end is None or int(end) > last):
+        log(f"⚠️ t_signal_freq {kind} 统计截至 {last}，落后于 t_stock_signal 最新日期 {latest}，本次不使用")
+        return None
+    m_lo, m_hi = _month_range(start, end)
+    return read_frame(conn, """
+        SELECT name, SUM(n_hit) AS n_hit, SUM(n_pos) AS n_pos,
+               MIN(first_date) AS first_date, MAX(last_date) AS last_date
+        FROM t_signal_freq
+        WHERE kind = ? AND month BETWEEN ? AND ?
+        GROUP BY name
+    """, params=(kind, m_lo, m_hi), dtypes=FREQ_DTYPES)
+
+
+def select_cols(conn, kind: str, min_df: int, start=None, end=None, fallback_top: int = 0):
+    """
+    命中数 >= min_df 的名称（升序，与透视列顺序一致）；全部不满足时保底取命中数最多的前 fallback_top 个
+    min_df <= 1（不过滤）或没有可用统计时返回 None
+    """
+    if min_df <= 1:
+        return None
+    df = totals(conn, kind, start, end)
+    if df is None:
+        return None
+    keep = df[df["n_hit"] >= min_df]
+    if keep.empty and fallback_top:
+        keep = df.sort_values(["n_hit", "name"], ascending=[False, True]).head(fallback_top)
+    return sorted(keep["name"].tolist())
+
+
+def top(conn, kind: str, n: int = 20, start=None, end=None):
+    """命中数最多的前 n 个（Series：name → n_hit），没有可用统计时返回 None"""
+    df = totals(conn, kind, start, end)
+    if df is None:
+        return None
+    df = df.sort_values(["n_hit", "name"], ascending=[False, True]).head(n)
+    return pd.Series(df["n_hit"].values, index=df["name"].values, name="n_hit")
+
+
+def status(db_path=DB_PATH):
+    ensure_table(db_path)
+    with routed(db_path=db_path) as conn:
+        df = read_frame(conn, """
+            SELECT kind, COUNT(DISTINCT name) AS n_name, COUNT(DISTINCT month) AS n_month,
+                   MIN(first_date) AS first_date, MAX(last_date) AS last_date, SUM(n_hit) AS n_hit
+            FROM t_signal_freq GROUP BY kind
+        """)
+    if df.empty:
+        log("t_signal_freq 为空，执行 python signal_freq.py rebuild 初始化")
+    for r in df.itertuples(index=False):
+        log(f"{r.kind}: {r.n_name} 项，{r.n_month} 个月 [{r.first_date} ~ {r.last_date}]，命中 {int(r.n_hit):,} 行")
+
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if cmd == "rebuild":
+        rebuild()
+    status()
+
+
+if __name__ == "__main__":
+    main()
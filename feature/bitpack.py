@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+位压缩二元特征矩阵（v1..v19、s_*、p2_*、p3_* 这类 0/1 命中信号）
+- 按列存储：bits[列, 字节]，每个字节装 8 行（np.packbits 的大端位序），每个特征每行只占 1 bit
+- 列统计全部用 popcount 在压缩字上完成：支持度、两两共现、相对标签的命中率
+- 只在进入模型时转换成 uint8 / float32（to_dense / take），转换可按行区间分段进行
+
+用法：
+    from feature import bitpack
+    B = bitpack.from_csr(X)                          # 或 from_dense(ndarray)
+    support, pos, rate = B.hit_rate(y)               # 每列命中数、命中中的正例数、命中率
+    C = B.cooccurrence()                             # 列 × 列 共现次数
+    X_tr = B.to_dense(np.float32, 0, n_train)        # 模型边界再展开
+"""
+import numpy as np
+from scipy import sparse
+
+CHUNK_ROWS = 1 << 18    # from_dense / to_csr 分块处理的行数（8 的倍数）
+
+if hasattr(np, "bitwise_count"):            # numpy >= 2.0
+    def _popcount(a):
+        return np.bitwise_count(a)
+else:
+    _POP = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(a):
+        return _POP[a]
+
+
+def _count(a) -> np.ndarray:
+    """最后一维上的置位总数"""
+    return _popcount(a).sum(axis=-1, dtype=np.int64)
+
+
+def _n_bytes(n_rows: int) -> int:
+    return (n_rows + 7) >> 3
+
+
+def pack_vector(y) -> np.ndarray:
+    """0/1 向量（如标签）压缩成与 BitMatrix 列同布局的字节串"""
+    return np.packbits(np.asarray(y) != 0)
+
+
+class BitMatrix:
+    """列主序的位压缩 0/1 矩阵，shape = (n_rows, n_cols)"""
+
+    def __init__(self, bits: np.ndarray, n_rows: int, cols=None):
+        self.bits = bits                    # uint8 (n_cols, ceil(n_rows / 8))
+        self.n_rows = int(n_rows)
+        self.cols = list(cols) if cols is not None else list(range(bits.shape[0]))
+
+    @property
+    def shape(self):
+        return self.n_rows, self.bits.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    # ===== 列统计 =====
+    def support(self) -> np.ndarray:
+        """每列命中行数"""
+        return _count(self.bits)
+
+    def hit_rate(self, y):
+        """返回 (support, pos, rate)：命中数、命中行中 y=1 的行数、pos / support（无命中为 nan）"""
+        ybits = pack_vector(y)
+        support = self.support()
+        pos = _count(self.bits & ybits)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.where(support > 0, pos / np.maximum(support, 1), np.nan)
+        return support, pos, rate
+
+    def cooccurrence(self, idx=None) -> np.ndarray:
+        """列 × 列 共现次数（idx 给定时只算这些列），对角线即支持度"""
+        idx = np.arange(self.shape[1]) if idx is None else np.asarray(idx)
+        sub = self.bits[idx]
+        out = np.empty((len(idx), len(idx)), dtype=np.int64)
+        for i in range(len(idx)):
+            out[i] = _count(sub & sub[i])
+        return out
+
+    def column_and(self, idx) -> np.ndarray:
+        """多列按位与（组合信号同时命中），返回压缩字节串"""
+        idx = list(idx)
+        acc = self.bits[idx[0]].copy()
+        for j in idx[1:]:
+            acc &= self.bits[j]
+        return acc
+
+    def nonzero_rows(self, j) -> np.ndarray:
+        """第 j 列命中的行号（升序）"""
+        return np.flatnonzero(np.unpackbits(self.bits[j], count=self.n_rows))
+
+    # ===== 行选择 =====
+    def rows(self, lo: int, hi: int) -> "BitMatrix":
+        """行区间 [lo, hi)；lo 为 8 的倍数时直接切字节（hi 不是 8 的倍数时复制并清掉末字节中 hi 之后的位）"""
+        hi = min(hi, self.n_rows)
+        if lo % 8 == 0:
+            bits = self.bits[:, lo >> 3:_n_bytes(hi)]
+            if hi % 8:
+                bits = bits.copy()
+                bits[:, -1] &= np.uint8((0xFF << (8 - hi % 8)) & 0xFF)
+            return BitMatrix(bits, hi - lo, self.cols)
+        return from_dense(self.to_dense(np.uint8, lo, hi), self.cols)
+
+    # ===== 模型边界：展开 =====
+    def to_dense(self, dtype=np.uint8, lo: int = 0, hi: int = None) -> np.ndarray:
+        """行区间 [lo, hi) 展开成 (行, 列) 的 C 连续矩阵"""
+        hi = self.n_rows if hi is None else min(hi, self.n_rows)
+        b0 = lo >> 3
+        u = np.unpackbits(self.bits[:, b0:_n_bytes(hi)], axis=1)[:, lo - 8 * b0:hi - 8 * b0]
+        return np.ascontiguousarray(u.T, dtype=dtype)
+
+    def take(self, idx, dtype=np.uint8) -> np.ndarray:
+        """任意行号展开（不经过整表解压）"""
+        idx = np.asarray(idx, dtype=np.int64)
+        shift = (7 - (idx & 7)).astype(np.uint8)
+        u = (self.bits[:, idx >> 3] >> shift) & 1
+        return np.ascontiguousarray(u.T, dtype=dtype)
+
+    def to_csr(self, dtype=np.float32, chunk_rows: int = CHUNK_ROWS) -> sparse.csr_matrix:
+        blocks = [sparse.csr_matrix(self.to_dense(dtype, lo, lo + chunk_rows))
+                  for lo in range(0, self.n_rows, chunk_rows)]
+        if not blocks:
+            return sparse.csr_matrix((0, self.shape[1]), dtype=dtype)
+        return sparse.vstack(blocks, format="csr")
+
+    # ===== 持久化 =====
+    def save(self, path):
+        np.savez(path, bits=self.bits, n_rows=self.n_rows, cols=np.asarray(self.cols, dtype=object))
+
+
+def load(path) -> BitMatrix:
+    z = np.load(path, allow_pickle=True)
+    return BitMatrix(z["bits"], int(z["n_rows"]), z["cols"].tolist())
+
+
+# ===== 构造 =====
+def from_dense(A, cols=None, chunk_rows: int = CHUNK_ROWS) -> BitMatrix:
+    """稠密矩阵（非零即命中）→ BitMatrix，分块压缩控制临时内存"""
+    A = np.asarray(A)
+    n_rows, n_cols = A.shape
+    bits = np.empty((n_cols, _n_bytes(n_rows)), dtype=np.uint8)
+    for lo in range(0, n_rows, chunk_rows):
+        hi = min(lo + chunk_rows, n_rows)
+        bits[:, lo >> 3:_n_bytes(hi)] = np.packbits(A[lo:hi] != 0, axis=0).T
+    return BitMatrix(bits, n_rows, cols)
+
+
+def from_csr(X, cols=None) -> BitMatrix:
+    """CSR（非零即命中）→ BitMatrix，直接由非零坐标置位，不经过稠密矩阵"""
+    X = sparse.csr_matrix(X)
+    n_rows, n_cols = X.shape
+    n_bytes = _n_bytes(n_rows)
+    row = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(X.indptr))
+    ok = X.data != 0
+    row, col = row[ok], X.indices[ok].astype(np.int64)
+
+    bits = np.zeros(n_cols * n_bytes, dtype=np.uint8)
+    if len(row):
+        # 同一字节的多个位先排序合并（按位或），再一次写入
+        lin = col * n_bytes + (row >> 3)
+        mask = (0x80 >> (row & 7)).astype(np.uint8)
+        order = np.argsort(lin, kind="stable")
+        lin, mask = lin[order], mask[order]
+        starts = np.flatnonzero(np.r_[True, lin[1:] != lin[:-1]])
+        bits[lin[starts]] = np.bitwise_or.reduceat(mask, starts)
+    return BitMatrix(bits.reshape(n_cols, n_bytes), n_rows, cols)
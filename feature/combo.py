@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+信号组合挖掘（支持度 + 提升度剪枝）与组合统计
+- 事务：每个 (trade_date, stock_code) 当日命中的信号集合；与 t_stock_label_1 内连接后按列位压缩（feature.bitpack）
+- 逐层增长：k 项集 = 前缀相同的两个 k-1 项集合并（Apriori 连接，前缀等价类深度优先展开），
+  候选的命中位串 = 两个父项集位串按位与，命中数 / 正例数直接 popcount，不再做 t_stock_signal_2 / _3 那样的全量自连接
+- 剪枝（都不会丢掉任何可能达标的组合）：
+    支持度：命中行数 < MIN_SUPPORT 的项集连同所有超集丢弃（支持度反单调）
+    提升度：lift = P(label=1 | 命中) / P(label=1)；超集的正例数 ≤ 当前项集正例数、命中数 ≥ MIN_SUPPORT，
+            故超集命中率上界为 n_pos / MIN_SUPPORT，该上界对应的提升度 < MIN_LIFT 的项集不再参与扩展
+- 单信号先按 t_signal_freq（命中数只多不少）过滤掉支持度不够的列，再读特征仓库
+- 结果：2..MAX_LEN 项、lift >= MIN_LIFT 的组合写入 t_combo_eval（combo_type = p{k}，组合名同 t_stock_signal_2 / _3：信号名升序以 & 连接）
+- 指标以“是否命中”作为打分（闭式计算，不调用 sklearn）：
+    accuracy / pos_rate = 命中行中的正例比例；auc = (TPR + 1 - FPR) / 2；pr_auc = 召回 × 精确率 + (1 - 召回) × 基准正例率
+
+用法：
+    cd feature && python combo.py                    # 全历史挖掘并写入 t_combo_eval
+    cd feature && python combo.py 20240101 20241231  # 指定区间
+
+    from feature import combo
+    res = combo.mine(B, y, min_support=200, min_lift=1.2, max_len=5)
+"""
+import sys
+import time
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import DB_PATH, writer
+from database.partition import routed
+from database.columnar import read_frame, LABEL_DTYPES
+from database import signal_freq
+from feature import store, bitpack
+from feature.pivot import join_rows
+
+# ===== 配置 =====
+MIN_SUPPORT = 200       # 组合最少命中行数（有标签的行）
+MIN_LIFT = 1.2          # 最低提升度（输出与扩展都以此剪枝）
+MAX_LEN = 5             # 最多几个信号的组合
+REPLACE_OLD = True      # 写入前删除 t_combo_eval 中同 combo_type（p2..p{MAX_LEN}）的旧记录
+
+EVAL_DDL = """
+CREATE TABLE IF NOT EXISTS t_combo_eval (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    combo_type TEXT,
+    combo_name TEXT,
+    n_samples INT,
+    accuracy REAL,
+    auc REAL,
+    pr_auc REAL,
+    pos_rate REAL,
+    lift REAL,
+    create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+EVAL_COLS = ["combo_type", "combo_name", "n_samples", "accuracy", "auc", "pr_auc", "pos_rate", "lift"]
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+# ===== 闭式指标（打分 = 是否命中）=====
+def binary_metrics(n_hit, n_pos, P: int, N: int) -> pd.DataFrame:
+    """
+    n_hit / n_pos：各组合的命中行数、命中行中的正例数（数组）；P / N：全部有标签行中的正 / 负例数
+    返回 accuracy, auc, pr_auc, pos_rate, lift（与输入等长）
+    """
+    n_hit = np.asarray(n_hit, dtype=np.float64)
+    n_pos = np.asarray(n_pos, dtype=np.float64)
+    base = P / max(P + N, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prec = np.where(n_hit > 0, n_pos / np.maximum(n_hit, 1), np.nan)
+        tpr = n_pos / max(P, 1)
+        fpr = (n_hit - n_pos) / max(N, 1)
+        lift = prec / base if base > 0 else np.full_like(prec, np.nan)
+    return pd.DataFrame({
+        "accuracy": prec,
+        "auc": (tpr + 1.0 - fpr) / 2.0,
+        "pr_auc": tpr * prec + (1.0 - tpr) * base,
+        "pos_rate": prec,
+        "lift": lift,
+    })
+
+
+# ===== 写入 t_combo_eval =====
+def ensure_eval_table(db_path=DB_PATH):
+    """建表；旧表没有 lift 列时补列"""
+    with writer(db_path) as conn:
+        conn.execute(EVAL_DDL)
+        have = {r[1] for r in conn.execute("PRAGMA table_info(t_combo_eval)")}
+        if "lift" not in have:
+            conn.execute("ALTER TABLE t_combo_eval ADD COLUMN lift REAL")
+
+
+def save_eval(df: pd.DataFrame, replace_types=None, db_path=DB_PATH) -> int:
+    """df 含 EVAL_COLS（lift 可缺省）；replace_types 给定时先删除这些 combo_type 的旧记录"""
+    ensure_eval_table(db_path)
+    df = df.reindex(columns=EVAL_COLS)
+    rows = [tuple(None if pd.isna(v) else (v.item() if hasattr(v, "item") else v) for v in r)
+            for r in df.itertuples(index=False)]
+    with writer(db_path) as conn:
+        for t in replace_types or []:
+            conn.execute("DELETE FROM t_combo_eval WHERE combo_type = ?", (t,))
+        conn.executemany(f"INSERT INTO t_combo_eval({', '.join(EVAL_COLS)}) VALUES ({', '.join('?' * len(EVAL_COLS))})", rows)
+    return len(rows)
+
+
+# ===== 挖掘 =====
+def mine(B: bitpack.BitMatrix, y, min_support: int = MIN_SUPPORT, min_lift: float = MIN_LIFT,
+         max_len: int = MAX_LEN, P: int = None, N: int = None) -> pd.DataFrame:
+    """
+    B：行 = 有标签的 (日, 股)，列 = 单信号；y：与 B 行对齐的 0/1 标签
+    P / N：计算基准正例率与 AUC 的全体正 / 负例数（默认取 y；无信号的有标签行也应计入时由调用方传入）
+    返回 2..max_len 项中 lift >= min_lift 的组合：items, k, n_hit, n_pos 及闭式指标，按 k、lift 降序
+    """
+    y = np.asarray(y)
+    P = int(y.sum()) if P is None else int(P)
+    N = int(len(y) - y.sum()) if N is None else int(N)
+    base = P / max(P + N, 1)
+    if base <= 0:
+        return pd.DataFrame(columns=["items", "k", "n_hit", "n_pos"])
+    ybits = bitpack.pack_vector(y)
+    # 提升度上界：子孙的命中率 ≤ n_pos / min_support
+    grow_min_pos = min_lift * base * min_support
+
+    support, pos, _ = B.hit_rate(y)
+    keep = np.flatnonzero((support >= min_support) & (pos >= grow_min_pos))
+    names = [str(B.cols[j]) for j in keep]
+    order = np.argsort(names, kind="stable")            # 项内按信号名升序，组合名与视图一致
+    keep = keep[order]
+    log(f"[combo] 单信号 {B.shape[1]} → 可扩展 {len(keep)}（支持度 >= {min_support}，提升度上界 >= {min_lift}）")
+
+    out_items, out_hit, out_pos = [], [], []
+    n_checked = [0] * (max_len + 1)
+
+    def expand(prefix, items, bits, k):
+        """prefix 的等价类：items[i] 为最后一项，bits[i] 为 prefix + items[i] 的命中位串；扩展出 k+1 项"""
+        for i in range(len(items) - 1):
+            sub = bits[i + 1:] & bits[i]                # 与后续兄弟合并：k+1 项候选
+            n_hit = bitpack._count(sub)
+            n_pos = bitpack._count(sub & ybits)
+            n_checked[k + 1] += len(sub)
+            ok = np.flatnonzero((n_hit >= min_support) & (n_pos >= grow_min_pos))
+            if len(ok) == 0:
+                continue
+            head = prefix + [items[i]]
+            lift = n_pos[ok] / n_hit[ok] / base
+            for j, lf in zip(ok, lift):
+                if lf >= min_lift:
+                    out_items.append(head + [items[i + 1 + j]])
+                    out_hit.append(int(n_hit[j]))
+                    out_pos.append(int(n_pos[j]))
+            if k + 1 < max_len and len(ok) > 1:
+                expand(head, [items[i + 1 + j] for j in ok], sub[ok], k + 1)
+
+    t0 = time.time()
+    if max_len >= 2 and len(keep) > 1:
+        expand([], [str(B.cols[j]) for j in keep], B.bits[keep], 1)
+    for k in range(2, max_len + 1):
+        n_out = sum(1 for it in out_items if len(it) == k)
+        log(f"[combo] {k} 项：检查候选 {n_checked[k]:,}，达标 {n_out:,}")
+    log(f"[combo] 挖掘用时 {time.time() - t0:.2f}s")
+
+    res = pd.DataFrame({"items": out_items, "n_hit": out_hit, "n_pos": out_pos})
+    res["k"] = res["items"].map(len)
+    res = pd.concat([res, binary_metrics(res["n_hit"].values, res["n_pos"].values, P, N)], axis=1)
+    return res.sort_values(["k", "lift", "n_hit"], ascending=[True, False, False]).reset_index(drop=True)
+
+
+# ===== 数据准备 =====
+def load_transactions(conn, start=None, end=None, min_support: int = MIN_SUPPORT):
+    """返回 (B, y, P, N)：B 为有标签行的单信号位矩阵，P / N 为区间内全部有标签行的正 / 负例数"""
+    where, params = store._where(start, end)
+    y_df = read_frame(conn, f"SELECT trade_date, stock_code, label FROM t_stock_label_1 {where}",
+                      params=params, dtypes=LABEL_DTYPES)
+    P = int(y_df["label"].sum())
+    N = len(y_df) - P
+    cols = signal_freq.select_cols(conn, "signal", min_support, start, end)
+    X, dates, codes, names = store.load(conn, "signal", start=start, end=end, cols=cols)
+    lab = join_rows(dates, codes, y_df)
+    B = bitpack.from_csr(X[lab["_row"].values], names)
+    log(f"[combo] 事务 {B.shape[0]:,} 行 × {B.shape[1]} 信号（位矩阵 {B.nbytes / 1e6:.1f} MB），"
+        f"有标签行 {P + N:,}，正例率 {P / max(P + N, 1):.4f}")
+    return B, lab["label"].values, P, N
+
+
+def run(start=None, end=None, db_path=DB_PATH):
+    with routed(start=start, end=end, db_path=db_path) as conn:
+        B, y, P, N = load_transactions(conn, start, end, MIN_SUPPORT)
+    res = mine(B, y, MIN_SUPPORT, MIN_LIFT, MAX_LEN, P=P, N=N)
+    if res.empty:
+        log("⚠️ 没有组合满足支持度 / 提升度条件")
+        return res
+    res["combo_type"] = "p" + res["k"].astype(str)
+    res["combo_name"] = res["items"].map("&".join)
+    res["n_samples"] = res["n_hit"]
+    types = [f"p{k}" for k in range(2, MAX_LEN + 1)] if REPLACE_OLD else None
+    n = save_eval(res, replace_types=types, db_path=db_path)
+    log(f"组合挖掘完成，写入 t_combo_eval {n} 条")
+    print(res.groupby("k").head(5)[["combo_name", "n_hit", "n_pos", "pos_rate", "lift", "auc"]].to_string(index=False))
+    return res
+
+
+def main():
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+磁盘设计矩阵（memmap）：训练矩阵只写一次到磁盘，训练 / 测试切分是按日期连续行区间的视图，不再复制
+- 格式：
+    dense_f32：float32 稠密，sklearn 树模型可直接使用（不再转换 / 复制）
+    dense_u8 ：uint8 稠密，0/1 信号体积只有 float32 的 1/4，进模型时再转换
+    csr      ：data / indices / indptr 三个 memmap，行区间切片只复制 indptr
+- 行必须按 trade_date 升序（feature.pivot / feature.store 的输出天然满足），切分点用 searchsorted 定位
+- Writer 支持分块追加：矩阵可以逐日 / 逐块写入，总规模不受内存限制；
+  write_days 直接消费 feature.store.iter_days 的逐日分区（可顺带逐日关联标签），整段矩阵不在内存中拼出
+- 训练脚本共用下面的配置（是否落盘 / 目录 / 格式），脚本只用 path_for(名称) 给出自己的矩阵目录
+
+用法：
+    from feature import design
+    dm = design.save("../train/design_rf3", X, row_dates, fmt="csr")
+    X_train, X_test = dm.split(split_date)           # 两个视图：trade_date < split_date / >= split_date
+
+    w = design.Writer("../train/design_big", n_cols=len(cols), fmt="dense_u8")
+    for X_day, dates_day in blocks:
+        w.append(X_day, dates_day)
+    dm = w.close()
+
+    cols, days = store.iter_days(conn, "signal", cols=sel)
+    dm, df = design.write_days(design.path_for("rf2"), days, len(cols), labels=y_df)   # df 与 dm 行对齐
+"""
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+FORMATS = {"dense_f32": np.float32, "dense_u8": np.uint8, "csr": np.float32}
+CHUNK_ROWS = 200000     # save() 时每块写入的行数（控制稠密化的临时内存）
+
+# ===== 配置（训练脚本共用）=====
+# 设计矩阵落盘：训练 / 测试切分为 memmap 上按日期连续的行视图，不再复制；False 时脚本走内存矩阵
+USE_MMAP = False
+MMAP_DIR = Path(__file__).resolve().parents[1] / "train"
+MMAP_FORMAT = "csr"     # "csr" / "dense_f32"（sklearn 直接使用，免转换）/ "dense_u8"
+
+
+def path_for(name: str) -> Path:
+    """脚本 name 的设计矩阵目录（MMAP_DIR/design_<name>）"""
+    return MMAP_DIR / f"design_{name}"
+
+
+class Writer:
+    """分块追加写入设计矩阵；行需按 trade_date 升序追加"""
+
+    def __init__(self, path, n_cols: int, fmt: str = "csr"):
+        if fmt not in FORMATS:
+            raise ValueError(f"未知格式 {fmt}，可选：{list(FORMATS)}")
+        self.path = Path(path)
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.path.mkdir(parents=True)
+        self.fmt, self.n_cols, self.dtype = fmt, int(n_cols), FORMATS[fmt]
+        self.n_rows, self.nnz, self.last_date = 0, 0, None
+        self._dates = open(self.path / "dates.bin", "wb")
+        if fmt == "csr":
+            self._data = open(self.path / "data.bin", "wb")
+            self._indices = open(self.path / "indices.bin", "wb")
+            self._row_nnz = open(self.path / "row_nnz.bin", "wb")
+        else:
+            self._X = open(self.path / "X.bin", "wb")
+
+    def append(self, X, row_dates):
+        row_dates = np.asarray(row_dates, dtype=np.int64)
+        if X.shape[0] != len(row_dates) or X.shape[1] != self.n_cols:
+            raise ValueError(f"块形状 {X.shape} 与行键 {len(row_dates)} / 列数 {self.n_cols} 不一致")
+        if len(row_dates) == 0:
+            return
+        if np.any(np.diff(row_dates) < 0) or (self.last_date is not None and row_dates[0] < self.last_date):
+            raise ValueError("行必须按 trade_date 升序追加")
+        self.last_date = row_dates[-1]
+        row_dates.tofile(self._dates)
+
+        if self.fmt == "csr":
+            X = sparse.csr_matrix(X)
+            X.sum_duplicates()
+            X.data.astype(self.dtype, copy=False).tofile(self._data)
+            X.indices.astype(np.int32, copy=False).tofile(self._indices)
+            np.diff(X.indptr).astype(np.int64).tofile(self._row_nnz)
+            self.nnz += X.nnz
+        else:
+            X = X.toarray() if sparse.issparse(X) else np.asarray(X)
+            np.ascontiguousarray(X, dtype=self.dtype).tofile(self._X)
+        self.n_rows += X.shape[0]
+
+    def close(self) -> "DesignMatrix":
+        self._dates.close()
+        if self.fmt == "csr":
+            for f in (self._data, self._indices, self._row_nnz):
+                f.close()
+            # indptr 由逐行非零数累加得到（int64，避免超过 2^31 个非零时溢出）
+            row_nnz = np.fromfile(self.path / "row_nnz.bin", dtype=np.int64)
+            indptr = np.zeros(self.n_rows + 1, dtype=np.int64)
+            np.cumsum(row_nnz, out=indptr[1:])
+            indptr.tofile(self.path / "indptr.bin")
+            (self.path / "row_nnz.bin").unlink()
+        else:
+            self._X.close()
+        meta = {"fmt": self.fmt, "n_rows": self.n_rows, "n_cols": self.n_cols, "nnz": self.nnz}
+        (self.path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        return DesignMatrix(self.path)
+
+
+class DesignMatrix:
+    """只读打开磁盘设计矩阵；所有取行操作返回视图（csr 只复制 indptr）"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.fmt = meta["fmt"]
+        self.shape = (meta["n_rows"], meta["n_cols"])
+        self.dates = self._map("dates.bin", np.int64, (self.shape[0],))
+        if self.fmt == "csr":
+            self.data = self._map("data.bin", FORMATS["csr"], (meta["nnz"],))
+            self.indices = self._map("indices.bin", np.int32, (meta["nnz"],))
+            self.indptr = self._map("indptr.bin", np.int64, (self.shape[0] + 1,))
+        else:
+            self.X = self._map("X.bin", FORMATS[self.fmt], self.shape)
+
+    def _map(self, name, dtype, shape):
+        if int(np.prod(shape)) == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.path / name, dtype=dtype, mode="r", shape=shape)
+
+    def rows(self, lo: int, hi: int):
+        """行区间 [lo, hi) 的视图"""
+        if self.fmt != "csr":
+            return self.X[lo:hi]
+        a, b = int(self.indptr[lo]), int(self.indptr[hi])
+        indptr = np.asarray(self.indptr[lo:hi + 1]) - a
+        return sparse.csr_matrix((self.data[a:b], self.indices[a:b], indptr),
+                                 shape=(hi - lo, self.shape[1]), copy=False)
+
+    def date_range(self, start=None, end=None):
+        """trade_date 在 [start, end] 的行区间 (lo, hi)"""
+        lo = 0 if start is None else int(np.searchsorted(self.dates, start, side="left"))
+        hi = self.shape[0] if end is None else int(np.searchsorted(self.dates, end, side="right"))
+        return lo, hi
+
+    def select(self, start=None, end=None):
+        return self.rows(*self.date_range(start, end))
+
+    def split(self, split_date):
+        """按日期切成 (trade_date < split_date, trade_date >= split_date) 两个视图"""
+        k = int(np.searchsorted(self.dates, split_date, side="left"))
+        return self.rows(0, k), self.rows(k, self.shape[0])
+
+    def matrix(self):
+        return self.rows(0, self.shape[0])
+
+
+def save(path, X, row_dates, fmt: str = "csr", chunk_rows: int = CHUNK_ROWS) -> DesignMatrix:
+    """把内存中的矩阵（CSR / ndarray，行按 trade_date 升序）分块写盘并以 memmap 打开"""
+    w = Writer(path, X.shape[1], fmt)
+    row_dates = np.asarray(row_dates)
+    for lo in range(0, X.shape[0], chunk_rows):
+        w.append(X[lo:lo + chunk_rows], row_dates[lo:lo + chunk_rows])
+    return w.close()
+
+
+def write_days(path, days, n_cols: int, labels: pd.DataFrame = None, fmt: str = None):
+    """
+    逐日写盘：days 为 (trade_date, X, row_codes) 的迭代器（feature.store.iter_days / join_days），日期升序
+    labels 为空时返回 DesignMatrix；给定（含 trade_date, stock_code 的标签表）时每日只保留能关联上标签的行（内连接），
+    返回 (DesignMatrix, 与其行对齐的标签表)
+    """
+    w = Writer(path, n_cols, fmt or MMAP_FORMAT)
+    by_day = None if labels is None else dict(iter(labels.groupby("trade_date", sort=False)))
+    rows = []
+    for dt, X, codes in days:
+        if by_day is not None:
+            y = by_day.get(dt)
+            if y is None:
+                continue
+            keys = pd.DataFrame({"stock_code": codes, "_row": np.arange(len(codes))})
+            j = keys.merge(y, on="stock_code", how="inner", validate="one_to_one").sort_values("_row", kind="stable")
+            X = X[j["_row"].values]
+            rows.append(j.drop(columns="_row"))
+        w.append(X, np.repeat(np.array([dt]), X.shape[0]))
+    dm = w.close()
+    if labels is None:
+        return dm
+    cols = list(labels.columns)
+    df = pd.concat(rows, ignore_index=True)[cols] if rows else labels.iloc[:0]
+    return dm, df
+
+
+def open_matrix(path) -> DesignMatrix:
+    return DesignMatrix(path)
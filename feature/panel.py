@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+按股票排序的量价面板上的向量化时序特征（滞后 / 滚动 / EMA），不做 Python 层 groupby
+- 面板：行按 (stock_code, trade_date) 升序排成一维，starts 为每只股票的段起点；所有算子对 (n,) 或 (n, k) 数组
+  一次处理多列，段边界用“段内位置”屏蔽，不会跨股票取值
+- 算子：
+    lag(V, starts, n)          ：段内上 n 行（n < 0 为下 |n| 行，即 shift(-|n|)），不足为 NaN
+    rolling(V, starts, w, how) ：段内窗口 w 的 mean / std（ddof=1）/ min / max，不足 w 行为 NaN（同 pandas rolling 默认）
+    ema(V, starts, span)       ：等价 ewm(span, adjust=False).mean()（ignore_na=False）：NaN 行输出上一值；
+                                 距上次观测 g 行时旧值权重 w = (1-alpha)^g、新值权重 alpha，新值 = (w·旧值 + alpha·x) / (w + alpha)
+                                 （即 pandas 文档的按绝对位置加权；无 NaN 时 g = 1，退化为 alpha·x + (1-alpha)·旧值）
+  mean / std 用前缀和相减，min / max 按窗口逐步取 fmin / fmax，ema 按“段内位置”逐步推进（每步处理所有股票）
+- compute(df, features)：DataFrame 入口，features 为 (算子, 列, 参数) 列表，输出与 df 行对齐；
+  同一算子 + 参数的多列合并成一次计算。feature.store 的 panel 类特征集即由它生成
+
+用法：
+    from feature import panel
+    out = panel.compute(df, [("lag", "pct_chg", 1), ("mean", "turnover", 5), ("ema", "close", 10)])
+    out.columns  →  lag1_pct_chg, ma5_turnover, ema10_close
+"""
+import numpy as np
+import pandas as pd
+
+PREFIX = {"lag": "lag", "mean": "ma", "std": "std", "min": "min", "max": "max", "ema": "ema"}
+
+
+# ===== 段结构 =====
+def segment_starts(codes) -> np.ndarray:
+    """已排序的 stock_code 数组 → 各段起点"""
+    codes = np.asarray(codes)
+    if len(codes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+
+
+class _Seg:
+    """段结构缓存：段起点、各段长度、每行的段号与段内位置（compute 中所有算子共用一份）"""
+
+    def __init__(self, n: int, starts):
+        self.n = n
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.lengths = np.diff(np.r_[self.starts, n])
+        self.seg = np.repeat(np.arange(len(self.starts)), self.lengths)
+        self.pos = np.arange(n) - self.starts[self.seg]
+
+
+def _seg(V, starts):
+    return starts if isinstance(starts, _Seg) else _Seg(np.asarray(V).shape[0], starts)
+
+
+def _as2d(V):
+    V = np.asarray(V, dtype=np.float64)
+    return (V[:, None], True) if V.ndim == 1 else (V, False)
+
+
+# ===== 算子 =====
+def lag(V, starts, n: int = 1):
+    sg = _seg(V, starts)
+    V, flat = _as2d(V)
+    N = V.shape[0]
+    out = np.full_like(V, np.nan)
+    if n == 0 or N == 0:
+        out[:] = V
+    elif n > 0:
+        out[n:] = V[:-n]
+        out[sg.pos < n] = np.nan
+    else:
+        out[:n] = V[-n:]
+        out[sg.pos >= sg.lengths[sg.seg] + n] = np.nan
+    return out[:, 0] if flat else out
+
+
+def _window_diff(S, window: int, N: int):
+    """前缀和 S（首行为 0，共 N+1 行）→ 每行以其结尾、长度 window 的窗口和（行号 < window-1 时从 0 开始）"""
+    head = np.repeat(S[:1], min(window - 1, N), axis=0)
+    return S[1:] - np.vstack([head, S[:max(N - window + 1, 0)]])
+
+
+def rolling(V, starts, window: int, how: str = "mean"):
+    sg = _seg(V, starts)
+    V, flat = _as2d(V)
+    N, k = V.shape
+    out = np.full_like(V, np.nan)
+    if N == 0:
+        return out[:, 0] if flat else out
+    full = sg.pos >= window - 1                   # 段内已满一个窗口
+
+    if how in ("mean", "std"):
+        ok = ~np.isnan(V)
+        X = np.where(ok, V, 0.0)
+        # 前缀和（首行补 0），窗口和 = S[i+1] - S[i+1-w]，窗口起点不会越过段起点（未满窗口的行已屏蔽）
+        zero = np.zeros((1, k))
+        cnt = _window_diff(np.vstack([zero, np.cumsum(ok, axis=0, dtype=np.float64)]), window, N)
+        s1 = _window_diff(np.vstack([zero, np.cumsum(X, axis=0)]), window, N)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = s1 / cnt
+            if how == "mean":
+                res = mean
+            else:
+                s2 = _window_diff(np.vstack([zero, np.cumsum(X * X, axis=0)]), window, N)
+                res = np.sqrt(np.maximum((s2 - s1 * mean) / (cnt - 1), 0.0))
+        # 与 pandas 一致：窗口内有 NaN（有效数 < window）时为 NaN
+        res[cnt < window] = np.nan
+        out[full] = res[full]
+    elif how in ("min", "max"):
+        f = np.fmin if how == "min" else np.fmax
+        acc = V.copy()
+        nan_seen = np.isnan(V)
+        for j in range(1, window):
+            prev = np.full_like(V, np.nan)
+            prev[j:] = V[:-j]
+            acc = f(acc, prev)
+            nan_seen[j:] |= np.isnan(V[:-j])
+        acc[nan_seen] = np.nan
+        out[full] = acc[full]
+    else:
+        raise ValueError(f"未知滚动统计 {how}")
+    return out[:, 0] if flat else out
+
+
+def ema(V, starts, span: int):
+    sg = _seg(V, starts)
+    V, flat = _as2d(V)
+    N = V.shape[0]
+    out = np.full_like(V, np.nan)
+    if N == 0:
+        return out[:, 0] if flat else out
+    alpha = 2.0 / (span + 1.0)
+    lengths = sg.lengths
+    order = np.argsort(-lengths, kind="stable")       # 段按长度降序：第 t 步仍存活的段是前缀
+    s_sorted, len_sorted = sg.starts[order], lengths[order]
+    prev = np.full((len(lengths), V.shape[1]), np.nan)
+    old_wt = np.ones_like(prev)                        # 旧值权重 (1 - alpha)^(距上次观测的行数)，有观测后重置为 1
+    for t in range(int(lengths.max())):
+        m = int(np.searchsorted(-len_sorted, -t, side="left"))   # 长度 > t 的段数
+        rows = s_sorted[:m] + t
+        x, p = V[rows], prev[:m]
+        obs, has_prev = ~np.isnan(x), ~np.isnan(p)
+        w = np.where(has_prev, old_wt[:m] * (1.0 - alpha), old_wt[:m])
+        cur = np.where(has_prev, (w * p + alpha * x) / (w + alpha), x)
+        cur = np.where(obs, cur, p)
+        old_wt[:m] = np.where(obs, 1.0, w)
+        prev[:m] = cur
+        out[rows] = cur
+    return out[:, 0] if flat else out
+
+
+# ===== DataFrame 入口 =====
+def feature_name(op: str, col: str, param: int) -> str:
+    if op == "lag" and param < 0:
+        return f"lead{-param}_{col}"
+    return f"{PREFIX[op]}{param}_{col}"
+
+
+def compute(df: pd.DataFrame, features, by: str = "stock_code", order_by: str = "trade_date") -> pd.DataFrame:
+    """
+    features: [(算子, 列, 参数)]，算子为 lag / mean / std / min / max / ema
+    返回与 df 行（及索引）对齐的特征 DataFrame，列顺序同 features
+    """
+    # 股票代码先编码成整数再排序；已按 (by, order_by) 升序时不重排
+    code_id = pd.factorize(df[by], sort=True)[0]
+    dates = df[order_by].to_numpy()
+    same = code_id[1:] == code_id[:-1]
+    if np.all((code_id[1:] > code_id[:-1]) | (same & (dates[1:] > dates[:-1]))):
+        order = None
+        sg = _Seg(len(df), segment_starts(code_id))
+    else:
+        order = np.lexsort((dates, code_id))
+        sg = _Seg(len(df), segment_starts(code_id[order]))
+
+    groups = {}
+    for op, col, param in features:
+        groups.setdefault((op, int(param)), []).append(col)
+
+    out = {}
+    for (op, param), cols in groups.items():
+        V = df[cols].to_numpy(np.float64)
+        if order is not None:
+            V = V[order]
+        if op == "lag":
+            R = lag(V, sg, param)
+        elif op == "ema":
+            R = ema(V, sg, param)
+        else:
+            R = rolling(V, sg, param, op)
+        if order is None:
+            back = R
+        else:
+            back = np.empty_like(R)
+            back[order] = R
+        for j, col in enumerate(cols):
+            out[feature_name(op, col, param)] = back[:, j]
+    names = [feature_name(op, col, int(param)) for op, col, param in features]
+    return pd.DataFrame(out, index=df.index)[names]
+
+
+def lookback(features) -> int:
+    """features 需要向前多读的交易日数（EMA 取 6×span 预热，截断误差约 (1-α)^(6·span)）"""
+    need = 0
+    for op, _, param in features:
+        param = int(param)
+        if op == "lag":
+            need = max(need, param)
+        elif op == "ema":
+            need = max(need, 6 * param)
+        else:
+            need = max(need, param - 1)
+    return need
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+预测日按时点取特征（point-in-time）
+- get_features(asof_date, codes=None)：只读特征定义需要的回看窗口（feature.store 的 FEATURE_SETS 为唯一定义来源），
+  输出按模型 feature_cols 的列顺序排好的 CSR，不经过整表读取与稠密补列
+- 不看未来：所有查询都带 trade_date <= asof_date；panel 类（滞后 / 滚动 / EMA）只用 asof_date 及之前的窗口计算
+- 窗口缓存：panel 类的原始窗口留在内存，下次调用只补读缓存末日（可能被补录）之后的交易日
+- 行：默认取 sets 中第一个当日有数据的特征集的股票（信号为主、当日无信号时退到量价特征），codes 给定时按 codes 输出
+
+用法：
+    from feature.pit import PointInTime
+    pit = PointInTime(feature_cols, [("signal", ""), ("lag1", "")], conn=conn)
+    X, codes = pit.get_features(20250106)
+"""
+import sys
+import time
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import DB_PATH
+from database.partition import routed
+from feature import store, panel
+from feature.pivot import pivot_frame
+from feature.space import FeatureSpace
+
+DTYPE = store.DTYPE
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+class PointInTime:
+    """
+    feature_cols：模型训练时的列（列名列表或 FeatureSpace，即输出列顺序）
+    sets        ：[(特征集名, 列名前缀)]；特征集列名加前缀后与 feature_cols 对应，不在 feature_cols 中的列丢弃
+    conn        ：给定时所有查询走该连接（SQLite 连接或 SQLAlchemy Engine）；否则每次调用按日期路由打开只读连接
+    """
+
+    def __init__(self, feature_cols, sets, conn=None, db_path=DB_PATH):
+        self.space = feature_cols if isinstance(feature_cols, FeatureSpace) else FeatureSpace(feature_cols)
+        self.feature_cols = self.space.names
+        self.sets = list(sets)
+        self.conn = conn
+        self.db_path = db_path
+        self._win = {}              # 特征集名 → 窗口内原始行（DataFrame）
+        self.base = None            # 最近一次调用中决定行集合的特征集
+
+    # ===== 单个特征集：asof 当日的 (X, codes, cols) =====
+    def _set_cols(self, prefix: str):
+        return [c[len(prefix):] for c in self.feature_cols if c.startswith(prefix)]
+
+    def _day(self, conn, spec, asof, cols):
+        where, params = store._where(asof, asof)
+        df = store._read(conn, spec["sql"].format(where=where), params, spec.get("dtypes"))
+        if spec["kind"] == "pivot":
+            X, _, codes, _ = pivot_frame(df, spec["name_col"], spec["value_col"], cols=cols, dtype=DTYPE)
+            return X, codes
+        df = df.sort_values("stock_code", kind="stable")
+        df = df.rename(columns={c: f"{spec.get('prefix', '')}{c}" for c in spec["value_cols"]})
+        block = df.reindex(columns=cols).fillna(0.0).to_numpy(DTYPE)
+        return sparse.csr_matrix(block), df["stock_code"].values.astype(object)
+
+    def _window_dates(self, conn, spec, asof):
+        n = panel.lookback(spec["features"]) + store.LOOKBACK_PAD + 1
+        d = store._read(conn, f"""
+            SELECT trade_date FROM {spec['version_table']} WHERE trade_date <= :a
+            GROUP BY trade_date ORDER BY trade_date DESC LIMIT {int(n)}
+        """, {"a": store._py(asof)})
+        return list(d["trade_date"])
+
+    def _panel_day(self, conn, name, spec, asof, cols):
+        need = self._window_dates(conn, spec, asof)
+        if not need or need[0] != asof:
+            return None
+        cached = self._win.get(name)
+        keep = pd.DataFrame()
+        if cached is not None and not cached.empty:
+            # 缓存末日可能被补录，始终重读；其余已缓存且在窗口内的交易日直接复用
+            last = cached["trade_date"].max()
+            keep = cached[cached["trade_date"].isin(need) & (cached["trade_date"] < last)]
+        have = set(keep["trade_date"].unique()) if not keep.empty else set()
+        todo = [d for d in need if d not in have]
+        if todo:
+            where, params = store._where(min(todo), max(todo))
+            new = store._read(conn, spec["sql"].format(where=where), params, spec.get("dtypes"))
+            new = new[new["trade_date"].isin(todo)]
+        else:
+            new = keep.iloc[:0]
+        win = pd.concat([keep, new], ignore_index=True) if not keep.empty else new.reset_index(drop=True)
+        if not win.empty and win["trade_date"].max() > asof:
+            raise RuntimeError(f"{name}: 窗口含 {asof} 之后的数据")
+        self._win[name] = win
+
+        feats = panel.compute(win, spec["features"])
+        on_day = (win["trade_date"] == asof).values & feats.notna().any(axis=1).values
+        day = pd.concat([win.loc[on_day, ["stock_code"]], feats.loc[on_day]], axis=1).sort_values("stock_code")
+        block = day.reindex(columns=cols).fillna(0.0).to_numpy(DTYPE)
+        return sparse.csr_matrix(block), day["stock_code"].values.astype(object), len(todo)
+
+    # ===== 对外接口 =====
+    def get_features(self, asof_date, codes=None):
+        """返回 (X csr（列 = feature_cols）, codes)；asof_date 当日及之前的数据之外一律不读"""
+        t0 = time.time()
+        if self.conn is not None:
+            return self._get(self.conn, asof_date, codes, t0)
+        # 回看窗口不超过一年：路由只挂载 asof 所在年及上一年的分区
+        with routed(start=asof_date - 10000, end=asof_date, db_path=self.db_path) as conn:
+            return self._get(conn, asof_date, codes, t0)
+
+    def _get(self, conn, asof, codes, t0):
+        parts, n_read = [], 0
+        for name, prefix in self.sets:
+            spec = store.FEATURE_SETS[name]
+            cols = self._set_cols(prefix)
+            if not cols:
+                continue
+            if spec["kind"] == "panel":
+                res = self._panel_day(conn, name, spec, asof, cols)
+                if res is None:
+                    continue
+                X, c, n = res
+                n_read += n
+            else:
+                X, c = self._day(conn, spec, asof, cols)
+                n_read += 1
+            parts.append((name, X, c, [f"{prefix}{x}" for x in cols]))
+
+        # 行集合：指定 codes，或第一个当日有数据的特征集
+        self.base = None
+        if codes is None:
+            for name, X, c, _ in parts:
+                if len(c):
+                    self.base, codes = name, c
+                    break
+            else:
+                codes = np.empty(0, dtype=object)
+        rows = pd.Index(np.asarray(codes, dtype=object))
+
+        # 按 (行号, 目标列号) 重排非零元素，直接得到 feature_cols 顺序的 CSR
+        r_all, c_all, v_all = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=DTYPE)]
+        for _, X, c, pcols in parts:
+            X = X.tocoo()
+            r = rows.get_indexer(np.asarray(c, dtype=object))[X.row]
+            j = self.space.indexer(pcols)[X.col]
+            ok = (r >= 0) & (j >= 0)
+            r_all.append(r[ok])
+            c_all.append(j[ok])
+            v_all.append(X.data[ok])
+        r_all, c_all, v_all = np.concatenate(r_all), np.concatenate(c_all), np.concatenate(v_all)
+        X = sparse.csr_matrix((v_all, (r_all, c_all)), shape=(len(rows), len(self.feature_cols)), dtype=DTYPE)
+        log(f"[pit] asof={asof} 行数={len(rows)} 非零={X.nnz} 读取交易日={n_read} 用时={time.time() - t0:.3f}s")
+        return X, rows.values
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+稀疏信号透视引擎（替代 pivot_table / crosstab 的稠密宽表）
+- 输入长表四列：trade_date, stock_code, 信号名, 信号值
+- 行键 (trade_date, stock_code) 与信号名各自整数编码，一次排序直接生成 CSR，不经过 行数×信号数 的稠密矩阵
+- 同一 (行, 列) 多条时取 max（与原 aggfunc="max" 一致），值为 0 的不存
+- min_df 按列非零数过滤；cols 给定时按固定列空间输出（预测日对齐训练列）
+- 行按 (trade_date, stock_code) 升序，行键以数组返回
+
+用法：
+    from feature.pivot import pivot_frame, join_rows, filter_min_df
+    X, dates, codes, cols = pivot_frame(sig_df, "signal_name", "signal_value", min_df=10)
+    lab = join_rows(dates, codes, y_df)              # 按行键关联标签（inner）
+    X, y = X[lab["_row"].values], lab["label"].values
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+KEY_COLS = ["trade_date", "stock_code"]
+
+
+def _factorize(values, cols=None):
+    """返回 (编码, 取值表)；cols 给定时按 cols 编码，不在 cols 中的为 -1"""
+    if cols is not None:
+        uniques = pd.Index(cols)
+        return uniques.get_indexer(values), np.asarray(uniques, dtype=object)
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, np.asarray(uniques)
+
+
+def _column_nnz(col_idx, n_cols):
+    return np.bincount(col_idx, minlength=n_cols)
+
+
+def pivot_csr(trade_date, stock_code, name, value=None, min_df: int = 1, cols=None,
+              fallback_top: int = 0, dtype=np.float32):
+    """
+    长表 → CSR
+    参数：
+        trade_date / stock_code / name / value：等长数组；value 为空时视为全 1
+                    （trade_date 可以是 yyyymmdd 整数，也可以是 MySQL 读出的 date 对象）
+        min_df      ：列非零数 < min_df 的列丢弃（cols 给定时不过滤）
+        cols        ：固定列空间（列顺序即 cols 顺序，缺失列全 0，多余信号丢弃）
+        fallback_top：min_df 把列全部过滤掉时，保底保留非零数最多的前 N 列
+    返回：
+        X          ：csr_matrix (n_rows, n_cols)
+        row_dates  ：ndarray（与输入 trade_date 同类型）
+        row_codes  ：ndarray[object]
+        col_names  ：list
+    """
+    trade_date = np.asarray(trade_date)
+    n = len(trade_date)
+    value = np.ones(n, dtype=dtype) if value is None else np.asarray(value, dtype=dtype)
+
+    # 1) 行键编码：日期 × 股票 → 一个 int64，排序去重后即行号（按日期、股票升序）
+    d_idx, d_uni = _factorize(trade_date)
+    s_idx, s_uni = _factorize(np.asarray(stock_code, dtype=object))
+    row_key = d_idx.astype(np.int64) * max(len(s_uni), 1) + s_idx
+    row_uni, row = np.unique(row_key, return_inverse=True)
+    n_rows = len(row_uni)
+    row_dates = d_uni[row_uni // max(len(s_uni), 1)]
+    row_codes = s_uni[row_uni % max(len(s_uni), 1)].astype(object)
+
+    # 2) 列编码；固定列空间时丢掉不在其中的信号
+    col, col_names = _factorize(np.asarray(name, dtype=object), cols)
+    n_cols = len(col_names)
+    ok = (col >= 0) & (value != 0)
+    row, col, value = row[ok], col[ok], value[ok]
+
+    # 3) (行, 列) 排序，重复项取 max
+    lin = row.astype(np.int64) * max(n_cols, 1) + col
+    order = np.argsort(lin, kind="stable")
+    lin = lin[order]
+    if len(lin):
+        starts = np.flatnonzero(np.r_[True, lin[1:] != lin[:-1]])
+        value = np.maximum.reduceat(value[order], starts)
+        lin = lin[starts]
+    row = lin // max(n_cols, 1)
+    col = lin % max(n_cols, 1)
+
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row, minlength=n_rows), out=indptr[1:])
+    X = sparse.csr_matrix((value, col.astype(np.int32), indptr), shape=(n_rows, n_cols))
+
+    # 4) min_df：按列非零数过滤
+    col_names = list(col_names)
+    if cols is None:
+        X, col_names = filter_min_df(X, col_names, min_df, fallback_top)
+    return X, row_dates, row_codes, col_names
+
+
+def filter_min_df(X, cols, min_df: int, fallback_top: int = 0):
+    """
+    丢弃非零数 < min_df 的列，返回 (X, cols)
+    全部被过滤时，fallback_top > 0 则保底保留非零数最多的前 N 列
+    """
+    if min_df <= 1 or X.shape[1] == 0:
+        return X, list(cols)
+    nnz = _column_nnz(X.indices, X.shape[1])
+    keep = nnz >= min_df
+    if not keep.any() and fallback_top:
+        keep[np.argsort(-nnz, kind="stable")[:fallback_top]] = True
+    idx = np.flatnonzero(keep)
+    return X[:, idx].tocsr(), [cols[i] for i in idx]
+
+
+def pivot_frame(df_long: pd.DataFrame, name_col: str, value_col: str = None, **kwargs):
+    """DataFrame 版本：df_long 需含 trade_date, stock_code, name_col[, value_col]"""
+    if df_long is None or df_long.empty:
+        cols = list(kwargs.get("cols") or [])
+        return (sparse.csr_matrix((0, len(cols)), dtype=kwargs.get("dtype", np.float32)),
+                np.empty(0, dtype=np.int64), np.empty(0, dtype=object), cols)
+    value = df_long[value_col].values if value_col else None
+    return pivot_csr(df_long["trade_date"].values, df_long["stock_code"].values,
+                     df_long[name_col].values, value, **kwargs)
+
+
+def join_rows(row_dates, row_codes, df: pd.DataFrame, how: str = "inner") -> pd.DataFrame:
+    """
+    按行键关联另一张 (trade_date, stock_code, ...) 表
+    返回含 _row（CSR 行号）的 DataFrame，按 _row 升序；how="left" 时未匹配行的其余列为 NaN
+    """
+    keys = pd.DataFrame({"trade_date": row_dates, "stock_code": row_codes, "_row": np.arange(len(row_dates))})
+    out = keys.merge(df, on=KEY_COLS, how=how, validate="one_to_one")
+    return out.sort_values("_row", kind="stable").reset_index(drop=True)
+
+
+def align_rows(X, row_dates, row_codes, to_dates, to_codes) -> sparse.csr_matrix:
+    """把 X 的行按行键对齐到目标行键（左连接语义，目标中没有对应行的全 0），用于拼接两份不同行集的 CSR"""
+    src = pd.DataFrame({"trade_date": row_dates, "stock_code": row_codes, "_src": np.arange(len(row_dates))})
+    m = join_rows(to_dates, to_codes, src, how="left")
+    ok = m["_src"].notna().values
+    # 行选择矩阵 P（目标行 × 源行），P @ X 即完成重排与补 0
+    P = sparse.csr_matrix(
+        (np.ones(int(ok.sum()), dtype=X.dtype), (m["_row"].values[ok], m["_src"].values[ok].astype(np.int64))),
+        shape=(len(to_dates), X.shape[0])
+    )
+    return (P @ X).tocsr()
+
+
+def hstack(X, dense_block) -> sparse.csr_matrix:
+    """CSR 右侧拼接少量稠密数值列（如 lag1_*），结果仍为 CSR"""
+    if dense_block is None or np.asarray(dense_block).size == 0:
+        return X.tocsr()
+    block = sparse.csr_matrix(np.asarray(dense_block, dtype=X.dtype))
+    return sparse.hstack([X, block], format="csr")
+
+
+def to_frame(X, row_dates, row_codes, cols, prefix: str = "") -> pd.DataFrame:
+    """CSR → 稠密宽表（只用于预测日等小规模输出）"""
+    wide = pd.DataFrame(X.toarray(), columns=[f"{prefix}{c}" for c in cols])
+    wide.insert(0, "stock_code", row_codes)
+    wide.insert(0, "trade_date", row_dates)
+    return wide
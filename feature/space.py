@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+特征列空间（FeatureSpace）：信号名 / 组合名 → 固定列号，随模型文件一起保存
+- 训练时确定列空间并写入模型 artifact（joblib 里的 "space"，另存一份 <artifact>.space.json 便于查看 / 复用）
+- 预测时按训练列空间直接构造矩阵：源矩阵的非零列号经 indexer 一次映射到目标列号，O(nnz)，
+  不生成稠密列、不做 DataFrame reindex；源矩阵中不在列空间内的列丢弃，列空间中缺失的列即为 0
+- extend() 只在末尾追加新名称，已有名称的列号不变（增量训练 / 多模型共用时列号稳定）
+- fingerprint：列名序列的 sha256 前 16 位，用于登记元数据与比对两次训练的列空间是否一致
+
+用法：
+    from feature.space import FeatureSpace
+    space = FeatureSpace(cols)
+    space.save_for(artifact_path)                       # 或 dump({"model": clf, "space": space.to_dict(), ...})
+    space = FeatureSpace.from_artifact(joblib.load(artifact_path))
+    X_new = space.remap(X_day, day_cols)                 # 任意列集合的 CSR → 训练列顺序
+"""
+import json
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+SUFFIX = ".space.json"
+
+
+def remap_csr(X, col_map, n_cols: int, dtype=None) -> sparse.csr_matrix:
+    """
+    CSR 列号重映射：源列 j → col_map[j]（< 0 为丢弃），输出 n_cols 列
+    只处理非零元素，行结构不变
+    """
+    X = sparse.csr_matrix(X)
+    dtype = dtype or X.dtype
+    col_map = np.asarray(col_map, dtype=np.int64)
+    if X.nnz == 0 or len(col_map) == 0:
+        return sparse.csr_matrix((X.shape[0], n_cols), dtype=dtype)
+    j = col_map[X.indices]
+    keep = j >= 0
+    if keep.all():
+        out = sparse.csr_matrix((X.data.astype(dtype, copy=False), j.astype(np.int32), X.indptr.copy()),
+                                shape=(X.shape[0], n_cols))
+    else:
+        row = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))[keep]
+        indptr = np.zeros(X.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row, minlength=X.shape[0]), out=indptr[1:])
+        out = sparse.csr_matrix((X.data[keep].astype(dtype, copy=False), j[keep].astype(np.int32), indptr),
+                                shape=(X.shape[0], n_cols))
+    out.has_sorted_indices = False
+    return out
+
+
+class FeatureSpace:
+    """有序、无重复的列名表；列号即模型输入的列位置"""
+
+    def __init__(self, names):
+        self.names = [str(n) for n in names]
+        self._index = pd.Index(self.names)
+        if not self._index.is_unique:
+            dup = self._index[self._index.duplicated()].tolist()[:5]
+            raise ValueError(f"列空间存在重复列名：{dup}")
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __eq__(self, other):
+        return isinstance(other, FeatureSpace) and self.names == other.names
+
+    def __repr__(self):
+        return f"FeatureSpace({len(self)} 列, fingerprint={self.fingerprint})"
+
+    @property
+    def fingerprint(self) -> str:
+        return hashlib.sha256("\n".join(self.names).encode("utf-8")).hexdigest()[:16]
+
+    # ===== 映射 =====
+    def indexer(self, cols) -> np.ndarray:
+        """源列名 → 本空间列号（不在空间内为 -1）"""
+        if len(cols) == 0:
+            return np.empty(0, dtype=np.int64)
+        return self._index.get_indexer([str(c) for c in cols]).astype(np.int64)
+
+    def remap(self, X, cols, dtype=None) -> sparse.csr_matrix:
+        """列为 cols 的 CSR → 本空间列顺序的 CSR（缺失列为 0，多余列丢弃）"""
+        return remap_csr(X, self.indexer(cols), len(self), dtype)
+
+    def select(self, cols) -> "FeatureSpace":
+        """保留 cols 中在本空间内的列（按 cols 顺序）"""
+        return FeatureSpace([c for c in cols if c in self])
+
+    def extend(self, names) -> "FeatureSpace":
+        """末尾追加新名称（已有名称列号不变），返回新对象"""
+        return FeatureSpace(self.names + [n for n in dict.fromkeys(str(x) for x in names) if n not in self])
+
+    # ===== 持久化 =====
+    def to_dict(self) -> dict:
+        return {"names": self.names, "fingerprint": self.fingerprint}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "FeatureSpace":
+        space = cls(d["names"])
+        if d.get("fingerprint") and d["fingerprint"] != space.fingerprint:
+            raise ValueError(f"列空间指纹不一致：保存时 {d['fingerprint']}，读取后 {space.fingerprint}")
+        return space
+
+    def save(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps(self.to_dict(), ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path) -> "FeatureSpace":
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def save_for(self, artifact_path):
+        """与模型文件并排保存：<artifact_path>.space.json"""
+        self.save(f"{artifact_path}{SUFFIX}")
+
+    @classmethod
+    def from_artifact(cls, blob: dict) -> "FeatureSpace":
+        """模型 artifact（joblib 读出的 dict）→ 列空间；兼容只存了 cols / feature_cols 的旧模型"""
+        if blob.get("space"):
+            return cls.from_dict(blob["space"])
+        cols = blob.get("cols", blob.get("feature_cols"))
+        if cols is None:
+            raise KeyError("模型文件中没有列空间（space / cols / feature_cols）")
+        return cls(cols)
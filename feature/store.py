@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+"""
+特征仓库：按 trade_date 分区持久化稀疏特征矩阵
+- 每个特征集（FEATURE_SETS 的一项）按 名称 + 定义哈希 定位目录：feature_store/<name>-<定义哈希>/
+  改了 SQL / 列 / 前缀等定义，哈希随之变化，旧目录不再命中（可用 clear 清理）
+- 每个交易日一个分区文件 <trade_date>_<数据版本>.npz：CSR 三数组 + 行股票代码 + 本分区列名
+- 数据版本 = 源表当日 COUNT + 逐行内容指纹之和（version_cols 各列拼接后的 CRC32，行键与取值列都在内）；
+  源数据补录、重算、改名后版本变化，该日分区自动重建；panel 类还计入前序窗口（滞后 / 滚动 / EMA 所依赖的交易日）的指纹
+- load(start, end)：命中的分区直接读，缺失 / 过期的分区一次查询批量构建并落盘，再按列名并集拼接
+  每日重训只需要构建新增的那一天
+- iter_days(start, end)：同 load，但逐日产出按列空间重排后的分区，不拼接整段矩阵（训练矩阵流式写入 feature.design）；
+  select_min_df 逐日累加列非零数做 min_df 列选择，join_days 按日左连接两个特征集
+
+列投影（pivot 且定义含 project）：load(..., project=True) 时把列空间下推到 SQL（project.col IN (...)），
+只读取、透视入选列的事件；投影后的特征集登记为 <name>@<列空间指纹>，单独按交易日分区缓存
+定义了 project.rows 的（只读行键）行集合与未投影时相同（只命中其他列的行为全 0 行），否则只保留命中投影列的行
+注意 project.rows（如 SELECT DISTINCT trade_date, stock_code FROM t_signal_events）仍要扫描窗口内全部事件的行键，
+投影省下的只是非入选列事件的取值读取与透视，读取量并非按入选列比例下降
+
+特征集类型（kind）：
+    pivot  ：长表透视（信号 / 组合），同 feature.pivot.pivot_csr，分区只存当日出现过的列
+    panel  ：逐股时序特征（滞后 / 滚动 / EMA，见 feature.panel），构建时向前多读所需的交易日
+    columns：宽表数值列原样存储（data_v19_dxmm 的 v1..v19）
+
+用法：
+    from feature import store
+    X, dates, codes, cols = store.load(conn, "signal")                                  # 全历史
+    X, dates, codes, cols = store.load(conn, "signal", start=20240101, end=20240131)
+    X, dates, codes, cols = store.load(conn, "signal", start=d, end=d, cols=feature_cols)  # 对齐训练列
+    X, dates, codes, cols = store.load(conn, "xg_event", start=s, end=e, cols=space, project=True)  # 只读入选列的事件
+    cols, days = store.iter_days(conn, "signal", cols=sel)                              # 逐日 (trade_date, X, codes)
+    cd feature && python store.py status
+    cd feature && python store.py build signal pair lag1     # 预热
+    cd feature && python store.py clear [name]
+"""
+import sys
+import json
+import shutil
+import sqlite3
+import hashlib
+import zlib
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import DB_PATH
+from database.columnar import read_frame, SIGNAL_DTYPES, COMBO_DTYPES, FEAT_DTYPES
+from feature.pivot import pivot_frame, align_rows
+from feature import panel
+from feature.space import FeatureSpace
+
+# ===== 配置 =====
+STORE_DIR = Path(__file__).resolve().parents[1] / "feature_store"
+STORE_FORMAT = 1        # 分区文件格式版本，改动存储结构时 +1，所有特征集整体失效
+DTYPE = np.float32
+LOOKBACK_PAD = 20       # panel 类多读的交易日余量（停牌股的上一行可能早于窗口）
+
+V19_COLS = [f"v{i}" for i in range(1, 20)]
+FEAT_COLS = ["turnover", "amplitude", "pct_chg"]
+
+FEATURE_SETS = {
+    # 原始信号：t_stock_signal 长表透视（RandomForestClassifier1-4）
+    "signal": {
+        "kind": "pivot",
+        "sql": "SELECT trade_date, stock_code, signal_name, signal_value FROM t_stock_signal {where}",
+        "dtypes": SIGNAL_DTYPES,
+        "name_col": "signal_name", "value_col": "signal_value",
+        "version_table": "t_stock_signal", "version_cols": ["stock_code", "signal_name", "signal_value"],
+        "project": {"col": "signal_name",
+                    "rows": "SELECT DISTINCT trade_date, stock_code FROM t_stock_signal {where}"},
+    },
+    # 两两组合：t_stock_signal_2 视图（由 t_stock_signal 派生，版本跟随源表）
+    "pair": {
+        "kind": "pivot",
+        "sql": "SELECT trade_date, stock_code, combo_name, combo_value FROM t_stock_signal_2 {where}",
+        "dtypes": COMBO_DTYPES,
+        "name_col": "combo_name", "value_col": "combo_value",
+        "version_table": "t_stock_signal", "version_cols": ["stock_code", "signal_name", "signal_value"],
+        "project": {"col": "combo_name"},
+    },
+    # 上一交易日量价：t_stock_feat 逐股上一行（RandomForestClassifier3）
+    "lag1": {
+        "kind": "panel",
+        "sql": "SELECT trade_date, stock_code, turnover, amplitude, pct_chg FROM t_stock_feat {where}",
+        "dtypes": FEAT_DTYPES,
+        "features": [("lag", c, 1) for c in FEAT_COLS],
+        "version_table": "t_stock_feat", "version_cols": ["stock_code"] + FEAT_COLS,
+    },
+    # 量价滞后 + 滚动 + EMA（含 lag1 的三列；窗口含当日，RandomForestClassifier3 的 PRICE_SET 可切换）
+    "price_roll": {
+        "kind": "panel",
+        "sql": "SELECT trade_date, stock_code, turnover, amplitude, pct_chg FROM t_stock_feat {where}",
+        "dtypes": FEAT_DTYPES,
+        "features": [("lag", c, 1) for c in FEAT_COLS] + [
+            ("lag", "pct_chg", 2), ("lag", "pct_chg", 3),
+            ("mean", "pct_chg", 5), ("mean", "pct_chg", 10), ("std", "pct_chg", 5), ("std", "pct_chg", 10),
+            ("max", "pct_chg", 5), ("min", "pct_chg", 5),
+            ("mean", "turnover", 5), ("ema", "turnover", 10), ("mean", "amplitude", 5),
+        ],
+        "version_table": "t_stock_feat", "version_cols": ["stock_code"] + FEAT_COLS,
+    },
+    # MySQL 事件长表（ml_top_n.py / ml_lgbm.py，连接为 SQLAlchemy ENGINE）
+    "xg_event": {
+        "kind": "pivot",
+        "sql": "SELECT trade_date, stock_code, CONCAT('xg_', xg_id) AS col, val FROM t_signal_events {where}",
+        "name_col": "col", "value_col": "val",
+        "version_table": "t_signal_events", "version_cols": ["stock_code", "xg_id", "val"],
+        "project": {"col": "xg_id", "prefix": "xg_", "numeric": True,
+                    "rows": "SELECT DISTINCT trade_date, stock_code FROM t_signal_events {where}"},
+    },
+    # v1..v19 宽表（database/data_v19_dxmm.py）
+    "v19": {
+        "kind": "columns",
+        "sql": "SELECT trade_date, code AS stock_code, " + ", ".join(V19_COLS) + " FROM t_signal {where}",
+        "value_cols": V19_COLS,
+        "version_table": "t_signal", "version_cols": ["code"] + V19_COLS,
+    },
+}
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+# ===== 定义哈希 / 数据版本 =====
+def definition_hash(spec: dict) -> str:
+    text = json.dumps({"format": STORE_FORMAT, "spec": spec}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def set_dir(name: str, store_dir=STORE_DIR) -> Path:
+    return Path(store_dir) / f"{name}-{definition_hash(FEATURE_SETS[name])}"
+
+
+def columns(name: str):
+    """非 pivot 特征集的输出列名（定义顺序）；pivot 的列由数据决定，返回 None"""
+    spec = FEATURE_SETS[name]
+    if spec["kind"] == "panel":
+        return [panel.feature_name(op, c, p) for op, c, p in spec["features"]]
+    if spec["kind"] == "columns":
+        return [f"{spec.get('prefix', '')}{c}" for c in spec["value_cols"]]
+    return None
+
+
+def projected(name: str, cols) -> str:
+    """
+    登记特征集 name 在列空间 cols（列名列表或 FeatureSpace）上的投影，返回投影特征集名 <name>@<列空间指纹>
+    定义不支持投影（无 project）时原样返回 name
+    """
+    spec = FEATURE_SETS[name]
+    pc = spec.get("project")
+    if not pc or cols is None:
+        return name
+    space = cols if isinstance(cols, FeatureSpace) else FeatureSpace(cols)
+    pname = f"{name}@{space.fingerprint}"
+    if pname not in FEATURE_SETS:
+        prefix = pc.get("prefix", "")
+        vals = [c[len(prefix):] for c in space if c.startswith(prefix)]
+        if pc.get("numeric"):
+            lits = [str(int(v)) for v in vals if v.lstrip("-").isdigit()]
+        else:
+            lits = ["'" + v.replace("'", "''") + "'" for v in vals]
+        # 构建查询总带日期区间（{where} 非空），投影条件接在其后
+        cond = f"{pc['col']} IN ({', '.join(lits) or 'NULL'})"
+        FEATURE_SETS[pname] = {**{k: v for k, v in spec.items() if k != "project"},
+                               "sql": spec["sql"].replace("{where}", "{where} AND " + cond),
+                               "rows_sql": pc.get("rows"), "projection_of": name}
+    return pname
+
+
+def _label(trade_date) -> str:
+    """分区文件名中的日期：yyyymmdd 整数与 MySQL date 统一成 8 位数字"""
+    return str(trade_date).replace("-", "")[:8]
+
+
+def _py(v):
+    """numpy 标量转 Python 原生类型（sqlite3 不能绑定 np.int64）"""
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def _where(start=None, end=None, alias: str = ""):
+    start, end = _py(start), _py(end)
+    conds, params = [], {}
+    if start is not None:
+        conds.append(f"{alias}trade_date >= :s")
+        params["s"] = start
+    if end is not None:
+        conds.append(f"{alias}trade_date <= :e")
+        params["e"] = end
+    return ("WHERE " + " AND ".join(conds)) if conds else "", params
+
+
+def _read(conn, sql: str, params: dict, dtypes=None) -> pd.DataFrame:
+    """SQLite 连接走列式加载器；其余视为 SQLAlchemy Engine / Connection（MySQL）"""
+    if isinstance(conn, sqlite3.Connection):
+        return read_frame(conn, sql, params=params, dtypes=dtypes)
+    from sqlalchemy import text
+    return pd.read_sql(text(sql), conn, params=params)
+
+
+def _row_crc32(*vals):
+    return zlib.crc32("|".join("" if v is None else str(v) for v in vals).encode("utf-8"))
+
+
+def _content_expr(conn, cols) -> str:
+    """逐行内容指纹之和：SQLite 注册 row_crc32 函数，MySQL 用内置 CRC32(CONCAT_WS(...))"""
+    if isinstance(conn, sqlite3.Connection):
+        conn.create_function("row_crc32", -1, _row_crc32, deterministic=True)
+        return f"SUM(row_crc32({', '.join(cols)}))"
+    return f"SUM(CRC32(CONCAT_WS('|', {', '.join(cols)})))"
+
+
+def _lookback(spec: dict) -> int:
+    """panel 类某日的特征依赖的前序交易日数（窗口 + 余量）；其余类型为 0"""
+    return panel.lookback(spec["features"]) + LOOKBACK_PAD if spec["kind"] == "panel" else 0
+
+
+def _lookback_start(conn, spec: dict, lo):
+    """lo 之前第 _lookback(spec) 个交易日（不足时为最早一天）；没有更早的交易日时返回 lo"""
+    prev = _read(conn, f"""
+        SELECT trade_date FROM {spec['version_table']} WHERE trade_date < :s
+        GROUP BY trade_date ORDER BY trade_date DESC LIMIT {int(_lookback(spec))}
+    """, {"s": _py(lo)})
+    return lo if prev.empty else prev["trade_date"].iloc[-1]
+
+
+def versions(conn, spec: dict, start=None, end=None):
+    """
+    返回 [(trade_date, 数据版本)]，按日期升序；版本覆盖 version_cols 的全部内容，不只是行数
+    panel 类当日特征还依赖前 _lookback(spec) 个交易日（滞后 / 滚动 / EMA），这些日子的内容指纹一并计入当日版本，
+    窗口内任何一天的源数据修正都会让依赖它的分区重建
+    """
+    n_prev = _lookback(spec)
+    lo = _lookback_start(conn, spec, start) if n_prev and start is not None else start
+    where, params = _where(lo, end)
+    df = _read(conn, f"""
+        SELECT trade_date, COUNT(*) AS n, {_content_expr(conn, spec['version_cols'])} AS v
+        FROM {spec['version_table']} {where}
+        GROUP BY trade_date ORDER BY trade_date
+    """, params)
+    days = [(d, f"{int(n)}|{int(v or 0)}") for d, n, v in df.itertuples(index=False)]
+    out = []
+    for i, (d, _) in enumerate(days):
+        if start is not None and _label(d) < _label(start):
+            continue
+        fp = ";".join(f for _, f in days[max(0, i - n_prev):i + 1])
+        out.append((d, hashlib.sha1(fp.encode()).hexdigest()[:10]))
+    return out
+
+
+# ===== 构建 =====
+def _split_days(X, dates, codes, cols, prune_cols: bool):
+    """按日期切成分区：{label: (X, codes, cols)}；prune_cols 时每个分区只保留当日出现过的列"""
+    parts = {}
+    if len(dates) == 0:
+        return parts
+    uniq, starts = np.unique(dates, return_index=True)
+    bounds = list(starts) + [len(dates)]
+    for i, d in enumerate(uniq):
+        lo, hi = bounds[i], bounds[i + 1]
+        Xi = X[lo:hi]
+        pcols = list(cols)
+        if prune_cols:
+            used = np.unique(Xi.indices)
+            Xi = Xi[:, used]
+            pcols = [cols[j] for j in used]
+        parts[_label(d)] = (Xi.tocsr(), codes[lo:hi], pcols)
+    return parts
+
+
+def _dense_block(df: pd.DataFrame, value_cols, prefix: str = ""):
+    df = df.sort_values(["trade_date", "stock_code"], kind="stable")
+    X = sparse.csr_matrix(df[value_cols].fillna(0.0).to_numpy(DTYPE))
+    return X, df["trade_date"].values, df["stock_code"].values.astype(object), [f"{prefix}{c}" for c in value_cols]
+
+
+def _build(conn, spec: dict, dates):
+    """一次查询构建 dates 中各日的分区"""
+    lo, hi = min(dates), max(dates)
+    wanted = list(dates)        # 与数据查询同源同类型，可直接 isin
+    kind = spec["kind"]
+
+    if kind == "panel":
+        # 向前多读窗口所需的交易日（+ 余量），保证区间首日的滞后 / 滚动值完整
+        lo = _lookback_start(conn, spec, lo)
+
+    where, params = _where(lo, hi)
+    df = _read(conn, spec["sql"].format(where=where), params, spec.get("dtypes"))
+
+    if kind == "pivot":
+        df = df[df["trade_date"].isin(wanted)]
+        X, d, c, cols = pivot_frame(df, spec["name_col"], spec["value_col"], dtype=DTYPE)
+        if spec.get("rows_sql"):
+            # 投影特征集：行集合取源表的全部 (日, 股)（只读行键），只命中未投影列的行补为全 0 行
+            rows = _read(conn, spec["rows_sql"].format(where=where), params)
+            rows = rows[rows["trade_date"].isin(wanted)].sort_values(["trade_date", "stock_code"], kind="stable")
+            rd, rc = rows["trade_date"].values, rows["stock_code"].values.astype(object)
+            X = align_rows(X, d, c, rd, rc) if X.shape[0] else sparse.csr_matrix((len(rd), len(cols)), dtype=DTYPE)
+            d, c = rd, rc
+        return _split_days(X, d, c, cols, prune_cols=True)
+
+    value_cols, prefix = spec.get("value_cols"), spec.get("prefix", "")
+    if kind == "panel":
+        # 向量化计算（按股票排序的面板 + 段偏移），只保留目标日期、至少一个特征有值的行
+        feats = panel.compute(df, spec["features"])
+        value_cols, prefix = list(feats.columns), ""
+        keep = df["trade_date"].isin(wanted).values & feats.notna().any(axis=1).values
+        df = pd.concat([df.loc[keep, ["trade_date", "stock_code"]], feats.loc[keep]], axis=1)
+    else:
+        df = df[df["trade_date"].isin(wanted)]
+    X, d, c, cols = _dense_block(df, value_cols, prefix)
+    return _split_days(X, d, c, cols, prune_cols=False)
+
+
+# ===== 分区文件 =====
+def _save(path: Path, X, codes, cols):
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp, data=X.data, indices=X.indices, indptr=X.indptr, shape=np.array(X.shape),
+             codes=np.asarray(codes, dtype=str), cols=np.asarray(cols, dtype=str))
+    tmp.replace(path)
+
+
+def _load(path: Path):
+    with np.load(path, allow_pickle=False) as z:
+        X = sparse.csr_matrix((z["data"], z["indices"], z["indptr"]), shape=tuple(z["shape"]))
+        return X, z["codes"].astype(object), list(z["cols"])
+
+
+def _empty(n_cols: int = 0):
+    return sparse.csr_matrix((0, n_cols), dtype=DTYPE), np.empty(0, dtype=object), []
+
+
+def _concat(parts, cols=None):
+    """parts: [(trade_date, X, codes, pcols)] → 按 cols（列名列表或 FeatureSpace，默认列名并集，升序）重排后纵向拼接"""
+    if not isinstance(cols, FeatureSpace):
+        cols = FeatureSpace(cols if cols is not None else sorted(set().union(*[p[3] for p in parts])))
+    blocks, dates, codes = [], [], []
+    for d, X, c, pcols in parts:
+        blocks.append(cols.remap(X, pcols))
+        dates.append(np.repeat(np.array([d]), X.shape[0]))
+        codes.append(c)
+    if not blocks:
+        X = sparse.csr_matrix((0, len(cols)), dtype=DTYPE)
+        return X, np.empty(0), np.empty(0, dtype=object), list(cols)
+    X = sparse.vstack(blocks, format="csr")
+    X.sort_indices()
+    return X, np.concatenate(dates), np.concatenate(codes), list(cols)
+
+
+def _resolve(name: str, cols, project):
+    """投影时换成投影特征集名；非 pivot 未给 cols 时取定义中的列顺序"""
+    if project is not False and project is not None:
+        name = projected(name, cols if project is True else project)
+    if cols is None and FEATURE_SETS[name]["kind"] != "pivot":
+        cols = columns(name)    # 数值列保持定义顺序
+    return name, cols
+
+
+def _parts(conn, name: str, start, end, store_dir):
+    """
+    保证 [start, end] 的分区齐全（缺失 / 过期的现场构建并落盘），返回 [(trade_date, 分区)]，按日期升序
+    分区为本次构建的 (X, codes, cols) 或已有分区文件的路径（用到时再读）
+    """
+    spec = FEATURE_SETS[name]
+    d = set_dir(name, store_dir)
+    d.mkdir(parents=True, exist_ok=True)
+
+    vers = versions(conn, spec, start, end)
+    cached = {}
+    for f in d.glob("*.npz"):
+        label, _, ver = f.stem.partition("_")
+        cached[label] = (ver, f)
+
+    missing = [(dt, ver) for dt, ver in vers if cached.get(_label(dt), (None,))[0] != ver]
+    built = {}
+    if missing:
+        log(f"[feature_store] {name}: 命中 {len(vers) - len(missing)} 天，构建 {len(missing)} 天 ...")
+        built = _build(conn, spec, [dt for dt, _ in missing])
+        for dt, ver in missing:
+            label = _label(dt)
+            if label in cached:
+                cached[label][1].unlink(missing_ok=True)
+            part = built.get(label) or _empty()
+            built[label] = part
+            _save(d / f"{label}_{ver}.npz", *part)
+    return [(dt, built.get(_label(dt)) or cached[_label(dt)][1]) for dt, _ in vers]
+
+
+def _part(p):
+    return p if isinstance(p, tuple) else _load(p)
+
+
+def _part_cols(p):
+    """分区的列名（分区文件只读 cols 数组）"""
+    if isinstance(p, tuple):
+        return p[2]
+    with np.load(p, allow_pickle=False) as z:
+        return list(z["cols"])
+
+
+def load(conn, name: str, start=None, end=None, cols=None, store_dir=STORE_DIR, project=False):
+    """
+    读取特征集 name 在 [start, end] 的特征矩阵，缺失 / 过期分区现场构建并落盘
+    返回 (X csr, row_dates, row_codes, cols)，行按 (trade_date, stock_code) 升序
+    cols（列名列表或 FeatureSpace）给定时按该列空间输出（缺列为 0，多余列丢弃）；否则 pivot 为各分区列名并集（升序），其余为定义中的列顺序
+    project：True 时按 cols 下推列投影；也可给一个列名列表 / FeatureSpace（cols 的超集，如训练时的投影列），
+             使训练与预测共用同一个投影特征集的分区；投影后的行集合：定义了 project.rows 的（xg_event / signal）
+             与未投影时相同（只命中其他列的行为全 0 行），否则只含至少命中一个投影列的 (日, 股)
+    """
+    name, cols = _resolve(name, cols, project)
+    parts = [(dt, *_part(p)) for dt, p in _parts(conn, name, start, end, store_dir)]
+    return _concat(parts, cols)
+
+
+def iter_days(conn, name: str, start=None, end=None, cols=None, store_dir=STORE_DIR, project=False):
+    """
+    逐日读取，不拼接整段矩阵（供 feature.design.write_days 流式写盘）；参数同 load
+    返回 (cols, 迭代器)，迭代器按日期升序产出 (trade_date, X csr, row_codes)，X 已按 cols 重排
+    cols 为空时 pivot 取各分区列名并集（升序，与 load 一致），只读各分区的列名数组
+    """
+    name, cols = _resolve(name, cols, project)
+    parts = _parts(conn, name, start, end, store_dir)
+    if not isinstance(cols, FeatureSpace):
+        cols = FeatureSpace(cols if cols is not None else sorted(set().union(*[_part_cols(p) for _, p in parts])))
+
+    def days():
+        for dt, p in parts:
+            X, codes, pcols = _part(p)
+            X = cols.remap(X, pcols)
+            X.sort_indices()
+            yield dt, X, codes
+    return list(cols), days()
+
+
+def select_min_df(conn, name: str, min_df: int, start=None, end=None, fallback_top: int = 0, store_dir=STORE_DIR):
+    """
+    逐日累加各列非零数后做 min_df 列选择（同 feature.pivot.filter_min_df，但不拼接整段矩阵），返回升序列名
+    供 t_signal_freq 没有可用统计时的流式加载使用；min_df <= 1 时返回 None（不过滤）
+    """
+    if min_df <= 1:
+        return None
+    nnz = {}
+    for _, p in _parts(conn, name, start, end, store_dir):
+        X, _, pcols = _part(p)
+        for c, n in zip(pcols, np.bincount(X.indices, minlength=len(pcols))):
+            nnz[c] = nnz.get(c, 0) + int(n)
+    cols = sorted(nnz)
+    keep = [c for c in cols if nnz[c] >= min_df]
+    if not keep and fallback_top:
+        keep = sorted(sorted(cols, key=lambda c: -nnz[c])[:fallback_top])
+    return keep
+
+
+def join_days(left, right, n_right: int):
+    """
+    两个 iter_days 迭代器按日左连接：右侧当日的行按行键对齐到左侧行（缺失为 0，同 feature.pivot.align_rows），
+    拼在左侧矩阵右边；产出 (trade_date, X, row_codes)
+    """
+    right = iter(right)
+    nxt = next(right, None)
+    for dt, X, codes in left:
+        while nxt is not None and _label(nxt[0]) < _label(dt):
+            nxt = next(right, None)
+        if nxt is not None and _label(nxt[0]) == _label(dt):
+            _, R, r_codes = nxt
+            R = align_rows(R, np.repeat(np.array([dt]), len(r_codes)), r_codes,
+                           np.repeat(np.array([dt]), len(codes)), codes)
+        else:
+            R = sparse.csr_matrix((X.shape[0], n_right), dtype=DTYPE)
+        yield dt, sparse.hstack([X, R], format="csr"), codes
+
+
+# ===== 维护 =====
+def status(store_dir=STORE_DIR):
+    for name in FEATURE_SETS:
+        d = set_dir(name, store_dir)
+        files = list(d.glob("*.npz")) if d.exists() else []
+        size = sum(f.stat().st_size for f in files) / 1024 / 1024
+        span = f"[{min(f.stem[:8] for f in files)} ~ {max(f.stem[:8] for f in files)}]" if files else ""
+        log(f"{name:<9} {d.name}: {len(files)} 个分区 {size:,.1f} MB {span}")
+    # 定义已变化、不再命中的旧目录
+    live = {set_dir(n, store_dir).name for n in FEATURE_SETS}
+    for d in Path(store_dir).glob("*-*"):
+        if d.is_dir() and d.name not in live:
+            log(f"过期目录：{d.name}（python store.py clear 可清理）")
+
+
+def clear(name=None, store_dir=STORE_DIR):
+    """name 为空时只清理定义已变化的旧目录；给定 name 时清空该特征集的全部分区"""
+    live = {set_dir(n, store_dir).name for n in FEATURE_SETS}
+    for d in Path(store_dir).glob("*-*"):
+        if not d.is_dir():
+            continue
+        if (name is None and d.name not in live) or (name is not None and d.name.rsplit("-", 1)[0] == name):
+            shutil.rmtree(d)
+            log(f"已删除 {d.name}")
+
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if cmd == "build":
+        from database.partition import routed
+        names = sys.argv[2:] or ["signal", "pair", "lag1"]
+        with routed(db_path=DB_PATH) as conn:
+            for name in names:
+                X, _, _, cols = load(conn, name)
+                log(f"{name}: {X.shape[0]:,} 行 × {len(cols)} 列，非零 {X.nnz:,}")
+    elif cmd == "clear":
+        clear(sys.argv[2] if len(sys.argv) > 2 else None)
+    status()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,13 @@ import pandas as pd
 import numpy as np
 from scipy.signal import find_peaks
 
+from feature import panel
+
 # ===== 1) 趋势线：用 EMA（也可改MA/更复杂的滤波）=====
 def compute_trend(df: pd.DataFrame, span: int = 10) -> pd.DataFrame:
+    # 等价于逐股 ewm(span, adjust=False).mean()，按股票分段一次算完（feature.panel）
     out = df.copy()
-    out["trend"] = out.groupby("stock_code", group_keys=False)["close"]\
-                      .apply(lambda s: s.ewm(span=span, adjust=False).mean())
+    out["trend"] = panel.compute(out, [("ema", "close", span)])[f"ema{span}_close"]
     return out
 
 # ===== 2) 找极小值（谷底）=====
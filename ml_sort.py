@@ -6,7 +6,7 @@ from datetime import date
 from dateutil.relativedelta import relativedelta
 from sqlalchemy import create_engine, text
 from joblib import dump
-from lightgbm import LGBMRanker
+from model import backends
 from sklearn.metrics import ndcg_score
 
 # ========= 配置 =========
@@ -33,6 +33,10 @@ LGBM_PARAMS = dict(
     n_jobs=-1
 )
 
+# 模型后端（model.backends）：LambdaRank 排序；需要二分类打分时可换成 "lgbm" / "hist_gbdt"，评估与落库流程不变
+BACKEND = "lgbm_rank"
+EARLY_STOP = None               # 早停轮数（按验证集 NDCG@1）；None 不早停
+
 # ========= 工具函数 =========
 def time_split_by_date(df: pd.DataFrame, valid_ratio=0.2):
     """按交易日做时间切分：后 valid_ratio 的交易日作为验证集"""
@@ -117,15 +121,10 @@ def main():
     y_va = va["label"].values.astype(int)
     g_va = ltr_group_counts(va)
 
-    # 3) 训练 LGBMRanker（LambdaRank）
-    ranker = LGBMRanker(**LGBM_PARAMS)
-    ranker.fit(
-        X_tr, y_tr,
-        group=g_tr,
-        eval_set=[(X_va, y_va)],
-        eval_group=[g_va],
-        eval_at=[1]  # 关注@1（每天只选一只）
-    )
+    # 3) 训练（默认 LGBMRanker / LambdaRank；验证集关注 @1，每天只选一只）
+    ranker = backends.make(BACKEND, **(LGBM_PARAMS if BACKEND == "lgbm_rank" else {}))
+    rank_kw = dict(group=g_tr, group_valid=g_va) if ranker.task == "rank" else {}
+    ranker.fit(X_tr, y_tr, X_valid=X_va, y_valid=y_va, early_stop=EARLY_STOP, **rank_kw)
 
     # 4) 简单评估：NDCG@1（用 sklearn 的 ndcg_score）
     # 需要按“每天”为一个 query 拆分
@@ -135,7 +134,7 @@ def main():
         for _, day_df in df_eval.groupby("trade_date"):
             Xd = day_df[FEATURE_COLS].values
             yd = day_df["label"].values.astype(int)
-            sd = ranker.predict(Xd)
+            sd = ranker.score(Xd)
             scores.append(sd.reshape(1, -1))
             labels.append(yd.reshape(1, -1))
         if not scores:
@@ -158,13 +157,13 @@ def main():
 
     model_version = f"{MODEL_FAMILY}-{latest_day}"
     artifact_path = os.path.join(MODEL_DIR, f"{model_version}.joblib")
-    dump({"model": ranker, "features": FEATURE_COLS}, artifact_path)
+    dump({"model": ranker.model, "features": FEATURE_COLS, "backend": BACKEND}, artifact_path)
 
     model_id = register_model(
         model_version=model_version,
         train_start=earliest_day, train_end=latest_day,
         valid_start=valid_start, valid_end=valid_end,
-        params_json=LGBM_PARAMS,
+        params_json=ranker.info(),
         metrics_json=metrics,
         artifact_path=artifact_path
     )
@@ -181,7 +180,7 @@ def main():
     #                               FROM t_candidate_stocks WHERE next_ret IS NULL""".format(cols=",".join(FEATURE_COLS))), ENGINE)
 
     df_pred = df_pred.dropna(subset=FEATURE_COLS)
-    df_pred["score"] = ranker.predict(df_pred[FEATURE_COLS].values)
+    df_pred["score"] = ranker.score(df_pred[FEATURE_COLS].values)
 
     # 逐日排名
     df_pred["rank_no"] = df_pred.groupby("trade_date")["score"].rank(method="first", ascending=False).astype(int)
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+模型后端注册表：各训练脚本通过同一组 fit / predict_proba / score / importances 接口使用不同的模型实现
+- 后端：rf（sklearn 随机森林）/ gbdt（sklearn 精确分裂 GBDT）/ hist_gbdt（sklearn 直方图 GBDT，多线程）/
+        lgbm（LightGBM 二分类）/ lgbm_rank（LightGBM LambdaRank）/ l1_logistic（L1 逻辑回归）
+- 输入：稀疏 CSR、稠密 ndarray、feature.bitpack.BitMatrix 均可直接传入；
+  支持稀疏的后端收 float32 CSR（BitMatrix 展开成 CSR，uint8 等整型稀疏矩阵转成 float32），只支持稠密的后端（hist_gbdt / gbdt）收 float32 稠密矩阵
+- 早停：fit 传 X_valid / y_valid 与 early_stop（轮数）时，lgbm / lgbm_rank / hist_gbdt 按验证集早停，其余后端忽略
+- 样本权重：fit 的 sample_weight（如 model.sampling 负例降采样的校正权重）所有后端都支持
+- b.model 为未拟合 / 已拟合的 sklearn 兼容估计器，可直接交给 GridSearchCV / model.halving 或 joblib 保存
+  （lgbm 的 fit_dataset 直接在缓存的 lgb.Dataset 上训练，之后 b.model 为 Booster）
+- 切换后端 = 改脚本配置里的后端名与参数，指标计算、模型登记代码不变
+
+用法：
+    from model import backends
+    clf = backends.make("hist_gbdt", max_iter=300)
+    clf.fit(X_train, y_train, X_valid=X_va, y_valid=y_va, early_stop=50)
+    p = clf.predict_proba(X_test)[:, 1]
+    fi = clf.importance_frame(feature_cols)
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from feature import bitpack
+
+DTYPE = np.float32
+BACKENDS = {}
+
+
+def register(cls):
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def make(name: str, **params):
+    """按名称构造后端；params 覆盖该后端的默认参数"""
+    if name not in BACKENDS:
+        raise ValueError(f"未知模型后端 {name!r}，可选：{sorted(BACKENDS)}")
+    return BACKENDS[name](**params)
+
+
+def wrap(name: str, model):
+    """已拟合的估计器（如搜索得到的 best_estimator_）套回后端接口"""
+    b = BACKENDS[name].__new__(BACKENDS[name])
+    b.params, b.model = b.params_of(model), model
+    return b
+
+
+def to_input(X, sparse_ok: bool = True):
+    """统一输入格式：支持稀疏的后端得到 CSR（稠密输入保持稠密），否则得到 float32 稠密矩阵"""
+    if isinstance(X, bitpack.BitMatrix):
+        return X.to_csr(DTYPE) if sparse_ok else X.to_dense(DTYPE)
+    if sparse.issparse(X):
+        return X.tocsr().astype(DTYPE, copy=False) if sparse_ok else X.toarray().astype(DTYPE, copy=False)
+    return np.asarray(X, dtype=DTYPE)
+
+
+class Backend:
+    name = ""
+    task = "binary"             # "binary" / "rank"
+    sparse_ok = True
+    threaded = True             # 单次拟合能否用多线程（n_jobs / OpenMP），供 model.scheduler 分配核数
+    defaults = {}
+    weight_key = "sample_weight"    # fit 时样本权重的参数名（Pipeline 为 "<步骤>__sample_weight"）
+
+    def __init__(self, **params):
+        self.params = {**self.defaults, **params}
+        self.model = self.build(self.params)
+
+    def build(self, params):
+        raise NotImplementedError
+
+    @classmethod
+    def params_of(cls, model) -> dict:
+        """已拟合估计器对应的后端参数（wrap 用；与 make 的 params 同一口径）"""
+        return model.get_params(deep=False)
+
+    # ===== 训练 =====
+    def fit(self, X, y, X_valid=None, y_valid=None, group=None, group_valid=None, early_stop: int = None,
+            sample_weight=None):
+        self.model.fit(to_input(X, self.sparse_ok), np.asarray(y), **self._weight_kw(sample_weight))
+        return self
+
+    def _weight_kw(self, sample_weight) -> dict:
+        return {} if sample_weight is None else {self.weight_key: np.asarray(sample_weight, dtype=np.float64)}
+
+    def _has_valid(self, X_valid, y_valid) -> bool:
+        return X_valid is not None and X_valid.shape[0] > 0 and len(np.unique(y_valid)) > 1
+
+    # ===== 预测 =====
+    def predict_proba(self, X):
+        return self.model.predict_proba(to_input(X, self.sparse_ok))
+
+    def score(self, X) -> np.ndarray:
+        """一维打分：二分类为正类概率，排序为相关度分数"""
+        if self.task == "rank":
+            return self.model.predict(to_input(X, self.sparse_ok))
+        return self.predict_proba(X)[:, 1]
+
+    def predict(self, X):
+        return self.model.predict(to_input(X, self.sparse_ok))
+
+    # ===== 解释 / 记录 =====
+    def importances(self) -> np.ndarray:
+        raise NotImplementedError
+
+    def importance_frame(self, cols) -> pd.DataFrame:
+        return (pd.DataFrame({"feature": list(cols), "importance": self.importances()})
+                .sort_values("importance", ascending=False).reset_index(drop=True))
+
+    @property
+    def best_iteration(self):
+        return None
+
+    def info(self) -> dict:
+        """写入模型元数据的后端信息"""
+        return {"backend": self.name, "params": self.params, "best_iteration": self.best_iteration}
+
+
+@register
+class RFBackend(Backend):
+    name = "rf"
+    defaults = dict(n_estimators=500, n_jobs=-1, random_state=42, class_weight="balanced_subsample")
+
+    def build(self, params):
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(**params)
+
+    def importances(self):
+        return self.model.feature_importances_
+
+    @property
+    def best_iteration(self):
+        return self.model.n_estimators
+
+
+@register
+class GBDTBackend(Backend):
+    """sklearn GradientBoostingClassifier：单线程、精确分裂，保留作对照"""
+    name = "gbdt"
+    sparse_ok = False
+    threaded = False
+    defaults = dict(learning_rate=0.05, n_estimators=400, max_depth=3, subsample=0.9)
+
+    def build(self, params):
+        from sklearn.ensemble import GradientBoostingClassifier
+        return GradientBoostingClassifier(**params)
+
+    def importances(self):
+        return self.model.feature_importances_
+
+    @property
+    def best_iteration(self):
+        return int(self.model.n_estimators_)
+
+
+@register
+class HistGBDTBackend(Backend):
+    """sklearn HistGradientBoostingClassifier：特征分箱（0/1 特征只有两个箱）+ OpenMP 多线程"""
+    name = "hist_gbdt"
+    sparse_ok = False
+    defaults = dict(learning_rate=0.05, max_iter=400, max_leaf_nodes=31, early_stopping=False, random_state=42)
+
+    def build(self, params):
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        return HistGradientBoostingClassifier(**params)
+
+    def fit(self, X, y, X_valid=None, y_valid=None, group=None, group_valid=None, early_stop: int = None,
+            sample_weight=None):
+        X = to_input(X, False)
+        if early_stop and self._has_valid(X_valid, y_valid):
+            self.model.set_params(early_stopping=True, n_iter_no_change=int(early_stop), scoring="roc_auc")
+            self.model.fit(X, np.asarray(y), X_val=to_input(X_valid, False), y_val=np.asarray(y_valid),
+                           **self._weight_kw(sample_weight))
+        else:
+            self.model.fit(X, np.asarray(y), **self._weight_kw(sample_weight))
+        return self
+
+    def importances(self):
+        """各特征分裂增益之和（模型没有 feature_importances_，从已拟合的树节点汇总）"""
+        imp = np.zeros(self.model.n_features_in_, dtype=np.float64)
+        for it in self.model._predictors:
+            for tree in it:
+                nodes = tree.nodes
+                m = ~nodes["is_leaf"].astype(bool)
+                np.add.at(imp, nodes["feature_idx"][m], nodes["gain"][m])
+        s = imp.sum()
+        return imp / s if s > 0 else imp
+
+    @property
+    def best_iteration(self):
+        return int(self.model.n_iter_)
+
+
+@register
+class LGBMBackend(Backend):
+    name = "lgbm"
+    defaults = dict(objective="binary", learning_rate=0.05, num_leaves=64, n_estimators=2000,
+                    subsample=0.9, colsample_bytree=0.8, random_state=42, n_jobs=-1, verbose=-1)
+    eval_kw = {"eval_metric": "auc"}
+
+    def build(self, params):
+        import lightgbm as lgb
+        return lgb.LGBMClassifier(**params)
+
+    def fit(self, X, y, X_valid=None, y_valid=None, group=None, group_valid=None, early_stop: int = None,
+            sample_weight=None):
+        import lightgbm as lgb
+        kw = {} if group is None else {"group": group}
+        kw.update(self._weight_kw(sample_weight))
+        if self._has_valid(X_valid, y_valid):
+            kw.update(eval_set=[(to_input(X_valid), np.asarray(y_valid))], **self.eval_kw)
+            if group_valid is not None:
+                kw["eval_group"] = [group_valid]
+            if early_stop:
+                kw["callbacks"] = [lgb.early_stopping(stopping_rounds=int(early_stop), verbose=False)]
+        self.model.fit(to_input(X), np.asarray(y), **kw)
+        return self
+
+    def fit_dataset(self, dtrain, dvalid=None, early_stop: int = None, metric: str = "auc"):
+        """
+        在已构造（如 model.lgb_cache 从二进制读入）的 lgb.Dataset 上训练，跳过分箱；之后 self.model 为 Booster
+        分箱类参数属于 Dataset，这里从训练参数中剔除
+        """
+        import lightgbm as lgb
+        from model.lgb_cache import split_params
+        params, _ = split_params({k: v for k, v in self.params.items() if k != "class_weight"})
+        n_rounds = int(params.pop("n_estimators", 100))
+        params.setdefault("metric", metric)
+        self.evals_ = {}
+        kw, callbacks = {}, [lgb.record_evaluation(self.evals_)]
+        if dvalid is not None:
+            kw = {"valid_sets": [dvalid], "valid_names": ["valid"]}
+            if early_stop:
+                callbacks.append(lgb.early_stopping(stopping_rounds=int(early_stop), verbose=False))
+        self.model = lgb.train(params, dtrain, num_boost_round=n_rounds, callbacks=callbacks, **kw)
+        return self
+
+    def valid_score(self, metric: str = "auc"):
+        """fit_dataset 后验证集在最佳轮次上的指标"""
+        hist = getattr(self, "evals_", {}).get("valid", {}).get(metric)
+        return float(hist[self.best_iteration - 1]) if hist else None
+
+    def _is_booster(self) -> bool:
+        import lightgbm as lgb
+        return isinstance(self.model, lgb.Booster)
+
+    def _booster(self):
+        return self.model if self._is_booster() else self.model.booster_
+
+    def predict_proba(self, X):
+        if not self._is_booster():
+            return super().predict_proba(X)
+        p = self.model.predict(to_input(X), num_iteration=self.best_iteration)
+        return np.column_stack([1.0 - p, p])
+
+    def importances(self):
+        return self._booster().feature_importance(importance_type="gain")
+
+    @property
+    def best_iteration(self):
+        if self._is_booster():                          # fit_dataset（lgb.train）得到的 Booster
+            return int(self.model.best_iteration or self.model.current_iteration())
+        b = getattr(self.model, "best_iteration_", None)
+        return int(b) if b else int(self.model.n_estimators)
+
+
+@register
+class LGBMRankBackend(LGBMBackend):
+    """LambdaRank：fit 需要 group（每个查询 = 一个交易日的行数，行按交易日连续排列）"""
+    name = "lgbm_rank"
+    task = "rank"
+    defaults = dict(objective="lambdarank", metric="ndcg", learning_rate=0.05, num_leaves=63, n_estimators=2000,
+                    subsample=0.9, colsample_bytree=0.8, random_state=42, n_jobs=-1, verbose=-1)
+    eval_kw = {"eval_at": [1]}
+
+    def build(self, params):
+        import lightgbm as lgb
+        return lgb.LGBMRanker(**params)
+
+    def predict_proba(self, X):
+        raise TypeError("lgbm_rank 输出排序分数，请使用 score()")
+
+
+@register
+class L1LogisticBackend(Backend):
+    name = "l1_logistic"
+    threaded = False            # liblinear 单线程
+    defaults = dict(C=0.1, max_iter=2000, class_weight="balanced")
+    weight_key = "clf__sample_weight"
+
+    def build(self, params):
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.linear_model import LogisticRegression
+        # 0/1 特征也标准化（让 C 的尺度更合理）；with_mean=False 保持稀疏
+        return Pipeline([
+            ("scaler", StandardScaler(with_mean=False)),
+            ("clf", LogisticRegression(penalty="l1", solver="liblinear", **params)),
+        ])
+
+    @classmethod
+    def params_of(cls, model) -> dict:
+        """取 Pipeline 里 LogisticRegression 的参数（去掉 build 固定的 penalty / solver）"""
+        params = model.named_steps["clf"].get_params(deep=False)
+        return {k: v for k, v in params.items() if k not in ("penalty", "solver")}
+
+    def importances(self):
+        return np.abs(self.model.named_steps["clf"].coef_.ravel())
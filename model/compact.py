@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+随机森林压缩：训练后生成一个小模型与原模型并存，日常打分 / SHAP 读取小模型
+- prune  ：已拟合的树按 (最大深度, 最小叶子样本数) 截断（被截断节点直接变成叶子，叶子值用该节点的类分布），
+           (深度, 叶子) 在 PRUNE_GRID 中按验证集 log loss 选择（与最优相差 PRUNE_TOL 以内时取节点最少的）；
+           截断后重建 Tree 节点数组，文件真正变小
+- subset ：按验证集 log loss 前向贪心挑树（每步加入使平均概率 log loss 最小的一棵），取路径上 log loss 最小的前 k 棵
+- distill：用森林在训练行上的预测概率做软标签，训练一个小 LightGBM（cross_entropy 目标），输出概率
+- 压缩后的模型存为 <原文件名>.compact<后缀>（内容与原模型文件相同，只替换 model，另加 compact 报告），
+  同名 .compact.json 记录方法、参数、大小、节点数与验证集上压缩前后的 log loss / AUC / 准确率及差值
+- 读取：compact.load(原路径) 有压缩版时读压缩版，否则读原文件
+- 选择压缩参数用的验证集（X_val）与报告指标差值用的测试集（X_test）要分开：同一份数据上先挑后评，差值偏乐观。
+  没有独立验证窗口的脚本用 holdout_start 从训练窗口末尾按交易日切出一段（不参与森林训练）做选择，测试集只用来报告
+
+用法：
+    from model import compact
+    small, report = compact.compact(clf, X_valid, y_valid, method="prune", X_test=X_test, y_test=y_test)
+    compact.save(MODEL_PATH, {"model": clf, "feature_cols": cols}, small, report)
+    blob = compact.load(MODEL_PATH)              # 打分 / SHAP
+"""
+import io
+import copy
+import json
+import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.metrics import log_loss, roc_auc_score, accuracy_score
+
+# ===== 配置 =====
+PRUNE_GRID = {"max_depth": [8, 12, 16, 24, None], "min_leaf": [1, 5, 20, 50]}   # None = 不限深度
+PRUNE_TOL = 0.01            # 验证 log loss 不超过最优 (1 + PRUNE_TOL) 倍的候选中取节点数最少的
+SUBSET_MAX_TREES = 100      # subset 最多保留的树数
+SUBSET_ROWS = 20000         # subset 贪心挑树时使用的验证行数上限（随机抽样）
+DISTILL_ROWS = 200000       # distill 软标签训练行数上限
+DISTILL_PARAMS = dict(objective="cross_entropy", n_estimators=300, learning_rate=0.05, num_leaves=31,
+                      min_child_samples=50, subsample=0.8, subsample_freq=1, colsample_bytree=0.8,
+                      random_state=42, verbose=-1)
+HOLDOUT_FRAC = 0.1          # holdout_start：训练窗口末尾留作压缩选择集的交易日比例
+EPS = 1e-7
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+def _proba(model, X) -> np.ndarray:
+    return model.predict_proba(X)[:, 1]
+
+
+def _n_nodes(model) -> int:
+    if hasattr(model, "estimators_"):
+        return int(sum(e.tree_.node_count for e in model.estimators_))
+    if hasattr(model, "student"):
+        return int(model.student.booster_.trees_to_dataframe().shape[0])
+    return 0
+
+
+def _size(model) -> int:
+    buf = io.BytesIO()
+    joblib.dump(model, buf)
+    return buf.getbuffer().nbytes
+
+
+def _loss(y, p) -> float:
+    return float(log_loss(y, np.clip(p, EPS, 1 - EPS), labels=[0, 1]))
+
+
+# ===== prune：截断已拟合的树 =====
+def _prune_tree(est, max_depth: int, min_leaf: int):
+    """返回截断后的决策树副本：深度 >= max_depth、或任一子节点样本数 < min_leaf 的分裂节点变成叶子"""
+    from sklearn.tree._tree import Tree
+    st = est.tree_.__getstate__()
+    nodes, values = st["nodes"], st["values"]
+    left, right = nodes["left_child"], nodes["right_child"]
+    n = len(nodes)
+    internal = left >= 0
+
+    # 逐层传播深度与存活标记（节点数组为先序，层数 = 树深度，按层向量化）
+    depth = np.zeros(n, dtype=np.int64)
+    alive = np.zeros(n, dtype=bool)
+    cut = np.zeros(n, dtype=bool)
+    alive[0] = True
+    frontier = np.array([0])
+    while frontier.size:
+        inn = frontier[internal[frontier]]
+        small = np.minimum(nodes["n_node_samples"][left[inn]], nodes["n_node_samples"][right[inn]]) < min_leaf
+        cut[inn] = (depth[inn] >= max_depth) | small
+        grow = inn[~cut[inn]]
+        children = np.concatenate([left[grow], right[grow]])
+        depth[children] = depth[np.concatenate([grow, grow])] + 1
+        alive[children] = True
+        frontier = children
+
+    keep = np.flatnonzero(alive)
+    remap = np.full(n, -1, dtype=np.int64)
+    remap[keep] = np.arange(len(keep))
+    new = nodes[keep].copy()
+    leaf = ~internal[keep] | cut[keep]
+    new["left_child"] = np.where(leaf, -1, remap[np.maximum(left[keep], 0)])
+    new["right_child"] = np.where(leaf, -1, remap[np.maximum(right[keep], 0)])
+    new["feature"][leaf] = -2
+    new["threshold"][leaf] = -2.0
+
+    n_classes = np.atleast_1d(np.asarray(est.n_classes_, dtype=np.intp))
+    tree = Tree(est.tree_.n_features, n_classes, est.tree_.n_outputs)
+    tree.__setstate__({"max_depth": int(depth[keep].max()), "node_count": len(keep),
+                       "nodes": new, "values": np.ascontiguousarray(values[keep])})
+    out = copy.copy(est)
+    out.tree_ = tree
+    return out
+
+
+def prune_forest(forest, max_depth: int = None, min_leaf: int = 1):
+    max_depth = np.iinfo(np.int64).max if max_depth is None else int(max_depth)
+    out = copy.copy(forest)
+    out.estimators_ = [_prune_tree(e, max_depth, min_leaf) for e in forest.estimators_]
+    return out
+
+
+def _compact_prune(forest, X_val, y_val, grid=None, tol: float = PRUNE_TOL, **_):
+    grid = grid or PRUNE_GRID
+    cands = []              # (验证 log loss, 节点数, 深度, 叶子)
+    for d in grid["max_depth"]:
+        for m in grid["min_leaf"]:
+            cand = prune_forest(forest, d, m)
+            cands.append((_loss(y_val, _proba(cand, X_val)), _n_nodes(cand), d, m))
+    best = min(c[0] for c in cands)
+    loss, nodes, d, m = min((c for c in cands if c[0] <= best * (1 + tol)), key=lambda c: c[1])
+    return prune_forest(forest, d, m), {"max_depth": d, "min_leaf": m, "valid_logloss": loss,
+                                        "grid": [[c[2], c[3], round(c[0], 6), c[1]] for c in cands]}
+
+
+# ===== subset：前向贪心挑树 =====
+def _compact_subset(forest, X_val, y_val, max_trees: int = SUBSET_MAX_TREES, rows: int = SUBSET_ROWS, **_):
+    y_val = np.asarray(y_val)
+    if len(y_val) > rows:
+        pick = np.sort(np.random.default_rng(42).choice(len(y_val), rows, replace=False))
+        X_val, y_val = X_val[pick], y_val[pick]
+    if sparse.issparse(X_val):
+        X_val = sparse.csr_matrix(X_val, dtype=np.float32)     # 逐棵树预测前只转换一次
+    P = np.stack([e.predict_proba(X_val)[:, 1] for e in forest.estimators_])       # 树 × 行
+    k_max = min(int(max_trees), len(P))
+    chosen, S = [], np.zeros(P.shape[1])
+    avail = np.ones(len(P), dtype=bool)
+    path = []
+    for k in range(1, k_max + 1):
+        Q = np.clip((S + P) / k, EPS, 1 - EPS)
+        losses = -(y_val * np.log(Q) + (1 - y_val) * np.log(1 - Q)).mean(axis=1)
+        losses[~avail] = np.inf
+        t = int(np.argmin(losses))
+        chosen.append(t)
+        avail[t] = False
+        S += P[t]
+        path.append(float(losses[t]))
+    k_best = int(np.argmin(path)) + 1
+    out = copy.copy(forest)
+    out.estimators_ = [forest.estimators_[t] for t in chosen[:k_best]]
+    out.n_estimators = k_best
+    return out, {"n_trees": k_best, "trees": [int(t) for t in chosen[:k_best]]}
+
+
+# ===== distill：蒸馏成小 GBDT =====
+class Distilled:
+    """蒸馏得到的小模型：student 为 LGBMRegressor（cross_entropy 目标，输出即概率）；接口与分类器一致"""
+
+    def __init__(self, student, classes=(0, 1)):
+        self.student = student
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = student.n_features_in_
+
+    def predict_proba(self, X):
+        p = np.clip(self.student.predict(X), 0.0, 1.0)
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X):
+        return self.classes_[(self.predict_proba(X)[:, 1] >= 0.5).astype(int)]
+
+    @property
+    def shap_model(self):
+        """SHAP TreeExplainer 使用的树模型（输出为对数几率）"""
+        return self.student
+
+
+def _compact_distill(forest, X_val, y_val, X_fit=None, params=None, rows: int = DISTILL_ROWS, **_):
+    import lightgbm as lgb
+    if X_fit is None:
+        raise ValueError("distill 需要 X_fit（生成软标签的训练行）")
+    if X_fit.shape[0] > rows:
+        X_fit = X_fit[np.sort(np.random.default_rng(42).choice(X_fit.shape[0], rows, replace=False))]
+    params = {**DISTILL_PARAMS, **(params or {})}
+    student = lgb.LGBMRegressor(**params)
+    student.fit(X_fit, _proba(forest, X_fit), eval_set=[(X_val, _proba(forest, X_val))],
+                callbacks=[lgb.early_stopping(stopping_rounds=30, verbose=False)])
+    return Distilled(student, forest.classes_), {"params": params, "n_fit": int(X_fit.shape[0]),
+                                                 "best_iteration": int(student.best_iteration_ or params["n_estimators"])}
+
+
+METHODS = {"prune": _compact_prune, "subset": _compact_subset, "distill": _compact_distill}
+
+
+# ===== 入口 =====
+def _eval(model, X_val, y_val) -> dict:
+    p = _proba(model, X_val)
+    out = {"logloss": _loss(y_val, p), "accuracy": float(accuracy_score(y_val, (p >= 0.5).astype(int)))}
+    out["auc"] = float(roc_auc_score(y_val, p)) if 0 < np.sum(y_val) < len(y_val) else None
+    return out
+
+
+def _compare(forest, small, X, y) -> dict:
+    before, after = _eval(forest, X, y), _eval(small, X, y)
+    return {"before": before, "after": after,
+            "delta": {k: (after[k] - before[k] if before[k] is not None and after[k] is not None else None)
+                      for k in before}}
+
+
+def holdout_start(row_dates, frac: float = HOLDOUT_FRAC) -> int:
+    """行按交易日升序：末尾 frac 比例交易日的起始行号（至少留 1 个交易日；只有 1 个交易日时返回行数，即不留）"""
+    row_dates = np.asarray(row_dates)
+    days = np.unique(row_dates)
+    if len(days) < 2:
+        return len(row_dates)
+    cut = days[len(days) - max(1, int(round(len(days) * frac)))]
+    return int(np.searchsorted(row_dates, cut))
+
+
+def compact(forest, X_val, y_val, method: str = "prune", X_fit=None, X_test=None, y_test=None, **kw):
+    """
+    压缩已拟合的随机森林，返回 (小模型, 报告)
+    X_val / y_val 用于选择压缩参数（不应是森林的训练行）；给了 X_test / y_test 时，
+    报告中的压缩前后指标差值（after - before）在测试集上度量，否则在验证集上度量
+    """
+    if method not in METHODS:
+        raise ValueError(f"未知压缩方法 {method!r}，可选：{sorted(METHODS)}")
+    y_val = np.asarray(y_val)
+    small, chosen = METHODS[method](forest, X_val, y_val, X_fit=X_fit, **kw)
+    report = {
+        "method": method, "chosen": chosen,
+        "n_trees": [len(forest.estimators_), len(getattr(small, "estimators_", []))],
+        "n_nodes": [_n_nodes(forest), _n_nodes(small)],
+        "size_bytes": [_size(forest), _size(small)],
+        "valid": _compare(forest, small, X_val, y_val),
+        "n_valid": int(len(y_val)),
+    }
+    where = "验证集"
+    if X_test is not None and y_test is not None and len(y_test) > 0:
+        y_test = np.asarray(y_test)
+        report.update(test=_compare(forest, small, X_test, y_test), n_test=int(len(y_test)))
+        where = "测试集"
+    d = _delta(report)
+    log(f"[compact] {method}：{report['size_bytes'][0] / 2**20:.1f}MB → {report['size_bytes'][1] / 2**20:.1f}MB，"
+        f"节点 {report['n_nodes'][0]:,} → {report['n_nodes'][1]:,}；{where} Δlogloss={d['logloss']:+.4f} "
+        f"ΔAUC={(d['auc'] or 0):+.4f} Δacc={d['accuracy']:+.4f}（{summary(report)['chosen']}）")
+    return small, report
+
+
+def _delta(report: dict) -> dict:
+    """报告用的指标差值：有测试集时取测试集，否则取验证集"""
+    return (report.get("test") or report["valid"])["delta"]
+
+
+def summary(report: dict) -> dict:
+    """写入 t_model_meta 指标的简要版（不含候选明细 / 树编号 / 蒸馏参数）"""
+    chosen = {k: v for k, v in report["chosen"].items() if k not in ("grid", "trees", "params")}
+    return {"method": report["method"], "chosen": chosen, "size_bytes": report["size_bytes"],
+            "n_nodes": report["n_nodes"], "delta": _delta(report),
+            "delta_on": "test" if report.get("test") else "valid"}
+
+
+def compact_path(path) -> Path:
+    p = Path(path)
+    return p.with_name(f"{p.stem}.compact{p.suffix}")
+
+
+def save(path, blob: dict, small, report: dict) -> Path:
+    """压缩模型存到原模型文件旁：内容与 blob 相同，model 换成小模型，另加 compact 报告"""
+    out = compact_path(path)
+    joblib.dump({**blob, "model": small, "compact": report}, out)
+    out.with_suffix(".json").write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+    log(f"[compact] 已保存 {out}")
+    return out
+
+
+def load(path, prefer_compact: bool = True) -> dict:
+    """读模型文件；有压缩版（且 prefer_compact）时读压缩版"""
+    c = compact_path(path)
+    return joblib.load(c if prefer_compact and c.exists() else path)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+随机森林树池：按时间窗口分批训练、滚动淘汰（每日增量重训）
+- 一批 = 某个时间窗口 [start, end] 上训练的 trees_per_batch 棵树；树池 = 若干批按时间先后排列
+- 每日刷新：只在最新的窗口上（重新）训练一批树（drop_since + fit_batch），淘汰整个窗口已滑出回看期（end < before）
+  或超出 max_batches 的最旧批次，成本约为一个窗口的树数，而不是整片森林
+- forest() 把各批的树拼成一个普通 RandomForestClassifier（predict_proba 为全部树的平均，与一次性训练的用法相同）
+- 所有批次共用一个列空间（feature.space.FeatureSpace）：新窗口的矩阵必须按 pool.space 构造，列空间变化时需重建树池
+
+用法：
+    from model.forest_pool import ForestPool
+    pool = ForestPool.load(path) or ForestPool(space, RF_PARAMS, trees_per_batch=25, max_batches=18)
+    pool.fit_batch(X_new, y_new, start, end)
+    pool.retire(before=train_start)
+    pool.save(path)
+    clf = pool.forest()
+"""
+import sys
+import copy
+import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from feature.space import FeatureSpace
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+class ForestPool:
+    def __init__(self, space, params: dict, trees_per_batch: int, max_batches: int = None):
+        self.space = space if isinstance(space, FeatureSpace) else FeatureSpace(space)
+        self.params = {k: v for k, v in params.items() if k not in ("n_estimators", "warm_start")}
+        self.trees_per_batch = int(trees_per_batch)
+        self.max_batches = max_batches
+        self.batches = []           # [{"start", "end", "n_rows", "pos_rate", "forest"}]，按 end 升序
+        self.n_fitted = 0           # 累计训练过的批数（作为各批随机种子的偏移）
+
+    # ===== 状态 =====
+    @property
+    def n_trees(self) -> int:
+        return sum(len(b["forest"].estimators_) for b in self.batches)
+
+    @property
+    def last_end(self):
+        return self.batches[-1]["end"] if self.batches else None
+
+    @property
+    def first_start(self):
+        return self.batches[0]["start"] if self.batches else None
+
+    def summary(self) -> list:
+        return [{"start": str(b["start"]), "end": str(b["end"]), "n_rows": b["n_rows"],
+                 "n_trees": len(b["forest"].estimators_), "pos_rate": b["pos_rate"]} for b in self.batches]
+
+    # ===== 训练 / 淘汰 =====
+    def fit_batch(self, X, y, start, end, sample_weight=None) -> bool:
+        """在窗口 [start, end] 的 (X, y) 上训练一批树并追加；X 的列须为 self.space；单一类别的窗口跳过"""
+        y = np.asarray(y)
+        if X.shape[1] != len(self.space):
+            raise ValueError(f"窗口矩阵列数 {X.shape[1]} 与树池列空间 {len(self.space)} 不一致")
+        if len(np.unique(y)) < 2:
+            log(f"[pool] 窗口 {start}~{end} 只有一种标签，跳过")
+            return False
+        params = dict(self.params)
+        if params.get("random_state") is not None:
+            params["random_state"] = int(params["random_state"]) + self.n_fitted
+        rf = RandomForestClassifier(n_estimators=self.trees_per_batch, **params)
+        rf.fit(X, y, sample_weight=sample_weight)
+        self.batches.append({"start": start, "end": end, "n_rows": int(X.shape[0]),
+                             "pos_rate": float(y.mean()), "forest": rf})
+        self.batches.sort(key=lambda b: b["end"])
+        self.n_fitted += 1
+        log(f"[pool] 新增批次 {start}~{end}：{X.shape[0]} 行，{self.trees_per_batch} 棵树；树池共 {self.n_trees} 棵")
+        return True
+
+    def retire(self, before=None) -> list:
+        """淘汰窗口末日 < before 的批次，以及超出 max_batches 的最旧批次；返回被淘汰的批次摘要"""
+        keep = [b for b in self.batches if before is None or b["end"] >= before]
+        if self.max_batches and len(keep) > self.max_batches:
+            keep = keep[-self.max_batches:]
+        gone = [b for b in self.batches if all(b is not k for k in keep)]
+        self.batches = keep
+        for b in gone:
+            log(f"[pool] 淘汰批次 {b['start']}~{b['end']}（{len(b['forest'].estimators_)} 棵树）")
+        return [{"start": str(b["start"]), "end": str(b["end"])} for b in gone]
+
+    def drop_since(self, start) -> int:
+        """去掉窗口起点 >= start 的批次（该段数据有增补、要整批重训时），返回去掉的批数"""
+        n = len(self.batches)
+        self.batches = [b for b in self.batches if b["start"] < start]
+        return n - len(self.batches)
+
+    # ===== 组装 =====
+    def forest(self) -> RandomForestClassifier:
+        """全部批次的树拼成一个 RandomForestClassifier"""
+        if not self.batches:
+            raise RuntimeError("树池为空")
+        rf = copy.copy(self.batches[-1]["forest"])
+        rf.estimators_ = [t for b in self.batches for t in b["forest"].estimators_]
+        rf.n_estimators = len(rf.estimators_)
+        return rf
+
+    # ===== 持久化 =====
+    def save(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump({"space": self.space.to_dict(), "params": self.params, "trees_per_batch": self.trees_per_batch,
+                     "max_batches": self.max_batches, "batches": self.batches, "n_fitted": self.n_fitted}, path)
+
+    @classmethod
+    def load(cls, path):
+        """文件不存在时返回 None"""
+        if not Path(path).exists():
+            return None
+        d = joblib.load(path)
+        pool = cls(FeatureSpace.from_dict(d["space"]), d["params"], d["trees_per_batch"], d["max_batches"])
+        pool.batches, pool.n_fitted = d["batches"], d["n_fitted"]
+        return pool
+
+
+def split_windows(row_dates, n_windows: int = None, key=None):
+    """
+    按日期把行切成连续窗口，返回 [(start, end, 行掩码)]
+    key 给定时按 key(date) 相同的连续交易日分组（如按月）；否则把交易日均分成 n_windows 段
+    """
+    row_dates = np.asarray(row_dates)
+    days = np.unique(row_dates)
+    if key is not None:
+        labels = [key(d) for d in days]
+        cut = [i for i in range(len(days)) if i == 0 or labels[i] != labels[i - 1]] + [len(days)]
+        groups = [days[lo:hi] for lo, hi in zip(cut[:-1], cut[1:])]
+    else:
+        groups = [g for g in np.array_split(days, max(1, min(int(n_windows or 1), len(days)))) if len(g)]
+    return [(g[0], g[-1], (row_dates >= g[0]) & (row_dates <= g[-1])) for g in groups]
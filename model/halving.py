@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+有预算的逐次减半（successive halving）超参搜索，替代穷举 GridSearchCV
+- 折缓存 FoldCache：TimeSeriesSplit 的各折只切一次（训练 / 验证都是连续行区间，稠密矩阵切片为视图，不复制），
+  同一份折被所有候选、所有模型族共用；数据版本号 = 训练矩阵、标签与采样行 / 权重的哈希
+- 负例降采样（model.sampling）：FoldCache 建在全量训练行上，传入 keep / sample_weight 时只对各折的拟合区间采样，
+  验证区间保持全量分布（降采样的验证折会高估 average_precision），搜索后的重训同样只用 keep 行
+- 逐次减半：第 0 轮全部候选只用每折训练区间最近的 1/eta^(R-1) 行（时序上最接近验证段），
+  每轮保留前 1/eta，资源（训练行比例）乘 eta，最后一轮为全量行，与 GridSearchCV 的口径一致
+- 劣势候选提前终止：同一轮中，已跑完 PRUNE_AFTER 折且每一折都差于当前晋级线（第 n_keep 名）同折得分的候选，不再跑剩余折
+- 预算：budget_s（墙钟秒）/ budget_fits（折拟合次数，按资源比例折算）任一用尽即停止晋级，
+  取已完成的最高一轮中平均分最好的候选
+- 结果缓存：t_search_trial（SQLite）按 (模型, 参数键, 数据版本, 资源比例, 折) 记录得分，重跑时已完成的折直接复用
+
+用法：
+    from model.halving import FoldCache, HalvingSearch
+    folds = FoldCache(X_tr, y_tr, n_splits=5)                   # 或 FoldCache(X_tr, y_tr, 5, keep=keep, sample_weight=w)
+    gs = HalvingSearch(rf, rf_params, folds=folds, scoring="average_precision", budget_s=1800)
+    gs.fit(X_tr, y_tr)                          # 搜索后在全量训练集上重训最优参数
+    gs.best_params_, gs.predict_proba(X_te)
+"""
+import sys
+import json
+import math
+import time
+import hashlib
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, TimeSeriesSplit
+from scipy import sparse
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.db import DB_PATH, reader, writer
+from feature import bitpack
+
+# ===== 配置 =====
+ETA = 3                 # 每轮保留 1/ETA，资源乘 ETA
+MIN_ROWS = 2000         # 第 0 轮每折训练行数下限（行太少时提高起始资源）
+PRUNE_AFTER = 2         # 至少跑完几折才判断是否劣势
+
+TRIAL_DDL = """
+CREATE TABLE IF NOT EXISTS t_search_trial (
+    estimator TEXT,
+    params_key TEXT,
+    data_version TEXT,
+    resource REAL,
+    fold INT,
+    score REAL,
+    fit_seconds REAL,
+    params_json TEXT,
+    create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (estimator, params_key, data_version, resource, fold)
+)
+"""
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+# ===== 折缓存 =====
+def _hash_data(h, X):
+    """把矩阵内容（而不是 repr 的摘要）喂给哈希：稀疏取 data / indices / indptr，DataFrame 取列名与 .values"""
+    if sparse.issparse(X):
+        X = X.tocsr()
+        for a in (X.data, X.indices, X.indptr):
+            h.update(np.ascontiguousarray(a).data)
+    elif isinstance(X, bitpack.BitMatrix):
+        h.update(np.ascontiguousarray(X.bits).data)
+    elif isinstance(X, pd.DataFrame):
+        h.update(repr(list(X.columns)).encode())
+        h.update(np.ascontiguousarray(X.values).data)
+    else:
+        h.update(np.ascontiguousarray(X).data)
+
+
+class FoldCache:
+    """
+    TimeSeriesSplit 的各折（连续行区间），X / y 的切片在所有候选间共用
+    keep / sample_weight（可选，如 model.sampling 负例降采样的结果）：keep 为参与拟合的行号（升序），
+    sample_weight 与 keep 对齐；各折只在训练区间内按 keep 取拟合行，验证区间保持全量分布
+    """
+
+    def __init__(self, X, y, n_splits: int = 5, keep=None, sample_weight=None):
+        self.X = X
+        self.y = np.asarray(y)
+        self.n_splits = int(n_splits)
+        self.keep = None if keep is None else np.asarray(keep, dtype=np.int64)
+        self.w = None
+        if sample_weight is not None:
+            self.w = np.zeros(len(self.y), dtype=np.float64)
+            self.w[np.arange(len(self.y)) if self.keep is None else self.keep] = sample_weight
+        self.bounds = []        # [(训练末行, 验证起行, 验证末行)]，训练区间为 [0, 训练末行)
+        for tr, va in TimeSeriesSplit(n_splits=self.n_splits).split(np.empty((len(self.y), 1))):
+            self.bounds.append((int(tr[-1]) + 1, int(va[0]), int(va[-1]) + 1))
+        h = hashlib.sha1(f"{X.shape}|{getattr(X, 'dtype', '')}|{self.n_splits}".encode())
+        _hash_data(h, X)
+        h.update(np.ascontiguousarray(self.y).data)
+        for a in (self.keep, self.w):
+            h.update(b"-" if a is None else np.ascontiguousarray(a).data)
+        self.data_version = h.hexdigest()[:16]
+
+    def _fit_rows(self, lo: int, hi: int):
+        """[lo, hi) 中参与拟合的行：(X, y, 权重)；未采样时为切片视图"""
+        if self.keep is None:
+            X, y, idx = self.X[lo:hi], self.y[lo:hi], slice(lo, hi)
+        else:
+            idx = self.keep[np.searchsorted(self.keep, lo):np.searchsorted(self.keep, hi)]
+            X, y = self.X[idx], self.y[idx]
+        return X, y, None if self.w is None else self.w[idx]
+
+    def fold(self, k: int, resource: float = 1.0):
+        """第 k 折：(X_fit, y_fit, w_fit, X_val, y_val)；resource < 1 时只取训练区间最近的该比例行；w_fit 未加权时为 None"""
+        tr_end, va_lo, va_hi = self.bounds[k]
+        lo = tr_end - max(1, int(math.ceil(tr_end * resource)))
+        X_fit, y_fit, w_fit = self._fit_rows(lo, tr_end)
+        return X_fit, y_fit, w_fit, self.X[va_lo:va_hi], self.y[va_lo:va_hi]
+
+    def train(self):
+        """全部训练行（按 keep 采样）：(X, y, 权重)，供搜索后重训"""
+        return self._fit_rows(0, len(self.y))
+
+    def same_data(self, X, y) -> bool:
+        return X is self.X and len(y) == len(self.y)
+
+
+# ===== 结果缓存 =====
+def _prim(v):
+    return v if isinstance(v, (int, float, str, bool, type(None))) else type(v).__name__
+
+
+def params_key(est) -> str:
+    """估计器全部（含固定）参数的键：非基本类型的参数只取类名（如 Pipeline 中的步骤对象）"""
+    p = {k: _prim(v) for k, v in sorted(est.get_params(deep=True).items())}
+    return hashlib.sha1(json.dumps(p, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class TrialCache:
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        if db_path:
+            with writer(db_path) as conn:
+                conn.execute(TRIAL_DDL)
+
+    def get(self, name, key, version, resource):
+        """{折: 得分}"""
+        if not self.db_path:
+            return {}
+        with reader(self.db_path) as conn:
+            rows = conn.execute("SELECT fold, score FROM t_search_trial WHERE estimator=? AND params_key=? "
+                                "AND data_version=? AND resource=?", (name, key, version, round(resource, 6))).fetchall()
+        return {int(f): float(s) for f, s in rows}
+
+    def put(self, name, key, version, resource, fold, score, seconds, params):
+        if not self.db_path:
+            return
+        with writer(self.db_path) as conn:
+            conn.execute("INSERT OR REPLACE INTO t_search_trial(estimator, params_key, data_version, resource, fold, "
+                         "score, fit_seconds, params_json) VALUES (?,?,?,?,?,?,?,?)",
+                         (name, key, version, round(resource, 6), int(fold), float(score), float(seconds),
+                          json.dumps(params, default=str)))
+
+
+# ===== 搜索 =====
+class HalvingSearch:
+    """
+    接口与 GridSearchCV 的常用部分一致：fit / predict_proba / best_params_ / best_estimator_ / best_score_
+    trials_：每个 (候选, 轮) 的得分记录（DataFrame）
+    """
+
+    def __init__(self, estimator, param_grid, folds: FoldCache = None, scoring="average_precision",
+                 n_splits: int = 5, eta: int = ETA, min_rows: int = MIN_ROWS, budget_s: float = None,
+                 budget_fits: float = None, name: str = None, db_path=DB_PATH, refit: bool = True,
+                 weight_key: str = "sample_weight"):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.folds = folds
+        self.scoring = scoring
+        self.n_splits = n_splits
+        self.eta = int(eta)
+        self.min_rows = int(min_rows)
+        self.budget_s = budget_s
+        self.budget_fits = budget_fits
+        self.name = name or type(estimator).__name__
+        self.db_path = db_path
+        self.refit = refit
+        self.weight_key = weight_key    # 样本权重的 fit 参数名（Pipeline 为 "<步骤>__sample_weight"）
+
+    # ----- 单个候选在一轮上的评估 -----
+    def _run_candidate(self, params, resource, cutoff, cache):
+        est = clone(self.estimator).set_params(**params)
+        key = params_key(est)
+        done = cache.get(self.name, key, self.folds.data_version, resource)
+        scorer = get_scorer(self.scoring)
+        scores, n_fit = [], 0
+        for k in range(self.folds.n_splits):
+            if k in done:
+                scores.append(done[k])
+            else:
+                X_fit, y_fit, w_fit, X_val, y_val = self.folds.fold(k, resource)
+                t0 = time.time()
+                if len(np.unique(y_fit)) < 2:
+                    s = np.nan
+                else:
+                    m = clone(est).fit(X_fit, y_fit, **self._weight_kw(w_fit))
+                    s = float(scorer(m, X_val, y_val))
+                cache.put(self.name, key, self.folds.data_version, resource, k, s, time.time() - t0, params)
+                scores.append(s)
+                n_fit += 1
+            # 劣势：已跑的每一折都差于晋级线同折得分
+            if cutoff is not None and len(scores) >= PRUNE_AFTER and len(scores) < self.folds.n_splits:
+                if all(a < b for a, b in zip(scores, cutoff)):
+                    return scores, n_fit, True
+        return scores, n_fit, False
+
+    def _weight_kw(self, w) -> dict:
+        return {} if w is None else {self.weight_key: w}
+
+    def _over_budget(self, t0, used):
+        return ((self.budget_s is not None and time.time() - t0 >= self.budget_s) or
+                (self.budget_fits is not None and used >= self.budget_fits))
+
+    def fit(self, X, y):
+        y = np.asarray(y)
+        if self.folds is None or not self.folds.same_data(X, y):
+            self.folds = FoldCache(X, y, self.n_splits)
+        cands = list(ParameterGrid(self.param_grid))
+        n_rounds = max(1, int(math.ceil(math.log(len(cands), self.eta)))) if len(cands) > 1 else 1
+        shortest = self.folds.bounds[0][0]
+        r0 = min(1.0, max(self.eta ** -(n_rounds - 1), self.min_rows / max(shortest, 1)))
+        cache = TrialCache(self.db_path)
+        log(f"[halving] {self.name}：{len(cands)} 个候选，{n_rounds} 轮，起始资源 {r0:.3f}，"
+            f"数据版本 {self.folds.data_version}")
+
+        t0, used, records, alive = time.time(), 0.0, [], list(range(len(cands)))
+        best_round = None
+        for rnd in range(n_rounds):
+            resource = 1.0 if rnd == n_rounds - 1 else min(1.0, r0 * self.eta ** rnd)
+            n_keep = max(1, int(math.ceil(len(alive) / self.eta))) if rnd < n_rounds - 1 else 1
+            finished = []           # (平均分, 候选号, 各折得分)
+            stopped = False
+            for i in alive:
+                if self._over_budget(t0, used):
+                    stopped = True
+                    break
+                ranked = sorted(finished, key=lambda r: -r[0])
+                cutoff = ranked[n_keep - 1][2] if len(ranked) >= n_keep else None
+                scores, n_fit, pruned = self._run_candidate(cands[i], resource, cutoff, cache)
+                used += n_fit * resource
+                mean = float(np.nanmean(scores)) if not np.all(np.isnan(scores)) else -np.inf
+                records.append({"round": rnd, "resource": resource, "cand": i, "params": cands[i],
+                                "mean_score": mean, "n_folds": len(scores), "pruned": pruned})
+                if not pruned:
+                    finished.append((mean, i, scores))
+            if finished:
+                best_round = (rnd, sorted(finished, key=lambda r: -r[0]))
+            log(f"[halving] 第 {rnd} 轮 资源={resource:.3f}：跑完 {len(finished)}，"
+                f"提前终止 {sum(r['pruned'] for r in records if r['round'] == rnd)}，已用 {time.time() - t0:.0f}s")
+            if stopped or not finished:
+                log(f"[halving] 预算用尽，停在第 {rnd} 轮")
+                break
+            alive = [i for _, i, _ in sorted(finished, key=lambda r: -r[0])[:n_keep]]
+
+        if best_round is None:
+            raise RuntimeError(f"{self.name}：预算内没有候选跑完任何一轮")
+        rnd, ranked = best_round
+        self.best_score_, best_i = ranked[0][0], ranked[0][1]
+        self.best_params_ = cands[best_i]
+        self.best_round_ = rnd
+        self.trials_ = pd.DataFrame(records)
+        self.search_seconds_ = time.time() - t0
+        log(f"[halving] {self.name} 最优（第 {rnd} 轮）：{self.best_params_} score={self.best_score_:.4f}")
+        if self.refit:
+            # 与各折一致：只在 keep 行上（带权重）重训
+            X_fit, y_fit, w_fit = self.folds.train()
+            self.best_estimator_ = (clone(self.estimator).set_params(**self.best_params_)
+                                    .fit(X_fit, y_fit, **self._weight_kw(w_fit)))
+        self.folds = None           # 折缓存不随模型保存
+        return self
+
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    def decision_function(self, X):
+        return self.best_estimator_.decision_function(X)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+LightGBM 分箱后 Dataset 的二进制缓存（按 训练窗口 + 列空间 + 数据版本 + 分箱参数）
+- 命中：直接 lgb.Dataset(<train.bin>) 读入，不再取数、透视、切列、分箱；只换超参重训时立刻开始训练
+- 未命中：构造 Dataset 后 save_binary；同列空间、同分箱参数下已有较新的缓存时，以它为 reference
+  复用其分箱边界（bin mappers），新窗口（新增交易日）的数据直接装入已有的箱，不重新计算分箱；
+  reference 的窗口末日早于 REBIN_DAYS 天时重新分箱，避免分箱长期停留在旧分布上；
+  键中的列空间是取数前的候选列空间，各窗口实际列可能不同（如去掉窗口内未出现的列），
+  reference 只在实际列（meta["cols"] 的指纹）与本次完全一致时复用
+- 数据版本由调用方给出（如特征仓库各交易日分区版本 + 标签指纹），源数据补录后键随之变化；
+  训练行做了负例降采样（model.sampling）时，采样方案也要拼进数据版本，权重随 Dataset 一起缓存
+- 分箱相关参数（max_bin 等）属于 Dataset，训练参数中不能再出现（否则 LightGBM 拒绝修改已构造的 Dataset），
+  用 split_params 拆开
+
+用法：
+    from model.lgb_cache import DatasetCache
+    cache = DatasetCache(CACHE_DIR)
+    key = cache.key(train_start, valid_start, asof, space, data_version)
+    hit = cache.load(key)                                  # (dtrain, dvalid, meta) 或 None
+    if hit is None:
+        hit = cache.build(key, X_tr, y_tr, X_va, y_va, meta={"cols": cols, "train_end": asof})
+"""
+import sys
+import json
+import hashlib
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+# ===== 配置 =====
+BIN_PARAMS = dict(max_bin=255, min_data_in_bin=3, bin_construct_sample_cnt=200000,
+                  feature_pre_filter=False, verbose=-1)   # feature_pre_filter=False：min_data_in_leaf 可随超参变化
+DATASET_KEYS = {"max_bin", "max_bin_by_feature", "min_data_in_bin", "bin_construct_sample_cnt", "feature_pre_filter",
+                "use_missing", "zero_as_missing", "categorical_feature", "linear_tree", "data_random_seed"}
+REBIN_DAYS = 90         # reference 窗口末日距今超过该天数时重新分箱
+KEEP = 10               # 每个列空间保留的缓存个数
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+def split_params(params: dict):
+    """拆成 (训练参数, 分箱参数)"""
+    train = {k: v for k, v in params.items() if k not in DATASET_KEYS}
+    bins = {k: v for k, v in params.items() if k in DATASET_KEYS}
+    return train, bins
+
+
+def _cols_fp(cols) -> str:
+    return hashlib.sha1("\n".join(map(str, cols)).encode()).hexdigest()[:16]
+
+
+class DatasetCache:
+    def __init__(self, cache_dir, bin_params: dict = None, rebin_days: int = REBIN_DAYS, keep: int = KEEP):
+        self.dir = Path(cache_dir)
+        self.bin_params = dict(BIN_PARAMS if bin_params is None else bin_params)
+        self.rebin_days = rebin_days
+        self.keep = keep
+        self._bins_fp = hashlib.sha1(json.dumps(self.bin_params, sort_keys=True).encode()).hexdigest()[:8]
+
+    # ===== 键 / 路径 =====
+    def key(self, train_start, valid_start, train_end, space, data_version: str) -> str:
+        fp = space.fingerprint if hasattr(space, "fingerprint") else hashlib.sha1("\n".join(space).encode()).hexdigest()[:16]
+        win = hashlib.sha1(f"{train_start}|{valid_start}|{train_end}|{data_version}".encode()).hexdigest()[:12]
+        return f"{fp}-{self._bins_fp}-{win}"
+
+    def _paths(self, key: str):
+        return self.dir / f"{key}.train.bin", self.dir / f"{key}.valid.bin", self.dir / f"{key}.json"
+
+    # ===== 读 =====
+    def load(self, key: str):
+        """命中返回 (dtrain, dvalid, meta)，dvalid 可能为 None；否则 None"""
+        import lightgbm as lgb
+        p_tr, p_va, p_meta = self._paths(key)
+        if not (p_tr.exists() and p_meta.exists()):
+            return None
+        meta = json.loads(p_meta.read_text(encoding="utf-8"))
+        dtrain = lgb.Dataset(str(p_tr), params=self.bin_params, free_raw_data=False).construct()
+        dvalid = None
+        if p_va.exists():
+            dvalid = lgb.Dataset(str(p_va), params=self.bin_params, reference=dtrain, free_raw_data=False).construct()
+        log(f"[lgb_cache] 命中 {key}：训练 {dtrain.num_data():,} 行 × {dtrain.num_feature()} 列，跳过取数与分箱")
+        return dtrain, dvalid, meta
+
+    def reference_for(self, key: str, train_end, cols_fp: str = None):
+        """
+        同列空间、同分箱参数、窗口末日不晚于 train_end 且在 REBIN_DAYS 内的最新缓存（作为 reference）
+        cols_fp：本次实际列的指纹，只复用实际列相同的缓存
+        """
+        import lightgbm as lgb
+        prefix = key.rsplit("-", 1)[0]
+        best = None
+        for p in self.dir.glob(f"{prefix}-*.json"):
+            meta = json.loads(p.read_text(encoding="utf-8"))
+            if cols_fp is not None and meta.get("cols_fp") != cols_fp:
+                continue
+            end = pd.Timestamp(str(meta.get("train_end")))
+            if end > pd.Timestamp(str(train_end)) or (pd.Timestamp(str(train_end)) - end).days > self.rebin_days:
+                continue
+            if best is None or end > best[0]:
+                best = (end, p)
+        if best is None:
+            return None
+        ref_key = best[1].name[:-len(".json")]
+        ref = lgb.Dataset(str(self._paths(ref_key)[0]), params=self.bin_params, free_raw_data=False).construct()
+        log(f"[lgb_cache] 复用 {ref_key}（窗口末日 {best[0].date()}）的分箱边界")
+        return ref
+
+    # ===== 写 =====
+    def build(self, key: str, X_tr, y_tr, X_va=None, y_va=None, meta: dict = None, w_tr=None):
+        """
+        构造并落盘训练 / 验证 Dataset，返回 (dtrain, dvalid, meta)；meta 需含 train_end
+        w_tr：训练行的样本权重（负例降采样的校正权重），随 Dataset 一起存入二进制
+        """
+        import lightgbm as lgb
+        meta = dict(meta or {})
+        self.dir.mkdir(parents=True, exist_ok=True)
+        p_tr, p_va, p_meta = self._paths(key)
+        if meta.get("cols") is not None:
+            meta["cols_fp"] = _cols_fp(meta["cols"])
+        ref = (self.reference_for(key, meta["train_end"], meta.get("cols_fp"))
+               if meta.get("train_end") is not None else None)
+        if ref is not None and ref.num_feature() != X_tr.shape[1]:
+            log(f"[lgb_cache] reference 列数 {ref.num_feature()} 与本次 {X_tr.shape[1]} 不一致，重新分箱")
+            ref = None
+        dtrain = lgb.Dataset(X_tr, label=np.asarray(y_tr), weight=(None if w_tr is None else np.asarray(w_tr)),
+                             params=self.bin_params, reference=ref, free_raw_data=False).construct()
+        dtrain.save_binary(str(p_tr))
+        dvalid = None
+        if X_va is not None and X_va.shape[0] > 0:
+            dvalid = lgb.Dataset(X_va, label=np.asarray(y_va), params=self.bin_params, reference=dtrain,
+                                 free_raw_data=False).construct()
+            dvalid.save_binary(str(p_va))
+        meta.update(key=key, n_train=int(X_tr.shape[0]), n_valid=int(0 if X_va is None else X_va.shape[0]),
+                    binned_from=("reference" if ref is not None else "scratch"), bin_params=self.bin_params)
+        p_meta.write_text(json.dumps(meta, ensure_ascii=False, default=str), encoding="utf-8")
+        self._prune(key)
+        log(f"[lgb_cache] 已缓存 {key}：训练 {X_tr.shape[0]:,} 行（分箱：{meta['binned_from']}）")
+        return dtrain, dvalid, meta
+
+    def _prune(self, key: str):
+        """同列空间只保留最近 keep 个缓存"""
+        prefix = key.split("-", 1)[0]
+        metas = sorted(self.dir.glob(f"{prefix}-*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for p in metas[self.keep:]:
+            for f in self._paths(p.name[:-len(".json")]):
+                f.unlink(missing_ok=True)
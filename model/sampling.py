@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+按日负样本降采样 + 权重校正（大训练集）
+- 每个交易日：正例全部保留，负例按 neg_rate 独立伯努利抽样（随机种子 = (seed, 交易日)，
+  同一天无论落在哪个训练窗口抽到的行都相同，滚动重训 / Dataset 缓存的结果可复现）
+- 校正方式 weighting：
+    "weight"：保留的负例样本权重 = 1 / neg_rate，加权后的类分布与全量一致，模型输出的概率直接可用
+    "none"  ：不加权，训练更快但概率偏高；预测 / 评估时用 invert 还原：p = q / (q + (1 - q) / neg_rate)
+- 采样方案（scheme，dict）随模型写入 t_model_meta 的 params 与模型文件，评估与预测按它调用 invert
+- 只对训练集采样；验证 / 测试集保持全量分布
+
+用法：
+    from model import sampling
+    keep, w, scheme = sampling.downsample(row_dates, y_train, neg_rate=0.2)
+    clf.fit(X_train[keep], y_train[keep], sample_weight=w)
+    p = sampling.invert(clf.predict_proba(X_test)[:, 1], scheme)
+"""
+import datetime
+
+import numpy as np
+
+METHOD = "neg_downsample_per_day"
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+def _day_key(d) -> int:
+    """交易日 → 整数种子（yyyymmdd 整数 / date / Timestamp / 字符串统一成 8 位数字）"""
+    return int(str(d).replace("-", "")[:8])
+
+
+def downsample(row_dates, y, neg_rate: float, seed: int = 42, weighting: str = "weight"):
+    """
+    row_dates / y：训练行的交易日与 0/1 标签（行按日期升序，或至少同日连续）
+    返回 (keep 行号（升序）, 样本权重（与 keep 对齐）, scheme)；neg_rate >= 1 时不采样
+    """
+    y = np.asarray(y)
+    n = len(y)
+    if neg_rate >= 1.0 or n == 0:
+        return np.arange(n), np.ones(n, dtype=np.float64), None
+    if weighting not in ("weight", "none"):
+        raise ValueError(f"weighting 只能是 weight / none：{weighting}")
+    row_dates = np.asarray(row_dates)
+
+    # 同日连续行为一段，各段用 (seed, 交易日) 的随机数
+    starts = np.flatnonzero(np.r_[True, row_dates[1:] != row_dates[:-1]])
+    ends = np.r_[starts[1:], n]
+    u = np.empty(n, dtype=np.float64)
+    for lo, hi in zip(starts, ends):
+        u[lo:hi] = np.random.default_rng([int(seed), _day_key(row_dates[lo])]).random(hi - lo)
+    keep = np.flatnonzero((y != 0) | (u < neg_rate))
+
+    w = np.ones(len(keep), dtype=np.float64)
+    if weighting == "weight":
+        w[y[keep] == 0] = 1.0 / neg_rate
+    n_pos = int((y != 0).sum())
+    scheme = {"method": METHOD, "neg_rate": float(neg_rate), "weighting": weighting, "seed": int(seed),
+              "n_rows": int(n), "n_kept": int(len(keep)), "n_pos": n_pos}
+    log(f"[sampling] 负例按日采样 {neg_rate:.3f}（{weighting}）：{n:,} → {len(keep):,} 行，正例 {n_pos:,} 全部保留")
+    return keep, w, scheme
+
+
+def invert(p, scheme):
+    """把降采样训练的模型输出还原到全量分布的概率（weighting="weight" 或未采样时原样返回）"""
+    p = np.asarray(p, dtype=np.float64)
+    if not scheme or scheme.get("weighting") != "none" or scheme.get("neg_rate", 1.0) >= 1.0:
+        return p
+    r = float(scheme["neg_rate"])
+    return p / (p + (1.0 - p) / r)
+
+
+def key(neg_rate: float, weighting: str = "weight", seed: int = 42) -> str:
+    """采样配置的短标识（取数前拼进缓存键 / 数据版本；同一配置每天抽到的行相同）"""
+    if neg_rate >= 1.0:
+        return "full"
+    return f"neg{neg_rate:g}-{weighting}-s{int(seed)}"
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+多个训练任务（模型族）并发执行：共享只读数据 + 按成本估计分配核数
+- 训练 / 测试矩阵放进 multiprocessing.shared_memory 一次，各子进程按名称 attach 成 ndarray 视图（零拷贝、只读使用）
+- 核数分配 allot：每个任务至少 1 核；能多线程的任务（随机森林、直方图 GBDT、LightGBM、并行的网格搜索）
+  按成本估计的比例分剩余核数，单线程任务（精确分裂 GBDT、liblinear）只占 1 核，不浪费核
+- 任务按成本从高到低提交（最长任务最先开始），总墙钟时间约等于最慢的任务
+- 任务内的线程数：threadpool_limits 限制 BLAS / OpenMP，估计器的 n_jobs 由任务函数按分到的 threads 设置
+- 进程数为 1 时在当前进程内依次执行（不建共享内存），便于调试
+
+用法：
+    from model import scheduler
+    tasks = [{"name": "RandomForest", "cost": 30, "threaded": True, "args": {"family": "RandomForest"}}, ...]
+    results = scheduler.run(fit_family, tasks, {"X_tr": X_tr, "y_tr": y_tr}, cpu_budget=8)
+    # fit_family(arrays, threads, **args) 须为模块顶层函数；results = {任务名: 返回值}
+"""
+import os
+import time
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# ===== 配置 =====
+CPU_BUDGET = os.cpu_count() or 1
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+# ===== 共享内存 =====
+def share(arrays: dict):
+    """{名称: ndarray} → (SharedMemory 列表, 规格)；规格可传给子进程 attach"""
+    blocks, spec = [], {}
+    for name, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+        blocks.append(shm)
+        spec[name] = (shm.name, a.shape, a.dtype.str)
+    return blocks, spec
+
+
+def attach(spec: dict):
+    """规格 → ({名称: ndarray 视图}, SharedMemory 列表)；视图用完前不能关闭 SharedMemory"""
+    arrays, blocks = {}, []
+    for name, (shm_name, shape, dtype) in spec.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        blocks.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return arrays, blocks
+
+
+def release(blocks, unlink: bool = False):
+    for shm in blocks:
+        shm.close()
+        if unlink:
+            shm.unlink()
+
+
+# ===== 核数分配 =====
+def allot(tasks: list, cpu_budget: int) -> dict:
+    """{任务名: 线程数}：每个任务 1 核起步，剩余核数按成本比例分给可多线程的任务（最大余数法取整）"""
+    threads = {t["name"]: 1 for t in tasks}
+    spare = int(cpu_budget) - len(tasks)
+    multi = {t["name"]: float(t.get("cost", 1.0)) for t in tasks if t.get("threaded", True)}
+    total = sum(multi.values())
+    if spare <= 0 or not multi or total <= 0:
+        return threads
+    quota = {n: spare * c / total for n, c in multi.items()}
+    for n, q in quota.items():
+        threads[n] += int(q)
+    left = spare - sum(int(q) for q in quota.values())
+    for n in sorted(quota, key=lambda n: quota[n] - int(quota[n]), reverse=True)[:left]:
+        threads[n] += 1
+    return threads
+
+
+# ===== 执行 =====
+def _call(fn, arrays, threads: int, args: dict):
+    from threadpoolctl import threadpool_limits
+    t0 = time.time()
+    with threadpool_limits(limits=threads):
+        out = fn(arrays, threads, **args)
+    return out, time.time() - t0
+
+
+def _worker(fn, spec, threads: int, args: dict):
+    arrays, blocks = attach(spec)
+    try:
+        return _call(fn, arrays, threads, args)
+    finally:
+        del arrays
+        release(blocks)
+
+
+def run(fn, tasks: list, arrays: dict, cpu_budget: int = None, n_workers: int = None) -> dict:
+    """
+    tasks：[{"name", "cost"（相对成本）, "threaded"（能否用多线程）, "args"（传给 fn 的关键字参数）}]
+    fn(arrays, threads, **args) 在子进程中执行；arrays 为共享内存上的只读视图
+    """
+    cpu_budget = int(cpu_budget or CPU_BUDGET)
+    tasks = sorted(tasks, key=lambda t: -float(t.get("cost", 1.0)))
+    n_workers = max(1, min(n_workers or cpu_budget, len(tasks)))
+    threads = allot(tasks, cpu_budget) if n_workers > 1 else {t["name"]: cpu_budget for t in tasks}
+    log("[scheduler] " + "，".join(f"{t['name']}={threads[t['name']]}核(成本 {t.get('cost', 1.0):g})" for t in tasks)
+        + f"；{n_workers} 进程")
+
+    results, t0 = {}, time.time()
+    if n_workers == 1:
+        for t in tasks:
+            results[t["name"]], sec = _call(fn, arrays, threads[t["name"]], t.get("args", {}))
+            log(f"[scheduler] {t['name']} 完成，用时 {sec:.1f}s")
+    else:
+        blocks, spec = share(arrays)
+        try:
+            with ProcessPoolExecutor(max_workers=n_workers) as ex:
+                futs = {ex.submit(_worker, fn, spec, threads[t["name"]], t.get("args", {})): t["name"] for t in tasks}
+                for fut in as_completed(futs):
+                    results[futs[fut]], sec = fut.result()
+                    log(f"[scheduler] {futs[fut]} 完成，用时 {sec:.1f}s")
+        finally:
+            release(blocks, unlink=True)
+    log(f"[scheduler] 全部 {len(tasks)} 个任务完成，总用时 {time.time() - t0:.1f}s")
+    return results
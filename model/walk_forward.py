@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+走步（walk-forward）历史回补：一次加载、共享内存切片、进程池并行训练 / 预测各折
+- 原来的回补方式是逐交易日调用 ml_top_n.run_once(asof) / ml_lgbm.run_lgbm_from_rf(asof)，每次都从 MySQL 重读整个回看窗口
+- 这里按 [start, end] 每 step 个交易日取一个 asof，一次性读入覆盖所有折的信号矩阵与标签（行按日期升序），
+  CSR 三数组 + 行日期 + 标签放进 multiprocessing.shared_memory，各进程按日期二分得到行区间，零拷贝切出训练 / 验证 / 预测行
+- 每折与 run_once 同口径：训练 [asof - LOOKBACK_M 月, asof - VALID_LAST_M 月)，验证 [asof - VALID_LAST_M 月, asof]，预测 asof 的下一交易日
+- CPU 预算：N_WORKERS 个进程，每个进程的模型线程数 = CPU_BUDGET // N_WORKERS
+- 全部折完成后统一登记 t_model_meta（版本名带 -wf），预测一次批量 upsert 到结果表
+- 列空间为整个回补区间的列并集（rf）或 RF 入选列（lgbm）；某折之后才出现的列在该折训练行中全为 0，不会被使用
+
+用法（仓库根目录）：
+    python model/walk_forward.py rf 2023-01-01 2024-12-31 5       # 家族 起 止 步长（交易日）
+    python model/walk_forward.py lgbm 2023-01-01 2024-12-31 1
+"""
+import os
+import sys
+import time
+import datetime
+import importlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from dateutil.relativedelta import relativedelta
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from feature.space import FeatureSpace
+from model.scheduler import share, attach as share_attach, release
+
+# ===== 配置 =====
+CPU_BUDGET = os.cpu_count() or 1    # 回补可用的总核数
+N_WORKERS = None                    # 进程数；None 时为 min(CPU_BUDGET, 折数)
+SAVE_MODELS = False                 # 是否为每折保存模型文件（回补一般只要指标与预测）
+EXPORT_FLAT = True                  # 保存模型时另存扁平节点数组（<模型名>.flat.npz，model.flat_trees）
+
+FAMILIES = {
+    "rf": {"module": "ml_top_n", "name_attr": "MODEL_NAME", "params_attr": "RF_PARAMS", "table": "t_combo_pick_stock"},
+    "lgbm": {"module": "ml_lgbm", "name_attr": "MODEL_FAMILY", "params_attr": "LGBM_PARAMS", "table": "t_combo_pick_stock_lgbm"},
+}
+
+
+def log(msg: str):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+# ===== 共享内存 =====
+_S = {}     # 子进程内：共享数组视图与本次回补的参数
+
+
+def _attach(spec, cols, family, params, n_threads, save_dir):
+    _S.clear()
+    arrays, _S["_shm"] = share_attach(spec)
+    _S.update(arrays)
+    _S.update(cols=list(cols), n_cols=len(cols), family=family, params=params, n_threads=n_threads, save_dir=save_dir)
+
+
+def _rows(lo: int, hi: int) -> sparse.csr_matrix:
+    """行区间 [lo, hi) 的 CSR 视图（data / indices 直接引用共享内存）"""
+    ip = _S["indptr"]
+    a, b = int(ip[lo]), int(ip[hi])
+    return sparse.csr_matrix((_S["data"][a:b], _S["indices"][a:b], ip[lo:hi + 1] - a), shape=(hi - lo, _S["n_cols"]))
+
+
+# ===== 单折 =====
+def _fit_rf(X_tr, y_tr, X_va, y_va):
+    from sklearn.ensemble import RandomForestClassifier
+    clf = RandomForestClassifier(**{**_S["params"], "n_jobs": _S["n_threads"]})
+    clf.fit(X_tr, y_tr)
+    return clf, {}
+
+
+def _fit_lgbm(X_tr, y_tr, X_va, y_va):
+    import lightgbm as lgb
+    params, early_stop = _S["params"]
+    pos = max(1, int(y_tr.sum()))
+    neg = max(1, int(len(y_tr) - pos))
+    clf = lgb.LGBMClassifier(**{**params, "scale_pos_weight": neg / pos, "n_jobs": _S["n_threads"]})
+    if X_va.shape[0] > 0 and 0 < y_va.sum() < len(y_va):
+        clf.fit(X_tr, y_tr, eval_set=[(X_va, y_va)], eval_metric="auc",
+                callbacks=[lgb.early_stopping(stopping_rounds=early_stop, verbose=False)])
+    else:
+        clf.fit(X_tr, y_tr)
+    best = int(clf.best_iteration_) if getattr(clf, "best_iteration_", None) else clf.n_estimators
+    return clf, {"best_iteration": best, "scale_pos_weight": neg / pos}
+
+
+_FIT = {"rf": _fit_rf, "lgbm": _fit_lgbm}
+
+
+def _fold(task: dict) -> dict:
+    """task：asof / train_start / valid_start / pred_date（天数，int64）→ 指标与预测（预测行区间 + 分数）"""
+    from sklearn.metrics import roc_auc_score
+    t0 = time.time()
+    d, y = _S["days"], _S["label"]
+    a, b, c = np.searchsorted(d, [task["train_start"], task["valid_start"], task["asof"] + 1])
+    p0, p1 = np.searchsorted(d, [task["pred_date"], task["pred_date"] + 1])
+    out = {**task, "p0": int(p0), "p1": int(p1), "scores": None, "metrics": {}, "artifact_path": ""}
+    y_tr, y_va = y[a:b], y[b:c]
+    if b - a == 0 or y_tr.sum() == 0 or y_tr.sum() == len(y_tr):
+        out["skip"] = "训练窗口无正负样本"
+        return out
+
+    clf, extra = _FIT[_S["family"]](_rows(a, b), y_tr, _rows(b, c), y_va)
+    m = {"n_train": int(b - a), "n_valid": int(c - b), "pos_rate_train": float(y_tr.mean()), **extra}
+    if c > b and 0 < y_va.sum() < len(y_va):
+        m["auc"] = float(roc_auc_score(y_va, clf.predict_proba(_rows(b, c))[:, 1]))
+        m["pos_rate_valid"] = float(y_va.mean())
+    if p1 > p0:
+        out["scores"] = clf.predict_proba(_rows(p0, p1))[:, 1]
+    if _S["save_dir"]:
+        from joblib import dump
+        out["artifact_path"] = os.path.join(_S["save_dir"], f"wf-{_S['family']}-{task['asof']}.joblib")
+        space = FeatureSpace(_S["cols"])
+        dump({"model": clf, "cols": space.names, "space": space.to_dict()}, out["artifact_path"])
+        space.save_for(out["artifact_path"])
+        if EXPORT_FLAT:
+            from model import flat_trees
+            flat_trees.export(clf, out["artifact_path"], cols=space.names)
+    m["fit_seconds"] = round(time.time() - t0, 2)
+    out["metrics"] = m
+    return out
+
+
+# ===== 调度 =====
+def _day(d) -> int:
+    return int(np.datetime64(pd.Timestamp(d).date(), "D").astype(np.int64))
+
+
+def _date(n: int):
+    return (np.datetime64(int(n), "D")).astype(datetime.date)
+
+
+def trading_days(engine, start, end):
+    from sqlalchemy import text
+    df = pd.read_sql(text("SELECT trade_date FROM t_trade_calendar WHERE is_open=1 AND trade_date BETWEEN :s AND :e "
+                          "ORDER BY trade_date"), engine, params={"s": start, "e": end})
+    return [pd.Timestamp(d).date() for d in df["trade_date"]]
+
+
+def make_folds(days, start, end, step: int, lookback_m: int, valid_m: int):
+    """交易日列表 → 各折（asof 每 step 个交易日一个，预测日为其下一交易日）"""
+    folds = []
+    in_range = [i for i, d in enumerate(days) if start <= d <= end][::max(1, int(step))]
+    for i in in_range:
+        if i + 1 >= len(days):
+            break
+        asof = days[i]
+        folds.append({
+            "asof": _day(asof),
+            "train_start": _day(pd.Timestamp(asof) - relativedelta(months=lookback_m)),
+            "valid_start": _day(pd.Timestamp(asof) - relativedelta(months=valid_m)),
+            "pred_date": _day(days[i + 1]),
+        })
+    return folds
+
+
+def run(family: str, start, end, step: int = 1, cpu_budget: int = None, n_workers: int = None, rf_model_id=None):
+    fam = FAMILIES[family]
+    mod = importlib.import_module(fam["module"])
+    cpu_budget = cpu_budget or CPU_BUDGET
+    start, end = pd.Timestamp(start).date(), pd.Timestamp(end).date()
+
+    # 1) 交易日与各折
+    lo_all = (pd.Timestamp(start) - relativedelta(months=mod.LOOKBACK_M)).date()
+    days = trading_days(mod.ENGINE, lo_all, end + datetime.timedelta(days=31))
+    folds = make_folds(days, start, end, step, mod.LOOKBACK_M, mod.VALID_LAST_M)
+    if not folds:
+        log("区间内没有可回补的交易日"); return []
+    log(f"[wf] {family}：{len(folds)} 折，asof {_date(folds[0]['asof'])} ~ {_date(folds[-1]['asof'])}，步长 {step}")
+
+    # 2) 一次加载覆盖所有折的矩阵与标签
+    t0 = time.time()
+    space, params = None, getattr(mod, fam["params_attr"])
+    if family == "lgbm":
+        rf_model_id, selected = mod.get_rf_selected_cols(rf_model_id)
+        space = FeatureSpace(dict.fromkeys(selected))
+        params = (params, mod.EARLY_STOP)
+    first = min(f["train_start"] for f in folds)
+    last = max(f["pred_date"] for f in folds)
+    if family == "lgbm":
+        idx, X, cols = mod.load_signal_matrix(_date(first), _date(last), cols=space, project=mod.PROJECT_COLS)
+    else:
+        idx, X, cols = mod.load_signal_matrix(_date(first), _date(last))
+    if X is None:
+        log("回补区间无信号"); return []
+    y = mod.load_labels_for(idx).astype(np.int8)
+    X = sparse.csr_matrix(X)
+    days_arr = np.array(pd.to_datetime(idx["trade_date"]).values.astype("datetime64[D]").astype(np.int64))
+    log(f"[wf] 加载完成：{X.shape[0]:,} 行 × {X.shape[1]} 列，非零 {X.nnz:,}，用时 {time.time() - t0:.1f}s")
+
+    # 3) 共享内存 + 进程池
+    n_workers = max(1, min(n_workers or N_WORKERS or cpu_budget, len(folds)))
+    n_threads = max(1, cpu_budget // n_workers)
+    save_dir = os.path.join(mod.MODEL_DIR, "walk_forward") if SAVE_MODELS else ""
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+    blocks, spec = share({"data": X.data, "indices": X.indices, "indptr": X.indptr.astype(np.int64),
+                           "days": days_arr, "label": y})
+    del X
+    results = []
+    try:
+        init = (spec, list(cols), family, params, n_threads, save_dir)
+        t0 = time.time()
+        if n_workers == 1:
+            _attach(*init)
+            for k, f in enumerate(folds, 1):
+                results.append(_fold(f))
+                log(f"[wf] {k}/{len(folds)} asof={_date(f['asof'])} {results[-1]['metrics'].get('auc')}")
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_attach, initargs=init) as ex:
+                futs = [ex.submit(_fold, f) for f in folds]
+                for k, fut in enumerate(as_completed(futs), 1):
+                    r = fut.result()
+                    results.append(r)
+                    log(f"[wf] {k}/{len(folds)} asof={_date(r['asof'])} {r['metrics'].get('auc')}")
+        log(f"[wf] 训练完成：{n_workers} 进程 × {n_threads} 线程，用时 {time.time() - t0:.1f}s")
+    finally:
+        _S.clear()
+        release(blocks, unlink=True)
+
+    # 4) 统一登记与批量写预测
+    results.sort(key=lambda r: r["asof"])
+    name = getattr(mod, fam["name_attr"])
+    codes = idx["stock_code"].values
+    preds = []
+    for r in results:
+        if r.get("skip"):
+            log(f"[wf] asof={_date(r['asof'])} 跳过：{r['skip']}")
+            continue
+        asof, ts, vs = _date(r["asof"]), _date(r["train_start"]), _date(r["valid_start"])
+        meta = dict(model_version=f"{name}-wf-{asof}", train_start=ts, train_end=asof, valid_start=vs, valid_end=asof,
+                    features=list(cols), metrics_dict={**r["metrics"], "walk_forward": True},
+                    artifact_path=r["artifact_path"])
+        if family == "rf":
+            model_id = mod.register_model_meta(model_type="RandomForest", params_dict=getattr(mod, fam["params_attr"]), **meta)
+        else:
+            spw = meta["metrics_dict"].pop("scale_pos_weight")
+            meta["metrics_dict"]["rf_model_id"] = int(rf_model_id)
+            model_id = mod.register_model_meta(params_dict={"lgbm_params": params[0], "scale_pos_weight": spw,
+                                                            "early_stopping": params[1], "rf_model_id": int(rf_model_id)},
+                                               **meta)
+        if r["scores"] is not None:
+            preds.append(pd.DataFrame({"trade_date": _date(r["pred_date"]), "stock_code": codes[r["p0"]:r["p1"]],
+                                       "score": r["scores"], "model_id": model_id}))
+    if preds:
+        pred_df = pd.concat(preds, ignore_index=True)
+        (mod.upsert_combo_scores if family == "rf" else mod.upsert_lgbm_scores)(None, pred_df)
+        log(f"[wf] 预测写入 {fam['table']}：{len(pred_df):,} 行（{len(preds)} 个预测日）")
+    return results
+
+
+def main():
+    if len(sys.argv) < 4:
+        print(__doc__)
+        return
+    family, start, end = sys.argv[1], sys.argv[2], sys.argv[3]
+    step = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    run(family, start, end, step)
+
+
+if __name__ == "__main__":
+    main()
@@ -259,3 +259,15 @@ CREATE TABLE IF NOT EXISTS t_formula (
     market_list TEXT,                    -- 支持的市场（JSON）
     extra_json TEXT                      -- 其他原始字段（JSON存储）
 );
+
+-- 信号 / 组合频次统计（database/signal_freq.py 在导入时按月增量维护）
+CREATE TABLE IF NOT EXISTS t_signal_freq (
+    kind TEXT NOT NULL,                  -- signal / pair / triple
+    name TEXT NOT NULL,                  -- 信号名 / 组合名
+    month INTEGER NOT NULL,              -- yyyymm
+    n_hit INTEGER NOT NULL,              -- 命中行数
+    n_pos INTEGER NOT NULL,              -- 命中且 t_stock_label_1 = 1 的行数
+    first_date INTEGER,                  -- 当月首次出现
+    last_date INTEGER,                   -- 当月末次出现
+    PRIMARY KEY (kind, name, month)
+) WITHOUT ROWID;
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from feature import bitpack
+
+
+def test_rows_masks_tail_bits():
+    B = bitpack.from_dense(np.ones((16, 2), np.uint8))
+    sub = B.rows(0, 3)
+    assert sub.support().tolist() == [3, 3]
+    assert sub.hit_rate([1, 0, 1])[1].tolist() == [2, 2]
+    assert B.support().tolist() == [16, 16]         # 原矩阵不受影响
+
+
+def test_rows_matches_dense():
+    rng = np.random.default_rng(0)
+    A = (rng.random((37, 5)) < 0.4).astype(np.uint8)
+    B = bitpack.from_dense(A)
+    for lo, hi in [(0, 3), (8, 21), (3, 30), (16, 37)]:
+        sub = B.rows(lo, hi)
+        assert np.array_equal(sub.to_dense(), A[lo:hi])
+        assert sub.support().tolist() == A[lo:hi].sum(axis=0).tolist()
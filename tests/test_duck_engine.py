@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+from database import duck_engine, partition
+
+
+def test_delete_orphans_covers_history_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(partition, "HIST_DIR", tmp_path / "history")
+    partition.HIST_DIR.mkdir()
+    files = [tmp_path / "stock.db", partition.HIST_DIR / "stock_2020.db", partition.HIST_DIR / "stock_2021-2022.db"]
+    for f in files:
+        with sqlite3.connect(f) as conn:
+            conn.execute("CREATE TABLE t_stock_stat (trade_date INT, stock_code TEXT)")
+            conn.executemany("INSERT INTO t_stock_stat VALUES (20200101, ?)", [("a",), ("b",), ("a",)])
+
+    assert duck_engine.delete_orphans("t_stock_stat", ["a"], db_path=tmp_path / "stock.db") == 6
+    for f in files:
+        with sqlite3.connect(f) as conn:
+            assert conn.execute("SELECT stock_code FROM t_stock_stat").fetchall() == [("b",)]
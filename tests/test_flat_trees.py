@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+from model import flat_trees
+
+
+@pytest.fixture
+def dense():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(600, 8))
+    X[rng.random(X.shape) < 0.05] = np.nan
+    y = (np.nan_to_num(X[:, 0]) + np.nan_to_num(X[:, 1]) + 0.5 * rng.normal(size=600) > 0).astype(int)
+    return X, y
+
+
+@pytest.fixture
+def onehot():
+    rng = np.random.default_rng(1)
+    X = (rng.random((600, 30)) < 0.2).astype(np.float64)
+    y = ((X[:, 0] + X[:, 3] + rng.random(600)) > 1.2).astype(int)
+    return sparse.csr_matrix(X), y
+
+
+@pytest.mark.parametrize("model", [DecisionTreeClassifier(max_depth=6, random_state=0),
+                                   RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0)])
+def test_dense_parity_with_predict_proba(model, dense):
+    X, y = dense
+    model.fit(X, y)
+    flat = flat_trees.from_model(model)
+    assert np.allclose(flat.score(X), model.predict_proba(X)[:, 1], rtol=0, atol=1e-12)
+
+
+def test_csr_parity_binary_and_general_paths(onehot):
+    X, y = onehot
+    rf = RandomForestClassifier(n_estimators=25, random_state=0).fit(X, y)
+    flat = flat_trees.from_model(rf)
+    want = rf.predict_proba(X)[:, 1]
+    assert np.allclose(flat.score(X), want, rtol=0, atol=1e-12)             # 二值路径
+    X2 = X.copy()
+    X2.data = X2.data * 2.0
+    assert np.allclose(flat.score(X2), rf.predict_proba(X2)[:, 1], rtol=0, atol=1e-12)   # 通用路径
+
+
+def test_export_load_roundtrip(dense, tmp_path):
+    X, y = dense
+    rf = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    path = flat_trees.export(rf, tmp_path / "rf.joblib", cols=[f"c{i}" for i in range(X.shape[1])])
+    flat = flat_trees.load(path)
+    assert flat.meta["cols"][0] == "c0"
+    assert np.allclose(flat.predict_proba(X), rf.predict_proba(X), rtol=0, atol=1e-12)
+
+
+def test_lightgbm_parity(dense):
+    lgb = pytest.importorskip("lightgbm")
+    X, y = dense
+    clf = lgb.LGBMClassifier(n_estimators=30, num_leaves=15, verbose=-1).fit(X, y)
+    flat = flat_trees.from_model(clf)
+    assert np.allclose(flat.score(X), clf.predict_proba(X)[:, 1], rtol=0, atol=1e-9)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from sklearn.tree import DecisionTreeClassifier
+
+from model.halving import HalvingSearch
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(900, 5))
+    y = (X[:, 0] + 0.5 * rng.normal(size=900) > 0.8).astype(int)
+    return X, y
+
+
+def _search(**kw):
+    # 9 个候选、eta=3：两轮，第 0 轮资源 1/3（每个候选 3 折 × 1/3 = 1 次折拟合）
+    return HalvingSearch(DecisionTreeClassifier(random_state=0), {"max_depth": list(range(1, 10))},
+                         n_splits=3, eta=3, min_rows=1, db_path=None, **kw)
+
+
+def test_full_search_reaches_last_round(data):
+    gs = _search().fit(*data)
+    assert gs.best_round_ == 1
+    assert set(gs.trials_["round"]) == {0, 1}
+    assert gs.best_estimator_.get_params()["max_depth"] == gs.best_params_["max_depth"]
+
+
+def test_budget_fits_stops_and_keeps_best_finished(data):
+    gs = _search(budget_fits=2).fit(*data)
+    assert gs.best_round_ == 0
+    trials = gs.trials_
+    assert len(trials) == 2 and set(trials["cand"]) == {0, 1}
+    assert gs.best_score_ == trials["mean_score"].max()
+    assert gs.best_params_ == trials.loc[trials["mean_score"].idxmax(), "params"]
+    assert hasattr(gs, "best_estimator_")
+
+
+def test_budget_exhausted_before_any_candidate_raises(data):
+    with pytest.raises(RuntimeError):
+        _search(budget_s=0).fit(*data)
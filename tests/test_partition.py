@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+from database import partition
+
+YEARS = list(range(2010, 2025))     # 15 年，多于 MAX_HIST_FILES
+
+
+@pytest.fixture
+def hot_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(partition, "HIST_DIR", tmp_path / "history")
+    path = tmp_path / "stock.db"
+    conn = sqlite3.connect(path)
+    # t_stock_daily 与线上一样带 AUTOINCREMENT（年份文件里会有 sqlite_sequence）
+    conn.execute("CREATE TABLE t_stock_daily (id INTEGER PRIMARY KEY AUTOINCREMENT, trade_date INT, "
+                 "stock_code TEXT, close REAL)")
+    conn.execute("CREATE TABLE t_stock_signal (trade_date INT, stock_code TEXT, signal_name TEXT, "
+                 "signal_value REAL, PRIMARY KEY (trade_date, stock_code, signal_name))")
+    conn.execute("CREATE INDEX idx_daily_date ON t_stock_daily(trade_date)")
+    conn.execute("CREATE VIEW v_daily_n AS SELECT trade_date, COUNT(*) AS n FROM t_stock_daily GROUP BY trade_date")
+    for y in YEARS + [2025]:
+        for md in (105, 615, 1220):
+            d = y * 10000 + md
+            conn.executemany("INSERT INTO t_stock_daily(trade_date, stock_code, close) VALUES (?, ?, ?)",
+                             [(d, f"{c:06d}", float(c)) for c in range(3)])
+            conn.executemany("INSERT INTO t_stock_signal VALUES (?, ?, ?, 1)",
+                             [(d, f"{c:06d}", "s1") for c in range(2)])
+    conn.commit()
+    conn.close()
+    yield path
+    partition.close_routed()
+
+
+def _count(path, table, start=None, end=None):
+    """routed 只决定挂载哪些文件，日期条件仍写在 SQL 里"""
+    with partition.routed(start=start, end=end, db_path=path) as conn:
+        if start is None:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE trade_date BETWEEN ? AND ?",
+                            (start, end)).fetchone()[0]
+
+
+def test_split_consolidates_and_routes_all_rows(hot_db):
+    n_daily, n_signal = len(YEARS + [2025]) * 9, len(YEARS + [2025]) * 6
+    partition.split(db_path=hot_db, keep_year=2025)
+
+    files = partition.history_files()
+    assert len(files) <= partition.MAX_HIST_FILES
+    assert partition.history_years() == YEARS
+    assert not list(partition.HIST_DIR.glob("*.tmp"))
+
+    assert _count(hot_db, "t_stock_daily") == n_daily
+    assert _count(hot_db, "t_stock_signal") == n_signal
+    assert _count(hot_db, "t_stock_daily", 20110101, 20111231) == 9
+    assert _count(hot_db, "v_daily_n") == len(YEARS + [2025]) * 3
+    with sqlite3.connect(hot_db) as conn:           # 热库只剩当年
+        assert conn.execute("SELECT COUNT(*) FROM t_stock_daily").fetchone()[0] == 9
+
+
+def test_consolidate_merges_sequences(hot_db):
+    partition.split(db_path=hot_db, keep_year=2025)
+    partition.consolidate(3)
+    files = partition.history_files()
+    assert len(files) == 3
+    assert _count(hot_db, "t_stock_daily") == len(YEARS + [2025]) * 9
+    # 跨年文件的自增序号不小于其中最大的 id
+    _, _, first = files[0]
+    with sqlite3.connect(first) as conn:
+        max_id = conn.execute("SELECT MAX(id) FROM t_stock_daily").fetchone()[0]
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='t_stock_daily'").fetchone()[0]
+    assert seq >= max_id
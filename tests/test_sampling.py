@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from model import sampling
+
+
+def _rows(days, per_day=200, pos_rate=0.1, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = np.repeat(days, per_day)
+    y = (rng.random(len(dates)) < pos_rate).astype(int)
+    return dates, y
+
+
+def test_downsample_keeps_positives_and_is_stable_per_day():
+    days = np.arange(20240101, 20240111)
+    dates, y = _rows(days)
+    keep, w, scheme = sampling.downsample(dates, y, neg_rate=0.2, weighting="weight")
+    assert np.all(np.diff(keep) > 0)
+    assert set(np.flatnonzero(y == 1)) <= set(keep)
+    assert np.all(w[y[keep] == 0] == 5.0) and np.all(w[y[keep] == 1] == 1.0)
+    assert scheme["n_kept"] == len(keep) and scheme["n_pos"] == int(y.sum())
+
+    # 同一交易日落在另一个训练窗口里，抽到的行相同
+    lo = np.searchsorted(dates, days[4])
+    sub, _, _ = sampling.downsample(dates[lo:], y[lo:], neg_rate=0.2, weighting="weight")
+    assert np.array_equal(sub + lo, keep[keep >= lo])
+
+
+def test_downsample_full_rate_is_noop():
+    dates, y = _rows(np.arange(20240101, 20240104))
+    keep, w, scheme = sampling.downsample(dates, y, neg_rate=1.0)
+    assert np.array_equal(keep, np.arange(len(y))) and np.all(w == 1.0) and scheme is None
+
+
+def test_invert_recovers_full_distribution_probability():
+    p = np.array([0.0, 0.01, 0.1, 0.5, 0.9, 1.0])
+    r = 0.2
+    q = p / (p + (1 - p) * r)           # 负例只保留 r 时，未加权模型学到的概率
+    scheme = {"method": sampling.METHOD, "neg_rate": r, "weighting": "none"}
+    assert np.allclose(sampling.invert(q, scheme), p)
+
+
+def test_invert_is_identity_for_weighted_or_unsampled():
+    q = np.array([0.05, 0.3, 0.7])
+    assert np.array_equal(sampling.invert(q, None), q)
+    assert np.array_equal(sampling.invert(q, {"neg_rate": 0.2, "weighting": "weight"}), q)
+    assert np.array_equal(sampling.invert(q, {"neg_rate": 1.0, "weighting": "none"}), q)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import numpy as np
+import pytest
+
+from feature import store
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t_signal (code TEXT, trade_date INT, " +
+                 ", ".join(f"{c} REAL" for c in store.V19_COLS) + ")")
+    rows = [(f"{c:06d}", d) + tuple(float(i + c) for i in range(19))
+            for d in (20240102, 20240103) for c in range(3)]
+    conn.executemany(f"INSERT INTO t_signal VALUES ({', '.join('?' * 21)})", rows)
+    conn.execute("CREATE TABLE t_stock_signal (trade_date INT, stock_code TEXT, signal_name TEXT, signal_value REAL)")
+    conn.executemany("INSERT INTO t_stock_signal VALUES (?, ?, ?, 1)",
+                     [(20240102, "000001", "a"), (20240102, "000002", "b"), (20240103, "000001", "a")])
+    conn.commit()
+    return conn
+
+
+def test_columns_rebuild_after_non_first_column_edit(conn, tmp_path):
+    X, _, _, cols = store.load(conn, "v19", store_dir=tmp_path)
+    assert X[:, cols.index("v2")].toarray().ravel().tolist() == [1.0, 2.0, 3.0, 1.0, 2.0, 3.0]
+    conn.execute("UPDATE t_signal SET v2 = 100, v3 = 100 WHERE trade_date = 20240103")
+    X, _, _, cols = store.load(conn, "v19", store_dir=tmp_path)
+    assert X[:, cols.index("v2")].toarray().ravel().tolist() == [1.0, 2.0, 3.0, 100.0, 100.0, 100.0]
+    assert np.all(X[3:, cols.index("v3")].toarray() == 100)
+
+
+def test_pivot_rebuild_after_rename_with_same_count(conn, tmp_path):
+    v0 = store.versions(conn, store.FEATURE_SETS["signal"])
+    _, _, _, cols = store.load(conn, "signal", store_dir=tmp_path)
+    assert cols == ["a", "b"]
+    conn.execute("UPDATE t_stock_signal SET signal_name = 'c' WHERE signal_name = 'b'")
+    v1 = store.versions(conn, store.FEATURE_SETS["signal"])
+    assert v0[0] != v1[0] and v0[1] == v1[1]        # 只有改名的那天版本变化
+    X, dates, codes, cols = store.load(conn, "signal", store_dir=tmp_path)
+    assert cols == ["a", "c"]
+    assert X.toarray().tolist() == [[1, 0], [0, 1], [1, 0]]
+
+
+def test_panel_rebuild_after_lookback_correction(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t_stock_feat (trade_date INT, stock_code TEXT, turnover REAL, amplitude REAL, "
+                 "pct_chg REAL)")
+    days = [20240102, 20240103, 20240104, 20240105]
+    conn.executemany("INSERT INTO t_stock_feat VALUES (?, ?, ?, ?, ?)",
+                     [(d, c, 1.0, float(i), 0.5) for i, d in enumerate(days) for c in ("000001", "000002")])
+    conn.commit()
+
+    X, _, _, cols = store.load(conn, "lag1", start=20240104, end=20240105, store_dir=tmp_path)
+    j = cols.index("lag1_amplitude")
+    assert X[:, j].toarray().ravel().tolist() == [1.0, 1.0, 2.0, 2.0]
+    # 修正前一交易日的 amplitude（不是 turnover，也不在读取区间内），依赖它的 20240104 分区应重建
+    conn.execute("UPDATE t_stock_feat SET amplitude = 9 WHERE trade_date = 20240103")
+    X, _, _, cols = store.load(conn, "lag1", start=20240104, end=20240105, store_dir=tmp_path)
+    assert X[:, j].toarray().ravel().tolist() == [9.0, 9.0, 2.0, 2.0]
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
-import sqlite3
+import sys
 import pandas as pd
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.partition import routed
+
 DB_PATH = r"../stock.db"  # 修改为你的sqlite路径
 EXPORT_DIR = Path("../data")
 EXPORT_DIR.mkdir(exist_ok=True)
@@ -65,8 +68,6 @@ def export_combo_trades(conn, combo_name: str):
 
 
 def main():
-    conn = sqlite3.connect(DB_PATH)
-
     combo_list = [
         "三枪&绝对底部&趋势为王起涨",
         "绝对底部&趋势为王起涨&进攻",
@@ -91,10 +92,9 @@ def main():
 
     ]
 
-    for combo in combo_list:
-        export_combo_trades(conn, combo)
-
-    conn.close()
+    with routed(db_path=DB_PATH) as conn:
+        for combo in combo_list:
+            export_combo_trades(conn, combo)
 
 
 if __name__ == "__main__":
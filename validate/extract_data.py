@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
-import sqlite3
+import sys
 import pandas as pd
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.partition import routed
+from database import duck_engine
+
 DB_PATH = r"../stock.db"
 OUT_DIR = Path("../data")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -13,24 +17,35 @@ def log(msg):
 
 def extract_table(table_name: str, out_file: str):
     log(f"开始提取 {table_name} ...")
-    conn = sqlite3.connect(DB_PATH)
-
     # 分批读取，避免一次性内存爆炸
     chunks = []
-    for chunk in pd.read_sql(f"SELECT * FROM {table_name}", conn, chunksize=200000):
-        chunks.append(chunk)
-        log(f"已加载 {len(chunk)} 行 ...")
-
-    conn.close()
+    with routed(db_path=DB_PATH) as conn:
+        for chunk in pd.read_sql(f"SELECT * FROM {table_name}", conn, chunksize=200000):
+            chunks.append(chunk)
+            log(f"已加载 {len(chunk)} 行 ...")
 
     df = pd.concat(chunks, ignore_index=True)
     log(f"{table_name} 总行数={len(df)}，保存到 {out_file}")
     df.to_parquet(out_file, index=False)
 
+def extract_combos(level: int, out_file):
+    # 组合视图是自连接，DuckDB 直连 stock.db 时多线程计算后直接落盘
+    if duck_engine.SOURCE != "sqlite" or not duck_engine.enabled():
+        extract_table(f"t_stock_signal_{level}", out_file)
+        return
+    log(f"开始提取 t_stock_signal_{level}（DuckDB） ...")
+    df = duck_engine.signal_combos(level)
+    log(f"t_stock_signal_{level} 总行数={len(df)}，保存到 {out_file}")
+    df.to_parquet(out_file, index=False)
+
 def main():
-    extract_table("t_stock_signal_2", OUT_DIR / "signals2.parquet")
-    extract_table("t_stock_signal_3", OUT_DIR / "signals3.parquet")
+    extract_combos(2, OUT_DIR / "signals2.parquet")
+    extract_combos(3, OUT_DIR / "signals3.parquet")
     extract_table("t_stock_daily", OUT_DIR / "daily.parquet")
+    # 供 duck_engine 的 Parquet 模式使用（SOURCE="parquet"）
+    extract_table("t_stock_signal", OUT_DIR / "signal.parquet")
+    extract_table("t_stock_stat", OUT_DIR / "stat.parquet")
+    extract_table("t_stock_quote", OUT_DIR / "quote.parquet")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
-import sqlite3
+import sys
 import pandas as pd
 from pathlib import Path
 import numpy as np
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.partition import routed
+
 DB_PATH = r"../stock.db"  # ← 修改为你的 SQLite 路径
 
 
@@ -84,11 +87,10 @@ def validate_combo(conn, combo_name, hold_days=3, stop_loss=-0.03, target=0.01):
 
 
 def main():
-    conn = sqlite3.connect(DB_PATH)
-
     combo_name = "简单买点&绝对底部&进攻"  # ✅ 你要验证的组合
 
-    report = validate_combo(conn, combo_name, hold_days=3, target=0.01)
+    with routed(db_path=DB_PATH) as conn:
+        report = validate_combo(conn, combo_name, hold_days=3, target=0.01)
 
     if report:
         print("\n===== 回测报告 =====")
@@ -97,8 +99,6 @@ def main():
     else:
         print("没有得到回测结果")
 
-    conn.close()
-
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
-import sqlite3
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 import time
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.partition import routed
+from database import duck_engine
+
 DB_PATH = r"../stock.db"
 OUT_FILE = Path("../data/combo.xls")
 
@@ -66,42 +70,44 @@ def validate_combo(sig_hits, daily_df, combo_name, hold_days=3, stop_loss=-0.03,
 
 
 def main():
-    conn = sqlite3.connect(DB_PATH)
-
-    # 所有组合
-    combos = pd.read_sql("SELECT DISTINCT combo_name FROM t_combo_eval", conn)["combo_name"].tolist()
-    log(f"共 {len(combos)} 个组合需要回测验证 ...")
-
-    # 所有股票代码
-    stocks = pd.read_sql("SELECT DISTINCT stock_code FROM t_stock_daily", conn)["stock_code"].tolist()
-    log(f"共 {len(stocks)} 只股票需要处理 ...")
-
-    sig_df = pd.read_sql("SELECT stock_code, trade_date, combo_name FROM t_stock_signal_3", conn)
-
-    reports = []
-    for s_idx, stock in enumerate(stocks, start=1):
-        if s_idx % 100 == 0 or s_idx == 1 or s_idx == len(stocks):
-            log(f"[{s_idx}/{len(stocks)}] 处理股票 {stock} ...")
-
-        # 当前股票行情
-        daily_df = pd.read_sql(
-            "SELECT trade_date, open, close FROM t_stock_daily WHERE stock_code=? ORDER BY trade_date ASC",
-            conn,
-            params=(stock,)
-        )
-
-        # 当前股票的信号
-        stock_sigs = sig_df[sig_df["stock_code"] == stock]
-        if stock_sigs.empty:
-            continue
-
-        for combo_name in combos:
-            sig_hits = stock_sigs[stock_sigs["combo_name"] == combo_name]
-            if sig_hits.empty:
+    with routed(db_path=DB_PATH) as conn:
+        # 所有组合
+        combos = pd.read_sql("SELECT DISTINCT combo_name FROM t_combo_eval", conn)["combo_name"].tolist()
+        log(f"共 {len(combos)} 个组合需要回测验证 ...")
+
+        # 所有股票代码
+        stocks = pd.read_sql("SELECT DISTINCT stock_code FROM t_stock_daily", conn)["stock_code"].tolist()
+        log(f"共 {len(stocks)} 只股票需要处理 ...")
+
+        if duck_engine.enabled():
+            sig_df = duck_engine.signal_combos(3)[["stock_code", "trade_date", "combo_name"]]
+        else:
+            sig_df = pd.read_sql("SELECT stock_code, trade_date, combo_name FROM t_stock_signal_3", conn)
+
+        reports = []
+        for s_idx, stock in enumerate(stocks, start=1):
+            if s_idx % 100 == 0 or s_idx == 1 or s_idx == len(stocks):
+                log(f"[{s_idx}/{len(stocks)}] 处理股票 {stock} ...")
+
+            # 当前股票行情
+            daily_df = pd.read_sql(
+                "SELECT trade_date, open, close FROM t_stock_daily WHERE stock_code=? ORDER BY trade_date ASC",
+                conn,
+                params=(stock,)
+            )
+
+            # 当前股票的信号
+            stock_sigs = sig_df[sig_df["stock_code"] == stock]
+            if stock_sigs.empty:
                 continue
-            rep = validate_combo(sig_hits, daily_df, combo_name)
-            if rep:
-                reports.append(rep)
+
+            for combo_name in combos:
+                sig_hits = stock_sigs[stock_sigs["combo_name"] == combo_name]
+                if sig_hits.empty:
+                    continue
+                rep = validate_combo(sig_hits, daily_df, combo_name)
+                if rep:
+                    reports.append(rep)
 
     if not reports:
         log("❌ 没有结果")
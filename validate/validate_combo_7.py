@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
-import sqlite3
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm  # ✅ 进度条
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from database.partition import routed
+
 DB_PATH = r"../stock.db"
 DATA_DIR = Path("../data")
 SIGNALS2_FILE = DATA_DIR / "signals2.parquet"
@@ -137,10 +140,9 @@ def main():
     del daily  # 节省内存
 
     # === 2. 加载需要验证的组合 ===
-    conn = sqlite3.connect(DB_PATH)
-    combos = pd.read_sql("SELECT combo_type, combo_name FROM t_combo_eval", conn)
-    stat_df = pd.read_sql("SELECT stock_code, trade_date, v_0_percent FROM t_stock_stat", conn)
-    conn.close()
+    with routed(db_path=DB_PATH) as conn:
+        combos = pd.read_sql("SELECT combo_type, combo_name FROM t_combo_eval", conn)
+        stat_df = pd.read_sql("SELECT stock_code, trade_date, v_0_percent FROM t_stock_stat", conn)
 
     combos2 = combos[combos["combo_type"] == "p2"]["combo_name"].unique().tolist()
     combos3 = combos[combos["combo_type"] == "p3"]["combo_name"].unique().tolist()